@@ -0,0 +1,126 @@
+"""Columnar score index and vectorized progress analytics (shared by Streamlit app and CLI scripts)."""
+
+import warnings
+
+import numpy as np
+
+from portrait_prompts import EVALUATION_CATEGORIES
+
+
+def evaluation_to_row(evaluation, categories=EVALUATION_CATEGORIES):
+    """Category scores of one evaluation as a float row (NaN where missing)"""
+    row = np.full(len(categories), np.nan)
+    for col, category in enumerate(categories):
+        data = (evaluation or {}).get(category)
+        if isinstance(data, dict) and isinstance(data.get("score"), (int, float)):
+            row[col] = data["score"]
+    return row
+
+
+def _nanmean_rows(matrix):
+    """Row means ignoring NaN; rows without any score give 0 (like calculate_average_score)"""
+    counts = np.sum(~np.isnan(matrix), axis=1)
+    sums = np.nansum(matrix, axis=1)
+    return np.divide(sums, counts, out=np.zeros(len(matrix)), where=counts > 0)
+
+
+class ScoreIndex:
+    """Scores of a session as a dense (iterations x categories) float64 array.
+
+    Rows are appended as iterations are evaluated; storage grows geometrically
+    so appends are amortized O(1) and every statistic is one NumPy pass.
+    """
+
+    def __init__(self, categories=EVALUATION_CATEGORIES, capacity=16):
+        self.categories = list(categories)
+        self._scores = np.full((capacity, len(self.categories)), np.nan)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @classmethod
+    def from_evaluations(cls, evaluations, categories=EVALUATION_CATEGORIES):
+        index = cls(categories, capacity=max(16, len(evaluations)))
+        for evaluation in evaluations:
+            index.append(evaluation)
+        return index
+
+    def append(self, evaluation):
+        if self._size == len(self._scores):
+            grown = np.full((2 * len(self._scores), len(self.categories)), np.nan)
+            grown[:self._size] = self._scores[:self._size]
+            self._scores = grown
+        self._scores[self._size] = evaluation_to_row(evaluation, self.categories)
+        self._size += 1
+
+    @property
+    def scores(self):
+        """View of the filled rows"""
+        return self._scores[:self._size]
+
+    def averages(self):
+        """Average score per iteration"""
+        return _nanmean_rows(self.scores)
+
+    def deltas(self, baseline="previous"):
+        """Per-category change of each iteration vs the previous (or first) iteration"""
+        scores = self.scores
+        if baseline == "first":
+            return scores - scores[:1]
+        deltas = np.full_like(scores, np.nan)
+        deltas[1:] = np.diff(scores, axis=0)
+        return deltas
+
+    def trends(self):
+        """Least-squares slope per category (score points per iteration), NaN-aware"""
+        scores = self.scores
+        x = np.arange(len(scores), dtype=float)[:, None]
+        mask = ~np.isnan(scores)
+        n = mask.sum(axis=0)
+        x_mean = np.divide((x * mask).sum(axis=0), n, out=np.zeros(scores.shape[1]), where=n > 0)
+        y_mean = np.divide(np.nansum(scores, axis=0), n, out=np.zeros(scores.shape[1]), where=n > 0)
+        dx = np.where(mask, x - x_mean, 0.0)
+        dy = np.where(mask, scores - y_mean, 0.0)
+        var = (dx * dx).sum(axis=0)
+        return np.divide((dx * dy).sum(axis=0), var, out=np.full(scores.shape[1], np.nan), where=var > 0)
+
+
+def build_cohort_matrix(score_rows, categories=EVALUATION_CATEGORIES):
+    """Turns store rows (session_id, iteration_number, packed float64 scores) into arrays.
+
+    Returns (session_ids, iteration_numbers, scores) with one row per iteration.
+    """
+    if not score_rows:
+        return np.array([], dtype=object), np.array([], dtype=int), np.empty((0, len(categories)))
+    session_ids = np.array([row[0] for row in score_rows], dtype=object)
+    iteration_numbers = np.array([row[1] for row in score_rows], dtype=int)
+    scores = np.frombuffer(b"".join(row[2] for row in score_rows), dtype=np.float64)
+    return session_ids, iteration_numbers, scores.reshape(len(score_rows), len(categories))
+
+
+def cohort_statistics(session_ids, scores):
+    """Per-category stats over sessions: latest-score distribution and first→latest gain.
+
+    `session_ids`/`scores` must be grouped by session with iterations in order
+    (as returned by build_cohort_matrix).
+    """
+    n_categories = scores.shape[1]
+    if len(scores) == 0:
+        empty = np.full(n_categories, np.nan)
+        return {"sessions": 0, "mean": empty, "median": empty,
+                "p25": empty, "p75": empty, "mean_gain": empty}
+    starts = np.flatnonzero(np.r_[True, session_ids[1:] != session_ids[:-1]])
+    ends = np.r_[starts[1:], len(scores)] - 1
+    first, latest = scores[starts], scores[ends]
+    # All-NaN categories (never scored) legitimately yield NaN
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        return {
+            "sessions": len(starts),
+            "mean": np.nanmean(latest, axis=0),
+            "median": np.nanmedian(latest, axis=0),
+            "p25": np.nanpercentile(latest, 25, axis=0),
+            "p75": np.nanpercentile(latest, 75, axis=0),
+            "mean_gain": np.nanmean(latest - first, axis=0),
+        }
@@ -0,0 +1,348 @@
+"""Async HTTP JSON API for the evaluation pipeline (for clients that cannot use the Streamlit UI).
+
+Same prompts, gate and parsers as the app (portrait_pipeline's
+run_evaluation, a headless flow without the app's fallback chains, circuit
+breakers and ensembles), one process for many clients. Evaluations run as jobs
+on a bounded worker pool; clients submit an image and poll the job. Sessions live in the shared SQLite store, so a
+session started here can also be resumed in the Streamlit app and vice versa.
+
+    OPENROUTER_API_KEY=... PORTRAIT_API_TOKEN=... python portrait_api.py --port 8080 --workers 8
+
+Every endpoint except /healthz requires `Authorization: Bearer <PORTRAIT_API_TOKEN>`:
+requests spend the provider key and session IDs are the only other secret.
+The server listens on 127.0.0.1 unless --host says otherwise.
+
+Endpoints:
+    POST /v1/sessions                            -> 201 {"session_id"}
+    GET  /v1/sessions/{session_id}               -> {"session_id", "iterations": [...]}
+    POST /v1/sessions/{session_id}/evaluations   -> 202 {"job_id", "status"}
+         multipart form ("image" file, optional "settings" JSON field) or
+         JSON {"image_base64", "mime_type", "settings"}
+    GET  /v1/jobs/{job_id}                       -> {"status": queued|running|done|failed, ...}
+    GET  /healthz
+
+Clients choose language, skill level, reasoning effort and an evaluation model
+from API_EVALUATION_MODELS. Gate-related settings (single_pass_evaluation,
+single_call_prefilter, prefilter_model) and the translation model are the
+server's: PORTRAIT_API_SETTINGS='{"single_call_prefilter": true}'.
+"""
+
+import argparse
+import asyncio
+import base64
+import binascii
+import hmac
+import json
+import os
+import time
+import uuid
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from aiohttp import web
+
+from portrait_audit import configure_audit_log
+from portrait_costs import load_price_table
+from portrait_http import ImagePart
+from portrait_pipeline import (
+    DEFAULT_SETTINGS,
+    EVALUATION_DEADLINES_S,
+    DeadlineExceeded,
+    make_deadline,
+    run_evaluation,
+)
+from portrait_precheck import (
+    PRECHECK_MAX_BYTES,
+    PRECHECK_REJECT,
+    local_rejection_message,
+    precheck_image,
+)
+from portrait_prompt_compiler import compile_prompt_variants
+from portrait_prompts import AUDIENCE_COMPLEXITY, OUTPUT_LANGUAGES
+from portrait_providers import configure_providers
+from portrait_routing import MODEL_QUALITY_TIERS
+from portrait_store import DEFAULT_DB_PATH, SessionStore, new_session_id, sha256_hex
+
+# Concurrent evaluations per process (each holds a thread while its model calls run)
+API_DEFAULT_WORKERS = 8
+# Jobs waiting for a worker before new submissions get 429
+API_DEFAULT_MAX_QUEUE = 100
+# Seconds a finished job stays pollable
+API_JOB_TTL_S = 3600
+
+# Settings a client may send; everything else comes from the server's settings
+CLIENT_SETTINGS = {"standalone_model", "comparison_model", "reasoning_effort",
+                   "output_language", "skill_level", "extra_languages"}
+# Evaluation models a client may choose (the app's model options)
+API_EVALUATION_MODELS = list(MODEL_QUALITY_TIERS)
+REASONING_EFFORTS = ["xhigh", "high", "medium", "low", "minimal", "none"]
+
+JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED = "queued", "running", "done", "failed"
+
+# Reachable without the bearer token (load balancer health checks)
+PUBLIC_PATHS = {"/healthz"}
+
+
+def _json_error(status, message):
+    return web.json_response({"error": message}, status=status)
+
+
+async def _in_thread(fn, *args):
+    """Runs a blocking call (SQLite) off the event loop"""
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+def validate_settings(settings):
+    """CLIENT_SETTINGS keys only; raises ValueError for other keys or unsupported values"""
+    if not isinstance(settings, dict):
+        raise ValueError("settings must be a JSON object")
+    not_allowed = sorted(set(settings) - CLIENT_SETTINGS)
+    if not_allowed:
+        raise ValueError(f"settings not accepted from clients: {', '.join(not_allowed)}")
+    for key in ("standalone_model", "comparison_model"):
+        if key in settings and settings[key] not in API_EVALUATION_MODELS:
+            raise ValueError(f"{key} must be one of {API_EVALUATION_MODELS}")
+    if "reasoning_effort" in settings and settings["reasoning_effort"] not in REASONING_EFFORTS:
+        raise ValueError(f"reasoning_effort must be one of {REASONING_EFFORTS}")
+    if "output_language" in settings and settings["output_language"] not in OUTPUT_LANGUAGES:
+        raise ValueError(f"output_language must be one of {OUTPUT_LANGUAGES}")
+    if "skill_level" in settings and settings["skill_level"] not in AUDIENCE_COMPLEXITY:
+        raise ValueError(f"skill_level must be one of {list(AUDIENCE_COMPLEXITY)}")
+    if "extra_languages" in settings and (not isinstance(settings["extra_languages"], list)
+                                          or not set(settings["extra_languages"]) <= set(OUTPUT_LANGUAGES)):
+        raise ValueError(f"extra_languages must be a list drawn from {OUTPUT_LANGUAGES}")
+    return settings
+
+
+class EvaluationService:
+    """Job table, worker pool and per-session ordering around run_evaluation()"""
+
+    def __init__(self, api_key, store, workers=API_DEFAULT_WORKERS, max_queue=API_DEFAULT_MAX_QUEUE,
+                 prices=None, deadlines=None, settings=None):
+        self.api_key = api_key
+        self.store = store
+        self.settings = {**DEFAULT_SETTINGS, **(settings or {})}
+        self.max_queue = max_queue
+        self.prices = prices
+        self.deadlines = {**EVALUATION_DEADLINES_S, **(deadlines or {})}
+        self.compiled_prompts = compile_prompt_variants()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="evaluation")
+        self.jobs = {}
+        # Only sessions with a job queued or running hold a lock (dropped when the last job ends)
+        self._session_locks = weakref.WeakValueDictionary()
+        # The event loop keeps only weak references to tasks; these keep running jobs alive
+        self._tasks = set()
+        self._waiting = 0
+
+    def _purge_jobs(self):
+        cutoff = time.time() - API_JOB_TTL_S
+        for job_id in [job_id for job_id, job in self.jobs.items()
+                       if job.get("finished_at") and job["finished_at"] < cutoff]:
+            del self.jobs[job_id]
+
+    def submit(self, session_id, image_bytes, mime_type, settings):
+        """Queues an evaluation; returns the job dict, or None if the queue is full"""
+        self._purge_jobs()
+        if self._waiting >= self.max_queue:
+            return None
+        job = {"job_id": uuid.uuid4().hex, "session_id": session_id, "status": JOB_QUEUED,
+               "created_at": time.time()}
+        self.jobs[job["job_id"]] = job
+        self._waiting += 1
+        task = asyncio.get_running_loop().create_task(self._run(job, image_bytes, mime_type, settings))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(self, job, image_bytes, mime_type, settings):
+        # Jobs of one session run in submission order: comparisons need the previous iteration
+        lock = self._session_locks.get(job["session_id"])
+        if lock is None:
+            lock = self._session_locks[job["session_id"]] = asyncio.Lock()
+        try:
+            async with lock:
+                job["status"] = JOB_RUNNING
+                job["started_at"] = time.time()
+                self._waiting -= 1
+                loop = asyncio.get_running_loop()
+                job["result"] = await loop.run_in_executor(
+                    self.executor, self.evaluate, job["session_id"], image_bytes, mime_type, settings)
+                job["status"] = JOB_DONE
+        except (DeadlineExceeded, requests.exceptions.Timeout) as e:
+            job.update(status=JOB_FAILED, error=f"timeout: {e}")
+        except requests.exceptions.RequestException as e:
+            job.update(status=JOB_FAILED, error=f"provider error: {e}")
+        except Exception as e:
+            job.update(status=JOB_FAILED, error=f"{type(e).__name__}: {e}")
+        finally:
+            if job.get("started_at") is None:
+                self._waiting -= 1
+            job["finished_at"] = time.time()
+
+    def _history(self, session_id):
+        """Earlier iterations of the session, with images of the first and latest (the only ones compared)"""
+        history = self.store.list_iterations(session_id)
+        for index in {0, len(history) - 1} if history else ():
+            image_bytes, mime_type = self.store.load_image(history[index]["image_sha256"])
+            history[index].update(image_bytes=image_bytes, mime_type=mime_type)
+        return history
+
+    def evaluate(self, session_id, image_bytes, mime_type, settings):
+        """Worker thread: local check, pipeline run and persistence of an accepted iteration"""
+        settings = {**self.settings, **settings}
+        local_check = precheck_image(image_bytes)
+        if local_check["verdict"] == PRECHECK_REJECT:
+            return {"status": "rejected", "calls": [], "cost": None,
+                    "message": local_rejection_message(local_check, settings["output_language"]),
+                    "prefilter": {"local_check": local_check["reason"]}}
+
+        history = self._history(session_id)
+        mode = "comparison" if history else "standalone"
+        result = run_evaluation(
+            self.api_key, ImagePart(image_bytes, mime_type), history, settings,
+            deadline=make_deadline(self.deadlines[mode]), prices=self.prices,
+            compiled_prompts=self.compiled_prompts)
+        if result["status"] == "evaluated":
+            self.store.ensure_session(session_id, {
+                "output_language": settings["output_language"],
+                "skill_level": settings["skill_level"],
+            })
+            image_sha = sha256_hex(image_bytes)
+            result["iteration_number"] = self.store.append_iteration(session_id, {
+                **result,
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "image_name": f"api-upload-{image_sha[:12]}",
+                "image_sha256": image_sha,
+                "phash": local_check["phash"],
+            }, image_bytes, mime_type)
+        return result
+
+
+async def create_session(request):
+    service = request.app["service"]
+    session_id = new_session_id()
+    await _in_thread(service.store.ensure_session, session_id)
+    return web.json_response({"session_id": session_id}, status=201)
+
+
+async def get_session(request):
+    service = request.app["service"]
+    session_id = request.match_info["session_id"]
+    if not await _in_thread(service.store.session_exists, session_id):
+        return _json_error(404, "session not found")
+    return web.json_response({"session_id": session_id,
+                              "iterations": await _in_thread(service.store.list_iterations, session_id)})
+
+
+async def submit_evaluation(request):
+    service = request.app["service"]
+    session_id = request.match_info["session_id"]
+    if not await _in_thread(service.store.session_exists, session_id):
+        return _json_error(404, "session not found")
+
+    try:
+        if request.content_type.startswith("multipart/"):
+            form = await request.post()
+            upload = form.get("image")
+            if upload is None or not hasattr(upload, "file"):
+                return _json_error(400, "multipart field 'image' (file) is required")
+            image_bytes = upload.file.read()
+            mime_type = upload.content_type or "image/jpeg"
+            settings = json.loads(form.get("settings") or "{}")
+        else:
+            body = await request.json()
+            image_bytes = base64.b64decode(body["image_base64"], validate=True)
+            mime_type = body.get("mime_type", "image/jpeg")
+            settings = body.get("settings") or {}
+        settings = validate_settings(settings)
+    except (KeyError, TypeError, ValueError, binascii.Error) as e:
+        return _json_error(400, f"invalid request: {e}")
+
+    job = service.submit(session_id, image_bytes, mime_type, settings)
+    if job is None:
+        return web.json_response({"error": "too many queued evaluations"}, status=429,
+                                 headers={"Retry-After": "5"})
+    return web.json_response({"job_id": job["job_id"], "status": job["status"]}, status=202,
+                             headers={"Location": f"/v1/jobs/{job['job_id']}"})
+
+
+async def get_job(request):
+    job = request.app["service"].jobs.get(request.match_info["job_id"])
+    if job is None:
+        return _json_error(404, "job not found")
+    return web.json_response(job)
+
+
+async def healthz(request):
+    service = request.app["service"]
+    return web.json_response({"ok": True, "queued": service._waiting, "jobs": len(service.jobs)})
+
+
+def bearer_auth(token):
+    """Middleware rejecting requests without `Authorization: Bearer <token>` (401)"""
+    expected = f"Bearer {token}".encode("utf-8")
+
+    @web.middleware
+    async def middleware(request, handler):
+        if request.path not in PUBLIC_PATHS and not hmac.compare_digest(
+                request.headers.get("Authorization", "").encode("utf-8"), expected):
+            return web.json_response({"error": "missing or invalid bearer token"}, status=401,
+                                     headers={"WWW-Authenticate": "Bearer"})
+        return await handler(request)
+
+    return middleware
+
+
+def create_app(service, token):
+    if not token:
+        raise ValueError("an API token is required")
+    app = web.Application(client_max_size=PRECHECK_MAX_BYTES * 2, middlewares=[bearer_auth(token)])
+    app["service"] = service
+    app.add_routes([
+        web.post("/v1/sessions", create_session),
+        web.get("/v1/sessions/{session_id}", get_session),
+        web.post("/v1/sessions/{session_id}/evaluations", submit_evaluation),
+        web.get("/v1/jobs/{job_id}", get_job),
+        web.get("/healthz", healthz),
+    ])
+    app.on_cleanup.append(lambda app: _shutdown(service))
+    return app
+
+
+async def _shutdown(service):
+    service.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Portrait evaluation HTTP API")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="interface to listen on (0.0.0.0 exposes the API to the network)")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int,
+                        default=int(os.environ.get("PORTRAIT_API_WORKERS", API_DEFAULT_WORKERS)))
+    parser.add_argument("--max-queue", type=int,
+                        default=int(os.environ.get("PORTRAIT_API_MAX_QUEUE", API_DEFAULT_MAX_QUEUE)))
+    parser.add_argument("--db", default=os.environ.get("PORTRAIT_SESSION_DB", DEFAULT_DB_PATH))
+    args = parser.parse_args()
+
+    api_key = os.environ.get("OPENROUTER_API_KEY") or os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        parser.error("set OPENROUTER_API_KEY (or OPENAI_API_KEY)")
+    token = os.environ.get("PORTRAIT_API_TOKEN")
+    if not token:
+        parser.error("set PORTRAIT_API_TOKEN (clients send it as a bearer token)")
+    prices = load_price_table(json.loads(os.environ.get("PORTRAIT_MODEL_PRICES", "{}")))
+    configure_providers(json.loads(os.environ.get("PORTRAIT_PROVIDERS", "{}")))
+    configure_audit_log(os.environ.get("PORTRAIT_AUDIT_LOG_DIR"))
+    server_settings = json.loads(os.environ.get("PORTRAIT_API_SETTINGS", "{}"))
+    unknown = sorted(set(server_settings) - set(DEFAULT_SETTINGS))
+    if unknown:
+        parser.error(f"PORTRAIT_API_SETTINGS: unknown settings {', '.join(unknown)}")
+    service = EvaluationService(api_key, SessionStore(args.db), args.workers, args.max_queue, prices,
+                                settings=server_settings)
+    web.run_app(create_app(service, token), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Compressed session archives for moving sessions between machines (shared by Streamlit app and CLI scripts).
+
+An archive is JSON Lines, gzip- or zstd-compressed: a header line (format,
+version, settings) followed by one line per iteration with everything needed
+to resume comparison mode without calling a model — evaluation, raw/parsed
+response, prompt, call ledger and, optionally, the image itself. zstd needs
+the `zstandard` package; gzip always works.
+"""
+
+import base64
+import binascii
+import gzip
+import io
+import json
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:  # zstd archives are optional; gzip is always available
+    zstandard = None
+
+ARCHIVE_FORMAT = "portrait-session"
+ARCHIVE_VERSION = 1
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# Compression -> file extension (only those usable in this environment)
+ARCHIVE_COMPRESSIONS = {"gzip": ".jsonl.gz"}
+if zstandard is not None:
+    ARCHIVE_COMPRESSIONS["zstd"] = ".jsonl.zst"
+
+
+def _json_line(item):
+    return (json.dumps(item, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def make_archive_header(session_id, settings=None, total_iterations=None):
+    return {
+        "format": ARCHIVE_FORMAT,
+        "version": ARCHIVE_VERSION,
+        "session_id": session_id,
+        "exported_at": datetime.now().isoformat(),
+        "settings": settings or {},
+        "total_iterations": total_iterations,
+    }
+
+
+def make_archive_record(iteration, details=None, image_bytes=None, mime_type=None):
+    """One iteration line: light fields, heavy `details`, and the image (if given) as base64"""
+    record = {key: value for key, value in iteration.items()
+              if key not in ("image_base64", "image_bytes")}
+    record.update(details or {})
+    if image_bytes is not None:
+        record["image"] = {"mime_type": mime_type or "image/jpeg",
+                           "data": base64.b64encode(image_bytes).decode("ascii")}
+    return record
+
+
+def write_session_archive(header, records, compression="gzip"):
+    """Compresses the header and `records` (any iterable, consumed lazily) into archive bytes"""
+    if compression not in ARCHIVE_COMPRESSIONS:
+        raise ValueError(f"Unsupported archive compression: {compression}")
+    buffer = io.BytesIO()
+    if compression == "zstd":
+        writer = zstandard.ZstdCompressor(level=6).stream_writer(buffer, closefd=False)
+    else:
+        writer = gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=6, mtime=0)
+    with writer:
+        writer.write(_json_line(header))
+        for record in records:
+            writer.write(_json_line(record))
+    return buffer.getvalue()
+
+
+def _open_archive(data):
+    """Decompressing binary stream over archive bytes (format detected from magic bytes)"""
+    raw = io.BytesIO(data)
+    if data[:2] == GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=raw, mode="rb")
+    if data[:4] == ZSTD_MAGIC:
+        if zstandard is None:
+            raise ValueError("This archive is zstd-compressed; install `zstandard` to import it")
+        return zstandard.ZstdDecompressor().stream_reader(raw)
+    return raw  # Uncompressed JSON Lines
+
+
+def _check_record(record):
+    """Validates one iteration line and decodes its image; raises ValueError if malformed"""
+    if not isinstance(record, dict):
+        raise ValueError("record is not an object")
+    number = record.get("iteration_number")
+    if number is not None and (not isinstance(number, int) or isinstance(number, bool)):
+        raise ValueError("iteration_number is not an integer")
+    for key in ("evaluation", "parsed_response", "translations", "prefilter", "cost"):
+        if record.get(key) is not None and not isinstance(record[key], dict):
+            raise ValueError(f"{key} is not an object")
+    if record.get("calls") is not None and not isinstance(record["calls"], list):
+        raise ValueError("calls is not a list")
+    for key in ("raw_response", "system_prompt", "timestamp", "image_name", "output_language"):
+        if record.get(key) is not None and not isinstance(record[key], str):
+            raise ValueError(f"{key} is not a string")
+    image = record.get("image")
+    if image is not None:
+        if not isinstance(image, dict):
+            raise ValueError("image is not an object")
+        if not isinstance(image.get("mime_type"), str) or not image["mime_type"].startswith("image/"):
+            raise ValueError("image.mime_type is missing or not an image type")
+        if not isinstance(image.get("data"), str):
+            raise ValueError("image.data is missing or not a base64 string")
+        try:
+            image["data"] = base64.b64decode(image["data"], validate=True)
+        except binascii.Error as e:
+            raise ValueError(f"image.data is not valid base64 ({e})") from e
+    return record
+
+
+def read_session_archive(data):
+    """Returns (header, records) from archive bytes; records carry images as bytes.
+
+    Raises ValueError if the data is not a session archive of a supported version,
+    or if an iteration line is malformed (wrong field types, image without a
+    mime_type or valid base64 data).
+    """
+    records = []
+    with io.TextIOWrapper(_open_archive(data), encoding="utf-8") as lines:
+        try:
+            header = json.loads(next(lines, "") or "null")
+        except (json.JSONDecodeError, OSError, EOFError) as e:
+            raise ValueError(f"Not a session archive: {e}") from e
+        if not isinstance(header, dict) or header.get("format") != ARCHIVE_FORMAT:
+            raise ValueError("Not a session archive")
+        version = header.get("version", 0)
+        if not isinstance(version, int) or isinstance(version, bool):
+            raise ValueError(f"Invalid archive version {version!r}")
+        if version > ARCHIVE_VERSION:
+            raise ValueError(f"Archive version {version} is newer than supported ({ARCHIVE_VERSION})")
+        try:
+            line_number = 1
+            for line_number, line in enumerate(lines, start=2):
+                if not line.strip():
+                    continue
+                records.append(_check_record(json.loads(line)))
+        except (json.JSONDecodeError, OSError, EOFError, ValueError) as e:
+            raise ValueError(f"Corrupt session archive (line {line_number}): {e}") from e
+    return header, records
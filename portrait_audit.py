@@ -0,0 +1,151 @@
+"""Append-only audit log of every model API exchange (shared by Streamlit app and CLI scripts).
+
+call_openai_api hands each exchange (request payload, response, status,
+timing) to audit_event(), which only enqueues it. One background thread
+batches queued records, strips image data and appends them as JSON Lines to
+rotating files, so the request path never waits on disk I/O. When the queue is
+full, records are dropped and counted rather than blocking a call.
+
+Off unless configured: `audit_log_dir` in Streamlit secrets, or
+PORTRAIT_AUDIT_LOG_DIR for portrait_api.py.
+"""
+
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from portrait_http import ImagePart
+
+AUDIT_FILE_PREFIX = "audit-"
+# Rotate after this many bytes; keep this many files (oldest deleted first)
+AUDIT_MAX_FILE_BYTES = 50 * 1024 * 1024
+AUDIT_MAX_FILES = 20
+# Records waiting for the writer before new ones are dropped
+AUDIT_QUEUE_SIZE = 10000
+# Records per write, and the longest a record waits for its batch to fill
+AUDIT_BATCH_SIZE = 200
+AUDIT_FLUSH_INTERVAL_S = 1.0
+
+_STOP = object()
+
+
+def redact_images(value):
+    """Copy of a payload with image data replaced by its type and size"""
+    if isinstance(value, ImagePart):
+        return {"image": value.mime_type, "base64_chars": len(value)}
+    if isinstance(value, str) and value.startswith("data:image/"):
+        return {"image": value[len("data:"):value.find(";")], "base64_chars": len(value)}
+    if isinstance(value, dict):
+        return {key: redact_images(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact_images(item) for item in value]
+    return value
+
+
+class AuditLogWriter:
+    """Background JSONL writer with a bounded queue, batching and size-based rotation"""
+
+    def __init__(self, directory, max_file_bytes=AUDIT_MAX_FILE_BYTES, max_files=AUDIT_MAX_FILES,
+                 queue_size=AUDIT_QUEUE_SIZE, batch_size=AUDIT_BATCH_SIZE,
+                 flush_interval_s=AUDIT_FLUSH_INTERVAL_S):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_file_bytes = max_file_bytes
+        self.max_files = max_files
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.written = 0
+        self.dropped = 0
+        self.write_errors = 0
+        # write() runs on every request thread; the other counters only on the writer thread
+        self._dropped_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._thread = threading.Thread(target=self._run, name="audit-log", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, record):
+        """Enqueues one record; never blocks (counts a drop when the queue is full)"""
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def close(self, timeout=5.0):
+        """Writes what is queued and stops the thread"""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def stats(self):
+        return {"written": self.written, "dropped": self.dropped,
+                "write_errors": self.write_errors, "queued": self._queue.qsize()}
+
+    def _open_file(self):
+        name = f"{AUDIT_FILE_PREFIX}{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.jsonl"
+        self._file = open(os.path.join(self.directory, name), "ab")
+        files = sorted(entry for entry in os.listdir(self.directory)
+                       if entry.startswith(AUDIT_FILE_PREFIX) and entry.endswith(".jsonl"))
+        for old in files[:max(len(files) - self.max_files, 0)]:
+            os.remove(os.path.join(self.directory, old))
+
+    def _write_batch(self, batch):
+        data = b"".join(
+            (json.dumps(redact_images(record), ensure_ascii=False, default=str) + "\n").encode("utf-8")
+            for record in batch)
+        try:
+            if self._file is None or self._file.tell() + len(data) > self.max_file_bytes:
+                if self._file is not None:
+                    self._file.close()
+                self._open_file()
+            self._file.write(data)
+            self._file.flush()
+            self.written += len(batch)
+        except OSError:
+            self.write_errors += len(batch)
+            self._file = None  # Reopen a fresh file on the next batch
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = None
+            while len(batch) < self.batch_size:
+                timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+                try:
+                    record = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if record is _STOP:
+                    stopping = True
+                    break
+                batch.append(record)
+                deadline = deadline or time.monotonic() + self.flush_interval_s
+            if batch:
+                self._write_batch(batch)
+        if self._file is not None:
+            self._file.close()
+
+
+_writer = None
+
+
+def configure_audit_log(directory=None, **options):
+    """Sets (or, without a directory, disables) the process-wide audit log; returns the writer"""
+    global _writer
+    if _writer is not None:
+        _writer.close()
+    _writer = AuditLogWriter(directory, **options) if directory else None
+    return _writer
+
+
+def audit_event(record):
+    """Queues one exchange for the audit log (no-op when it is not configured)"""
+    if _writer is not None:
+        _writer.write({"ts": datetime.now().isoformat(), **record})
@@ -0,0 +1,99 @@
+"""Token usage and cost accounting for model calls (shared by Streamlit app and CLI scripts)."""
+
+# USD per 1M tokens. "cached" is the discounted rate for cached prompt tokens;
+# reasoning tokens are billed as completion tokens and are already included in
+# `completion_tokens` by OpenRouter, so they have no separate rate.
+# Override or extend via the `model_prices` table in Streamlit secrets.
+MODEL_PRICES = {
+    "openai/gpt-5.2": {"prompt": 1.75, "completion": 14.00, "cached": 0.175},
+    "openai/gpt-5.2-chat": {"prompt": 1.75, "completion": 14.00, "cached": 0.175},
+    "openai/gpt-5.4-nano": {"prompt": 0.05, "completion": 0.40, "cached": 0.005},
+    "openai/gpt-4o": {"prompt": 2.50, "completion": 10.00, "cached": 1.25},
+    "openai/gpt-4o-mini": {"prompt": 0.15, "completion": 0.60, "cached": 0.075},
+    "openai/gpt-4.1-nano": {"prompt": 0.10, "completion": 0.40, "cached": 0.025},
+    "x-ai/grok-4.20-beta": {"prompt": 3.00, "completion": 15.00, "cached": 0.75},
+    "x-ai/grok-4.20-multi-agent-beta": {"prompt": 3.00, "completion": 15.00, "cached": 0.75},
+    "anthropic/claude-haiku-4.5": {"prompt": 1.00, "completion": 5.00, "cached": 0.10},
+}
+
+TOKEN_FIELDS = ["prompt_tokens", "completion_tokens",
+                "cached_tokens", "reasoning_tokens", "total_tokens"]
+
+
+def load_price_table(overrides=None):
+    """Returns MODEL_PRICES merged with per-model overrides (e.g. from secrets)"""
+    prices = {model: dict(rates) for model, rates in MODEL_PRICES.items()}
+    for model, rates in (overrides or {}).items():
+        prices.setdefault(model, {}).update(
+            {k: float(v) for k, v in dict(rates).items()})
+    return prices
+
+
+def normalize_usage(usage):
+    """Flattens an OpenRouter/OpenAI `usage` object into TOKEN_FIELDS"""
+    usage = usage or {}
+    prompt_details = usage.get("prompt_tokens_details") or {}
+    completion_details = usage.get("completion_tokens_details") or {}
+    prompt_tokens = usage.get("prompt_tokens") or 0
+    completion_tokens = usage.get("completion_tokens") or 0
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cached_tokens": prompt_details.get("cached_tokens") or 0,
+        "reasoning_tokens": completion_details.get("reasoning_tokens") or 0,
+        "total_tokens": usage.get("total_tokens") or prompt_tokens + completion_tokens,
+    }
+
+
+def estimate_cost(model, tokens, prices=None):
+    """Returns USD cost for normalized token counts, or None if the model is not priced"""
+    rates = (prices if prices is not None else MODEL_PRICES).get(model)
+    if not rates:
+        return None
+    cached = tokens.get("cached_tokens", 0)
+    uncached = max(tokens.get("prompt_tokens", 0) - cached, 0)
+    return (
+        uncached * rates.get("prompt", 0)
+        + cached * rates.get("cached", rates.get("prompt", 0))
+        + tokens.get("completion_tokens", 0) * rates.get("completion", 0)
+    ) / 1_000_000
+
+
+def make_ledger_entry(call_type, model, usage, prices=None, elapsed=None):
+    """Builds one cost ledger record for a single model call"""
+    # A coalesced call shared another caller's request, whose entry holds the spend
+    coalesced = bool((usage or {}).get("coalesced"))
+    tokens = normalize_usage(None if coalesced else usage)
+    entry = {"call_type": call_type, "model": model, **tokens,
+             "cost_usd": 0.0 if coalesced else estimate_cost(model, tokens, prices)}
+    if coalesced:
+        entry["coalesced"] = True
+    if elapsed is not None:
+        entry["elapsed_s"] = round(elapsed, 3)
+    if (usage or {}).get("provider"):
+        entry["provider"] = usage["provider"]  # Per-provider latency/cost comparisons
+    return entry
+
+
+def summarize_ledger(entries):
+    """Sums token counts and cost over ledger entries"""
+    summary = {field: 0 for field in TOKEN_FIELDS}
+    summary["cost_usd"] = 0.0
+    summary["calls"] = 0
+    summary["unpriced_calls"] = 0
+    for entry in entries or []:
+        summary["calls"] += 1
+        for field in TOKEN_FIELDS:
+            summary[field] += entry.get(field, 0) or 0
+        if entry.get("cost_usd") is None:
+            summary["unpriced_calls"] += 1
+        else:
+            summary["cost_usd"] += entry["cost_usd"]
+    return summary
+
+
+def format_cost(cost_usd):
+    """Formats a USD amount with enough precision for sub-cent calls"""
+    if cost_usd is None:
+        return "N/A"
+    return f"${cost_usd:.4f}" if cost_usd < 1 else f"${cost_usd:.2f}"
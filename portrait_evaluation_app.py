@@ -1,13 +1,32 @@
 import streamlit as st
 import json
-import base64
 import requests
+import sqlite3
+import statistics
 import time
-from pathlib import Path
+import io
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 
-# OpenRouter completion cap (comparison JSON can exceed 6k tokens)
-OPENROUTER_MAX_TOKENS = 12000
+# Iterations rendered per page in the Iteration History panel
+HISTORY_PAGE_SIZE = 5
+
+# Seconds to wait for ensemble models before aggregating whatever has arrived
+ENSEMBLE_DEFAULT_DEADLINE_S = 120
+
+# Section timings kept per session for the rerun profiler
+RERUN_PROFILE_SIZE = 500
+
+# Model option that routes each evaluation call by live latency/error/cost statistics
+AUTO_MODEL = "auto"
+
+# Background image checks: process-wide workers (roughly one per concurrently uploading
+# session; `eager_prefilter_workers` in secrets), cached results per session, agent1 read timeout
+EAGER_PREFILTER_WORKERS = 16
+EAGER_PREFILTER_CACHE_SIZE = 4
+EAGER_PREFILTER_TIMEOUT_S = 60
 
 # Page configuration
 st.set_page_config(
@@ -16,6 +35,8 @@ st.set_page_config(
     layout="wide"
 )
 
+script_started = time.perf_counter()
+
 # CSS styles - Light theme with dark text
 st.markdown("""
 <style>
@@ -87,74 +108,175 @@ st.markdown("""
     }
 </style>
 """, unsafe_allow_html=True)
+css_elapsed_ms = (time.perf_counter() - script_started) * 1000
 
-# Prompts - Pre-filter agents (agent1, agent2, agent3)
-AGENT1_INITIAL_ANALYSIS = """### Task:
-You are provided with an image from a painting student. Your task is to analyze the uploaded image and classify its contents. Based on your analysis, return a JSON-formatted output containing the following variables:
-
-### Output Format:
-The output should be a JSON object with the following structure:
-{{
-    "OBJECT_ON_IMAGE": "<String>",
-    "IS_PORTRAIT": <Bool>,
-    "CENCORED_CONTENT": <Bool>,
-    "PAINTING_OR_DRAWING_OR_ELSE": "<String>",
-    "DRAWING_STYLE": "<String>"
-}}
-
-### Variables:
-1. **OBJECT_ON_IMAGE**: A string describing the objects visible on the image.
-2. **IS_PORTRAIT**: A Boolean value indicating whether the image contains a portrait.
-   - Return `True` if the image contains a portrait (i.e., focuses on a person's face or upper body).
-   - Return `False` if the image does not contains a portrait.
-3. **CENCORED_CONTENT**: A Boolean value indicating whether the image contains censored content.
-   - Return `True` if the image includes censored content such as nudity, explicit material, or other sensitive elements.
-   - Return `False` if the image does not contain censored content.
-4. **PAINTING_OR_DRAWING_OR_ELSE**: A string indicating the type of the artwork.
-   - Return `"Painting"` if the image is of a painting (i.e., an artwork created using paints, such as oil, acrylic, or watercolor).
-   - Return `"Drawing"` if the image is of a drawing (i.e., an artwork created using dry media like pencils, charcoal, or ink).
-   - Return `"Manga"` if the image is of a manga style drawing or painting.
-   - Return `"Cartoon"` if the image is of a cartoon style drawing or painting.
-   - Return `"Else"` if the image is neither a painting nor a drawing.
-5. **DRAWING_STYLE**: A string indicating the style of the drawing.
-
-### Rules:
-- Always provide concise and accurate descriptions for the "OBJECT_ON_IMAGE".
-- Ensure the Boolean values for "IS_PORTRAIT" and "CENCORED_CONTENT" are accurate based on the image content.
-- Correctly classify the image type in "PAINTING_OR_DRAWING_OR_ELSE" according to the visual cues.
-- Carefully examine the input image to ensure the accuracy of the output format in JSON.
-- If unsure about any classification, use your best judgment based on the image content.
-"""
-AGENT2_CENSORED_MESSAGE = """### Task:
-You were provided with an image from a painting student. Your task was to analyze the image and classify its contents. Based on your analysis, you have found that the image has censored content.
-This was your output:
-{input_data}
-
-Your task is to write a message in {output_language} explaining that this censored content is not allowed. Maximum amount of characters is 300.
-"""
-AGENT3_NOT_PORTRAIT_MESSAGE = """### Task:
-You were provided with an image from a painting student. Your task was to analyze the image and classify its contents. Based on your analysis, you have found that the image does not contain a portrait.
-This was your output:
-{input_data}
-
-Your task is to write a message in {output_language} explaining that at the moment you only provide painting lessons for portraits. Maximum amount of characters is 300.
-"""
-
-from portrait_prompts import (
-    AUDIENCE_COMPLEXITY,
-    AUDIENCE_COMPLEXITY_BEGINNER,
-    COMPARISON_PROMPT,
-    EVALUATE_PORTRAIT_STANDALONE,
-    JULIA_STYLE_RULES,
+from portrait_prompts import AUDIENCE_COMPLEXITY, OUTPUT_LANGUAGES
+from portrait_prompt_compiler import (
+    PROMPT_TEMPLATES,
+    compile_prompt_variants,
+)
+from portrait_archive import (
+    ARCHIVE_COMPRESSIONS,
+    make_archive_header,
+    make_archive_record,
+    read_session_archive,
+    write_session_archive,
+)
+from portrait_audit import configure_audit_log
+from portrait_singleflight import MODEL_CALLS, CoalescedError
+from portrait_analytics import (
+    ScoreIndex,
+    build_cohort_matrix,
+    cohort_statistics,
+)
+from portrait_costs import (
+    format_cost,
+    load_price_table,
+    make_ledger_entry,
+    summarize_ledger,
+)
+from portrait_http import ImagePart
+from portrait_pipeline import (
+    CALL_CONNECT_TIMEOUT_S,
+    OPENROUTER_MAX_TOKENS,
+    EVALUATION_DEADLINES_S,
+    REJECTION_FALLBACK_MESSAGES,
+    DeadlineExceeded,
+    aggregate_ensemble_responses,
+    build_comparison_content,
+    build_standalone_content,
+    calculate_average_score,
+    call_agent1_initial_analysis,
+    call_agent1_with_rejection_message,
+    call_agent2_censored_message,
+    call_agent3_not_portrait_message,
+    call_models_concurrently,
+    call_openai_api,
+    call_timeout,
+    evaluation_system_prompt,
+    extract_standard_evaluation,
+    get_comparison_data,
+    make_deadline,
+    parse_agent1_response,
+    parse_evaluation_response,
+    rejection_call_type,
+    single_pass_gate,
+    translate_evaluation_concurrently,
+)
+from portrait_precheck import (
+    PRECHECK_PORTRAIT,
+    PRECHECK_REJECT,
+    find_near_duplicate,
+    local_rejection_message,
+    precheck_image,
+)
+from portrait_providers import configure_providers
+from portrait_routing import (
+    FALLBACK_CHAINS,
+    QUALITY_TIER_NAMES,
+    CircuitBreakerRegistry,
+    ModelRouter,
+    ModelStats,
+    fallback_order,
+    run_with_fallback,
 )
+from portrait_records import IterationRecord
+from portrait_store import (
+    DEFAULT_DB_PATH,
+    DETAIL_FIELDS,
+    SessionStore,
+    new_session_id,
+    sha256_hex,
+)
+
+
+# Settings a stored session or an imported archive may restore, with their allowed values
+RESTORABLE_SETTINGS = {
+    "output_language": OUTPUT_LANGUAGES,
+    "skill_level": list(AUDIENCE_COMPLEXITY),
+}
 
 
 # Initialize session state
 if "iterations" not in st.session_state:
     st.session_state.iterations = []
 
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
+# Bumped on every change to `iterations`; keys the export cache
+if "iterations_version" not in st.session_state:
+    st.session_state.iterations_version = 0
+
+if "export_cache" not in st.session_state:
+    st.session_state.export_cache = {}
+
+# Columnar score index of the session (rebuilt lazily by get_score_index)
+if "score_index" not in st.session_state:
+    st.session_state.score_index = None
+
+# Ensemble mode: several evaluation models in parallel, scores aggregated per category
+if "ensemble_enabled" not in st.session_state:
+    st.session_state.ensemble_enabled = False
+
+if "ensemble_models" not in st.session_state:
+    st.session_state.ensemble_models = []
+
+if "ensemble_aggregation" not in st.session_state:
+    st.session_state.ensemble_aggregation = "median"
+
+if "ensemble_deadline" not in st.session_state:
+    st.session_state.ensemble_deadline = ENSEMBLE_DEFAULT_DEADLINE_S
+
+# Agent1 also writes the rejection message (one round trip instead of agent1 + agent2/3)
+if "single_call_prefilter" not in st.session_state:
+    st.session_state.single_call_prefilter = False
+
+# The evaluation call also does the portrait/censorship gate (no agent1 call)
+if "single_pass_evaluation" not in st.session_state:
+    st.session_state.single_pass_evaluation = False
+
+# (section, milliseconds) of recent reruns, full and fragment-only
+if "rerun_profile" not in st.session_state:
+    st.session_state.rerun_profile = deque(maxlen=RERUN_PROFILE_SIZE)
+st.session_state.rerun_profile.append(("css", css_elapsed_ms))
+
+# Send the precompiled (whitespace-minified) evaluation prompts; saves only a few tokens
+if "compiled_prompts" not in st.session_state:
+    st.session_state.compiled_prompts = False
+
+# Local CPU image check before agent1: "off", "validate" or "skip_agent1"
+if "local_precheck" not in st.session_state:
+    st.session_state.local_precheck = "validate"
+
+# Content hashes and messages of rejected uploads (reused when the same file is uploaded again)
+if "rejected_uploads" not in st.session_state:
+    st.session_state.rejected_uploads = []
+
+# (file_id, local check incl. phash) of the current upload, so reruns don't decode it again
+if "upload_precheck" not in st.session_state:
+    st.session_state.upload_precheck = (None, None)
+
+# (file_id, sha256) of the current upload
+if "upload_sha" not in st.session_state:
+    st.session_state.upload_sha = (None, None)
+
+# Start encoding, local check and agent1 in the background as soon as a file is uploaded
+if "eager_prefilter" not in st.session_state:
+    st.session_state.eager_prefilter = True
+
+# Background image check jobs by (content sha256, check settings), oldest first
+if "prefilter_jobs" not in st.session_state:
+    st.session_state.prefilter_jobs = {}
+
+# Retry failed calls on the call type's fallback chain
+if "fallback_enabled" not in st.session_state:
+    st.session_state.fallback_enabled = True
+
+# Minimum quality tier for "auto" model routing
+if "quality_tier" not in st.session_state:
+    st.session_state.quality_tier = "standard"
+
+# Iteration History panel page (0 = newest iterations)
+if "history_page" not in st.session_state:
+    st.session_state.history_page = 0
 
 if "output_language" not in st.session_state:
     st.session_state.output_language = "English"
@@ -162,6 +284,13 @@ if "output_language" not in st.session_state:
 if "skill_level" not in st.session_state:
     st.session_state.skill_level = "beginner"
 
+# Additional feedback languages, produced by translating the evaluation with a cheap text model
+if "extra_languages" not in st.session_state:
+    st.session_state.extra_languages = []
+
+if "translation_model" not in st.session_state:
+    st.session_state.translation_model = "openai/gpt-4o-mini"
+
 if "reasoning_effort" not in st.session_state:
     # OpenRouter reasoning effort for GPT-5 models (reasoning: {effort: ...})
     # Default is "none" to avoid extra latency/cost unless the user picks otherwise.
@@ -177,209 +306,582 @@ if "comparison_model" not in st.session_state:
 if "prefilter_model" not in st.session_state:
     st.session_state.prefilter_model = "openai/gpt-4o-mini"
 
+# Every model call of the session (agent1/2/3 and evaluations, incl. rejected uploads)
+if "cost_ledger" not in st.session_state:
+    st.session_state.cost_ledger = []
+
 
 # API key from Streamlit secrets
 API_KEY = st.secrets["OPENAI_API_KEY"]
 
+# Per-model prices (USD per 1M tokens); `[model_prices."<model>"]` in secrets overrides defaults
+PRICE_TABLE = load_price_table(st.secrets.get("model_prices", {}))
 
-def encode_image_to_base64(uploaded_file):
-    """Converts uploaded file to base64"""
-    bytes_data = uploaded_file.getvalue()
-    encoded = base64.b64encode(bytes_data).decode('utf-8')
+# Direct provider endpoints; `[providers.<name>]` in secrets routes matching models past OpenRouter
+configure_providers(st.secrets.get("providers", {}))
 
-    # Determine MIME type
-    file_type = uploaded_file.type or "image/jpeg"
-    return f"data:{file_type};base64,{encoded}"
 
+@st.cache_resource
+def get_audit_log(directory):
+    """Process-wide audit log writer (None unless `audit_log_dir` is set in secrets)"""
+    return configure_audit_log(directory)
 
-def get_comparison_data(iterations):
-    """Returns data for comparison"""
-    n = len(iterations)
 
-    if n == 1:
-        return {"first": None, "previous": None, "current": iterations[0]}
-    elif n == 2:
-        return {"first": iterations[0], "previous": None, "current": iterations[1]}
-    else:
-        return {"first": iterations[0], "previous": iterations[n-2], "current": iterations[n-1]}
+AUDIT_LOG = get_audit_log(st.secrets.get("audit_log_dir"))
 
 
-def call_agent1_initial_analysis(api_key, image_base64, model="openai/gpt-4o-mini"):
-    """Agent1: Initial image analysis - classifies portrait, censored, etc. Takes image as input."""
-    user_content = [
-        {"type": "text", "text": "Analyze this image and return the classification JSON."},
-        {"type": "image_url", "image_url": {"url": image_base64, "detail": "low"}}
-    ]
-    return call_openai_api(api_key, AGENT1_INITIAL_ANALYSIS, user_content, model=model)
+@st.cache_resource
+def get_session_store(db_path):
+    """One SQLite history store per process, shared by all sessions"""
+    try:
+        return SessionStore(db_path)
+    except sqlite3.Error:
+        return None  # History persistence is optional; the app works without it
 
 
-def call_agent2_censored_message(api_key, agent1_output_json, output_language="English", model="openai/gpt-4o-mini"):
-    """Agent2: Generates censored content rejection message. Text-only input."""
-    prompt = AGENT2_CENSORED_MESSAGE.format(
-        input_data=agent1_output_json, output_language=output_language)
-    return call_openai_api(api_key, prompt, user_content="Generate the rejection message.", model=model)
+SESSION_STORE = get_session_store(
+    st.secrets.get("session_db_path", DEFAULT_DB_PATH))
 
 
-def call_agent3_not_portrait_message(api_key, agent1_output_json, output_language="English", model="openai/gpt-4o-mini"):
-    """Agent3: Generates not-portrait rejection message. Text-only input."""
-    prompt = AGENT3_NOT_PORTRAIT_MESSAGE.format(
-        input_data=agent1_output_json, output_language=output_language)
-    return call_openai_api(api_key, prompt, user_content="Generate the rejection message.", model=model)
+@st.cache_resource
+def get_model_router():
+    """Process-wide model statistics and router, fed by every session's calls"""
+    return ModelRouter(ModelStats(), slos=dict(st.secrets.get("routing_slos", {})))
 
 
-def parse_agent1_response(response_text):
-    """Parse agent1 JSON response. Returns dict or None."""
-    try:
-        start_idx = response_text.find('{')
-        end_idx = response_text.rfind('}') + 1
-        if start_idx != -1 and end_idx > start_idx:
-            return json.loads(response_text[start_idx:end_idx])
-    except json.JSONDecodeError:
-        pass
-    return None
+MODEL_ROUTER = get_model_router()
 
 
-def call_openai_api(api_key, system_prompt, user_content=None, model="openai/gpt-5.2",
-                      response_format=None):
-    """Call OpenAI API (via OpenRouter)"""
-    url = "https://openrouter.ai/api/v1/chat/completions"
+@st.cache_resource
+def get_circuit_breakers():
+    """Process-wide per-model circuit breakers"""
+    return CircuitBreakerRegistry()
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "http://localhost:8501",  # Client URL
-        "X-Title": "Portrait Evaluation Assistant"  # Client title
-    }
 
-    messages = [
-        {
-            "role": "system",
-            "content": [
-                {"type": "text", "text": system_prompt}
-            ],
-        }
-    ]
+CIRCUIT_BREAKERS = get_circuit_breakers()
 
-    # Optionally add user message
-    if user_content is not None:
-        messages.append({"role": "user", "content": user_content})
+# `[evaluation_deadlines]` in secrets overrides the per-mode evaluation budgets
+EVALUATION_DEADLINE_CONFIG = {**EVALUATION_DEADLINES_S,
+                              **{k: float(v) for k, v in st.secrets.get("evaluation_deadlines", {}).items()}}
 
-    data = {
-        "model": model,
-        "messages": messages,
-        "temperature": 0.1,
-        "max_tokens": OPENROUTER_MAX_TOKENS
-    }
 
-    if response_format is not None:
-        data["response_format"] = response_format
-
-    # Optionally control reasoning effort (OpenRouter uses `reasoning: {effort: ...}`)
-    if model.startswith("openai/gpt-5") and "reasoning_effort" in st.session_state:
-        data["reasoning"] = {"effort": st.session_state.reasoning_effort}
-
-    response = requests.post(url, headers=headers, json=data)
-    response.raise_for_status()
-
-    result = response.json()
-    return result["choices"][0]["message"]["content"], result.get("usage", {})
-
-
-def build_standalone_content(image_base64):
-    """Builds content for standalone evaluation"""
-    return [
-        {"type": "text", "text": "This is a portrait painted by a student. Please evaluate it."},
-        {"type": "image_url", "image_url": {"url": image_base64, "detail": "high"}}
-    ]
-
-
-def build_comparison_content(comparison_data):
-    """Builds content for comparison"""
-    user_content = []
-
-    # First iteration
-    if comparison_data["first"]:
-        first = comparison_data["first"]
-        user_content.append(
-            {"type": "text", "text": "=== FIRST ITERATION (Initial Portrait) ==="})
-        user_content.append({"type": "image_url", "image_url": {
-                            "url": first["image_base64"], "detail": "high"}})
-        user_content.append(
-            {"type": "text", "text": f"First iteration expert evaluation:\n{json.dumps(first['evaluation'], indent=2, ensure_ascii=False)}"})
-
-    # Previous iteration
-    if comparison_data["previous"]:
-        previous = comparison_data["previous"]
-        user_content.append(
-            {"type": "text", "text": "=== PREVIOUS ITERATION (Most Recent Before Current) ==="})
-        user_content.append({"type": "image_url", "image_url": {
-                            "url": previous["image_base64"], "detail": "high"}})
-        user_content.append(
-            {"type": "text", "text": f"Previous iteration expert evaluation:\n{json.dumps(previous['evaluation'], indent=2, ensure_ascii=False)}"})
-
-    # Current iteration
-    current = comparison_data["current"]
-    user_content.append(
-        {"type": "text", "text": "=== CURRENT ITERATION (To Be Evaluated) ==="})
-    user_content.append({"type": "image_url", "image_url": {
-                        "url": current["image_base64"], "detail": "high"}})
-    user_content.append(
-        {"type": "text", "text": "Please analyze the current portrait, compare it with the previous iterations, and provide a comprehensive evaluation."})
-
-    return user_content
-
-
-def parse_evaluation_response(response_text, is_comparison=False):
-    """Parses API response"""
-    try:
-        # Try to find JSON in response
-        start_idx = response_text.find('{')
-        end_idx = response_text.rfind('}') + 1
-        if start_idx != -1 and end_idx > start_idx:
-            json_str = response_text[start_idx:end_idx]
-            return json.loads(json_str)
-    except json.JSONDecodeError:
-        pass
-    return None
+@st.cache_resource
+def get_compiled_prompts():
+    """Every (mode, skill level, language) evaluation prompt, compiled once per process"""
+    return compile_prompt_variants()
+
 
+COMPILED_PROMPTS = get_compiled_prompts()
 
-def extract_standard_evaluation(parsed_response, is_comparison=False):
-    """Extracts standard evaluation format from response"""
-    if not parsed_response:
+# Ordered fallback models per call type; `[fallback_chains]` in secrets overrides entries
+FALLBACK_CHAIN_CONFIG = {**FALLBACK_CHAINS,
+                         **{k: list(v) for k, v in st.secrets.get("fallback_chains", {}).items()}}
+
+
+def reset_session_data():
+    """Clears everything that belongs to the current session (iterations, costs, cached checks)"""
+    for job in st.session_state.prefilter_jobs.values():
+        job["future"].cancel()
+    st.session_state.iterations = []
+    st.session_state.cost_ledger = []
+    st.session_state.rejected_uploads = []
+    st.session_state.prefilter_jobs = {}
+    st.session_state.export_cache = {}
+    st.session_state.history_page = 0
+    st.session_state.score_index = None
+    bump_iterations_version()
+
+
+def restore_session_settings(settings):
+    """Applies stored/imported settings; only RESTORABLE_SETTINGS keys with allowed values"""
+    if not isinstance(settings, dict):
+        return
+    for key, allowed in RESTORABLE_SETTINGS.items():
+        value = settings.get(key)
+        if isinstance(value, str) and value in allowed:
+            st.session_state[key] = value
+
+
+def start_new_session():
+    """Starts an empty session with a fresh ID (shown in the URL for resuming)"""
+    reset_session_data()
+    st.session_state.session_id = new_session_id()
+    st.query_params["session"] = st.session_state.session_id
+
+
+def load_persisted_session(session_id):
+    """Resumes a stored session: light iteration records only, details load lazily"""
+    reset_session_data()
+    st.session_state.session_id = session_id
+    st.session_state.iterations = [IterationRecord.from_dict(row)
+                                   for row in SESSION_STORE.list_iterations(session_id)]
+    session = SESSION_STORE.get_session(session_id) or {}
+    restore_session_settings(session.get("settings"))
+    st.query_params["session"] = session_id
+    bump_iterations_version()
+
+
+def import_session_archive(data):
+    """Rebuilds iterations from a session archive as a new session (no model calls).
+
+    Returns the number of imported iterations; raises ValueError for invalid archives.
+    """
+    header, records = read_session_archive(data)
+    start_new_session()
+    iterations = []
+    for record in records:
+        image = record.pop("image", None)
+        if image:
+            record.update(image_bytes=image["data"], mime_type=image["mime_type"],
+                          image_sha256=sha256_hex(image["data"]))
+        iteration = IterationRecord.from_dict(record)
+        iterations.append(iteration)
+        persist_iteration(iteration, image["data"] if image else None,
+                          image["mime_type"] if image else "image/jpeg")
+    st.session_state.iterations = iterations
+    restore_session_settings(header.get("settings"))
+    bump_iterations_version()
+    return len(iterations)
+
+
+def persist_iteration(iteration, image_bytes, mime_type):
+    """Appends a completed iteration to the session store (best effort).
+
+    The store numbers it; if another tab or the API added iterations to this
+    session meanwhile, the record takes the stored number.
+    """
+    if SESSION_STORE is None:
+        return
+    try:
+        SESSION_STORE.ensure_session(st.session_state.session_id, {
+            "output_language": st.session_state.output_language,
+            "skill_level": st.session_state.skill_level,
+        })
+        iteration_number = SESSION_STORE.append_iteration(
+            st.session_state.session_id, iteration, image_bytes, mime_type)
+        if iteration_number != iteration["iteration_number"]:
+            st.caption(f"ℹ️ This session was also updated elsewhere; saved as iteration {iteration_number}")
+            iteration["iteration_number"] = iteration_number
+    except sqlite3.Error as e:
+        st.warning(f"Could not save iteration to history: {e}")
+
+
+def get_iteration_details(iteration):
+    """Heavy iteration fields (raw/parsed response, prompt, calls), loaded from the store for resumed iterations"""
+    if "raw_response" in iteration or SESSION_STORE is None or "iteration_number" not in iteration:
+        return {field: iteration.get(field) for field in DETAIL_FIELDS}
+    return SESSION_STORE.load_iteration_details(
+        st.session_state.session_id, iteration["iteration_number"])
+
+
+def get_iteration_image(iteration):
+    """Returns (raw image bytes, mime_type), held in memory or loaded from the store, or (None, None)"""
+    if iteration.get("image_bytes") is not None:
+        return iteration["image_bytes"], iteration.get("mime_type", "image/jpeg")
+    if SESSION_STORE is None or not iteration.get("image_sha256"):
+        return None, None
+    return SESSION_STORE.load_image(iteration["image_sha256"])
+
+
+def get_iteration_image_bytes(iteration):
+    """Returns the iteration's raw image bytes (held in memory or loaded from the store)"""
+    return get_iteration_image(iteration)[0]
+
+
+def get_iteration_image_part(iteration):
+    """The iteration's image for a request body, from memory or the store"""
+    image_bytes, mime_type = get_iteration_image(iteration)
+    if image_bytes is None:
         return None
+    return ImagePart(image_bytes, mime_type)  # base64-encoded while the request streams
 
-    categories = [
-        "Composition and Design", "Proportions and Anatomy", "Perspective and Depth",
-        "Use of Light and Shadow", "Color Theory and Application", "Brushwork and Technique",
-        "Expression and Emotion", "Creativity and Originality", "Attention to Detail", "Overall Impact"
-    ]
-
-    standard_eval = {}
-
-    for category in categories:
-        if category in parsed_response:
-            cat_data = parsed_response[category]
-            if is_comparison and "current_score" in cat_data:
-                standard_eval[category] = {
-                    "score": cat_data.get("current_score"),
-                    "feedback": cat_data.get("feedback", "")
-                }
-            elif "score" in cat_data:
-                standard_eval[category] = {
-                    "score": cat_data.get("score"),
-                    "feedback": cat_data.get("feedback", "")
-                }
-
-    return standard_eval if standard_eval else None
-
-
-def calculate_average_score(evaluation):
-    """Calculates average score"""
-    if not evaluation:
-        return 0
-    scores = [v.get("score", 0) for v in evaluation.values()
-              if isinstance(v, dict) and "score" in v]
-    return sum(scores) / len(scores) if scores else 0
+
+def get_upload_precheck(uploaded_file):
+    """Local check of the current upload (verdict, size, faces, phash), run once per file"""
+    file_id, precheck = st.session_state.upload_precheck
+    if file_id != uploaded_file.file_id:
+        precheck = precheck_image(uploaded_file.getvalue())
+        st.session_state.upload_precheck = (uploaded_file.file_id, precheck)
+    return precheck
+
+
+def get_upload_sha(uploaded_file):
+    """Content hash of the current upload, computed once per file"""
+    file_id, sha = st.session_state.upload_sha
+    if file_id != uploaded_file.file_id:
+        sha = sha256_hex(uploaded_file.getvalue())
+        st.session_state.upload_sha = (uploaded_file.file_id, sha)
+    return sha
+
+
+@st.cache_resource
+def get_prefilter_executor(workers):
+    """Process-wide worker pool for background (on-upload) image checks"""
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefilter")
+
+
+PREFILTER_EXECUTOR = get_prefilter_executor(
+    int(st.secrets.get("eager_prefilter_workers", EAGER_PREFILTER_WORKERS)))
+
+
+def prefilter_settings():
+    """Settings an image check result depends on (part of its cache key)"""
+    return (st.session_state.local_precheck, st.session_state.single_pass_evaluation,
+            st.session_state.single_call_prefilter, st.session_state.prefilter_model,
+            st.session_state.output_language, st.session_state.reasoning_effort)
+
+
+def run_prefilter_job(image_bytes, mime_type, local_check, settings, models, breakers):
+    """Worker thread: agent1 for one upload unless its local check settles it. No st.session_state access.
+
+    agent1 goes down `models` (the prefilter fallback order) like the click-time
+    call does, skipping open circuits. Never raises: an error is returned in
+    "error" and the click runs the check itself.
+    """
+    local_precheck, single_pass, single_call, model, language, reasoning_effort = settings
+    result = {"model": model, "agent1_text": None, "usage": None,
+              "elapsed": None, "failures": [], "error": None}
+    try:
+        if local_precheck != "off":
+            if local_check["verdict"] == PRECHECK_REJECT or (
+                    local_precheck == "skip_agent1" and local_check["verdict"] == PRECHECK_PORTRAIT):
+                return result
+        if single_pass:
+            return result
+
+        image_part = ImagePart(image_bytes, mime_type)
+        timeout = (CALL_CONNECT_TIMEOUT_S, EAGER_PREFILTER_TIMEOUT_S)
+
+        def attempt(attempt_model):
+            call_start = time.perf_counter()
+            if single_call:
+                text, usage = call_agent1_with_rejection_message(
+                    API_KEY, image_part, output_language=language, model=attempt_model,
+                    reasoning_effort=reasoning_effort, timeout=timeout)
+            else:
+                text, usage = call_agent1_initial_analysis(
+                    API_KEY, image_part, model=attempt_model, reasoning_effort=reasoning_effort,
+                    timeout=timeout)
+            return text, usage, time.perf_counter() - call_start
+
+        (result["agent1_text"], result["usage"], result["elapsed"]), result["model"], result["failures"] = (
+            run_with_fallback(models, attempt, breakers, retryable=(requests.exceptions.RequestException,),
+                              is_shared=is_shared_result))
+    except Exception as e:
+        result["error"] = e
+    return result
+
+
+def collect_prefilter_jobs():
+    """Books the agent1 cost of finished background checks in the session ledger, once each.
+
+    A job whose future failed is dropped; the click then checks the upload itself.
+    """
+    jobs = st.session_state.prefilter_jobs
+    for key, job in list(jobs.items()):
+        if job["future"].done() and job["ledger"] is None:
+            try:
+                result = job["future"].result()
+            except Exception:
+                del jobs[key]
+                continue
+            job["ledger"] = []
+            if result["usage"] is not None:
+                record_call_cost(job["ledger"], "agent1", result["model"], result["usage"], result["elapsed"])
+
+
+def start_prefilter_job(uploaded_file, upload_sha):
+    """Starts the background check of the current upload unless one with the same key exists.
+
+    Jobs of earlier uploads that have not started yet are cancelled; running and
+    finished ones stay cached (up to EAGER_PREFILTER_CACHE_SIZE), so switching
+    back to a file reuses its result.
+    """
+    key = (upload_sha, prefilter_settings())
+    jobs = st.session_state.prefilter_jobs
+    for other_key, job in list(jobs.items()):
+        if other_key != key and job["future"].cancel():
+            del jobs[other_key]
+    if key not in jobs:
+        chain = FALLBACK_CHAIN_CONFIG.get("prefilter", []) if st.session_state.fallback_enabled else []
+        jobs[key] = {"ledger": None, "consumed": False, "future": PREFILTER_EXECUTOR.submit(
+            run_prefilter_job, uploaded_file.getvalue(), uploaded_file.type or "image/jpeg",
+            get_upload_precheck(uploaded_file), key[1], fallback_order(st.session_state.prefilter_model, chain), CIRCUIT_BREAKERS)}
+        # Evict the oldest jobs whose cost is already booked
+        booked = [job_key for job_key, job in jobs.items() if job["ledger"] is not None]
+        for job_key in booked[:max(len(jobs) - EAGER_PREFILTER_CACHE_SIZE, 0)]:
+            del jobs[job_key]
+    return jobs[key]
+
+
+def find_session_duplicate(sha, phash):
+    """An earlier upload of this session that an upload repeats, or None.
+
+    "exact" duplicates (same content hash) of an iteration or a rejected upload
+    reuse its verdict. Near-duplicates of an iteration (perceptual hash) are
+    only pointed out: the upload still goes through the image check.
+    """
+    for i, iteration in enumerate(st.session_state.iterations):
+        if iteration.get("image_sha256") == sha:
+            return {"kind": "iteration", "index": i, "exact": True}
+    for i, rejected in enumerate(st.session_state.rejected_uploads):
+        if rejected["sha256"] == sha:
+            return {"kind": "rejected", "index": i, "exact": True}
+    key, _ = find_near_duplicate(phash, [(i, iteration.get("phash"))
+                                         for i, iteration in enumerate(st.session_state.iterations)])
+    if key is None:
+        return None
+    return {"kind": "iteration", "index": key, "exact": False}
+
+
+def remember_rejection(upload_sha, message, agent1_data=None):
+    """Keeps a rejection verdict so re-uploads of the same file reuse it"""
+    if upload_sha:
+        st.session_state.rejected_uploads.append(
+            {"sha256": upload_sha, "message": message, "agent1_data": agent1_data})
+
+
+def record_call_cost(call_ledger, call_type, model, usage, elapsed=None):
+    """Records one model call in the iteration ledger and the session-wide ledger.
+
+    A coalesced call (another caller's request answered it) stays out of the
+    router statistics; the caller that made the request records it.
+    """
+    entry = make_ledger_entry(call_type, model, usage, PRICE_TABLE, elapsed)
+    call_ledger.append(entry)
+    st.session_state.cost_ledger.append(entry)
+    if call_type in ("standalone", "comparison") and elapsed is not None and not entry.get("coalesced"):
+        MODEL_ROUTER.stats.record(model, call_type, elapsed, True, entry["cost_usd"])
+    return entry
+
+
+def is_shared_result(result):
+    """True for an attempt result `(text, usage, ...)` that a coalesced call produced"""
+    return bool(result[1].get("coalesced"))
+
+
+def record_call_failure(call_type, model, elapsed):
+    """Reports a failed evaluation call to the model router statistics"""
+    if call_type in ("standalone", "comparison"):
+        MODEL_ROUTER.stats.record(model, call_type, elapsed, False)
+
+
+def start_deadline(mode):
+    """(deadline, budget_s) for an evaluation in `mode` ("standalone"/"comparison"/"ensemble")"""
+    return make_deadline(EVALUATION_DEADLINE_CONFIG[mode])
+
+
+def call_with_fallback(call_type, selected_model, call_ledger, make_call, deadline=None):
+    """Runs `make_call(model, timeout) -> (text, usage)` on the selected model, then down the fallback chain.
+
+    Models with an open circuit are skipped. Every attempt is recorded in the
+    cost ledger / router statistics (except ones another caller's identical
+    request answered or failed) and gets a timeout from the remaining
+    `deadline` budget. Returns (text, served_model, failures).
+    """
+    chain_key = "prefilter" if call_type.startswith("agent") else call_type
+    chain = FALLBACK_CHAIN_CONFIG.get(chain_key, []) if st.session_state.fallback_enabled else []
+    call_timeout(deadline, call_type)  # Fail fast before touching any circuit breaker
+
+    def attempt(model):
+        timeout = call_timeout(deadline, call_type)
+        call_start = time.perf_counter()
+        try:
+            text, usage = make_call(model, timeout)
+        except CoalescedError:
+            raise
+        except Exception:
+            record_call_failure(call_type, model, time.perf_counter() - call_start)
+            raise
+        record_call_cost(call_ledger, call_type, model, usage, time.perf_counter() - call_start)
+        return text, usage
+
+    (text, _), served_model, failures = run_with_fallback(
+        fallback_order(selected_model, chain), attempt, CIRCUIT_BREAKERS,
+        retryable=(requests.exceptions.RequestException,), is_shared=is_shared_result)
+    return text, served_model, failures
+
+
+def show_fallback_notice(selected_model, served_model, failures):
+    """Tells the user when a fallback model served the request"""
+    if served_model != selected_model:
+        reasons = "; ".join(f"{model}: {type(error).__name__}" for model, error in failures)
+        st.warning(f"⚠️ {selected_model} unavailable ({reasons or 'circuit open'}), served by {served_model}")
+
+
+def reject_if_gate_failed(gate_data, model, call_ledger, upload_sha, time_start, deadline=None):
+    """Shows the rejection for censored / non-portrait gate results; returns True if rejected.
+
+    Uses the gate's own REJECTION_MESSAGE when present, otherwise asks agent2/agent3
+    (falling back to a generic message if that call fails or the budget is spent).
+    """
+    rejection_message = gate_data.pop("REJECTION_MESSAGE", None)
+    # Agent2: censored content, agent3: not a portrait
+    call_type = rejection_call_type(gate_data)
+    if call_type is None:
+        return False
+    make_message = (call_agent2_censored_message if call_type == "agent2"
+                    else call_agent3_not_portrait_message)
+    fallback_message = REJECTION_FALLBACK_MESSAGES[call_type]
+
+    if not rejection_message:
+        try:
+            rejection_message, _, _ = call_with_fallback(
+                call_type, model, call_ledger,
+                lambda m, timeout: make_message(
+                    API_KEY, json.dumps(gate_data, indent=2),
+                    output_language=st.session_state.output_language,
+                    model=m,
+                    reasoning_effort=st.session_state.reasoning_effort,
+                    timeout=timeout
+                ), deadline)
+        except (requests.exceptions.RequestException, DeadlineExceeded) as e:
+            st.caption(f"⚠️ Rejection message unavailable ({e}), showing the default one")
+    st.error(rejection_message or fallback_message)
+    remember_rejection(upload_sha, rejection_message or fallback_message, gate_data)
+    elapsed = time.perf_counter() - time_start
+    st.caption(
+        f"⏱️ Total time: {elapsed:.1f}s | 💵 {format_cost(summarize_ledger(call_ledger)['cost_usd'])}")
+    return True
+
+
+def iteration_language(iteration):
+    """Language an iteration was evaluated in (the current one for iterations saved without it)"""
+    return iteration.get("output_language") or st.session_state.output_language
+
+
+def past_iteration_languages(iteration):
+    """Languages an earlier iteration can be shown in besides its own: the current output and extra ones"""
+    languages = dict.fromkeys([st.session_state.output_language, *st.session_state.extra_languages])
+    return [language for language in languages if language != iteration_language(iteration)]
+
+
+def translate_iteration(iteration, languages, call_ledger, deadline=None):
+    """Adds translations for `languages` missing from the iteration's cache; returns them all.
+
+    Translates from the language the iteration was evaluated in. Failed or late
+    translations are skipped (the original evaluation is still shown).
+    """
+    source_language = iteration_language(iteration)
+    translations = dict(iteration.get("translations") or {})
+    missing = [language for language in languages
+               if language not in translations and language != source_language]
+    if not missing:
+        return translations
+    with st.spinner(f"🌐 Translating feedback into {', '.join(missing)}..."):
+        results = translate_evaluation_concurrently(
+            API_KEY, iteration["evaluation"], iteration.get("parsed_response"),
+            source_language, missing, st.session_state.translation_model,
+            call_timeout(deadline, "translation")[1])
+    for result in results:
+        if result["usage"]:
+            record_call_cost(call_ledger, "translation", st.session_state.translation_model,
+                             result["usage"], result["elapsed"])
+        if result["translation"]:
+            translations[result["language"]] = result["translation"]
+        else:
+            st.caption(f"⚠️ No {result['language']} translation: {result['error']}")
+    iteration["translations"] = translations
+    return translations
+
+
+def translate_past_iteration(iteration):
+    """Translates an earlier iteration into the missing languages and saves them to the store"""
+    details = get_iteration_details(iteration)
+    call_ledger = []
+    translations = translate_iteration(
+        {"evaluation": iteration["evaluation"], "parsed_response": details.get("parsed_response"),
+         "translations": iteration.get("translations") or details.get("translations"),
+         "output_language": iteration_language(iteration)},
+        past_iteration_languages(iteration), call_ledger)
+    iteration["translations"] = translations
+    forget_export_item(iteration)
+    bump_iterations_version()
+    if SESSION_STORE is not None and translations:
+        try:
+            SESSION_STORE.save_translations(
+                st.session_state.session_id, iteration["iteration_number"], translations)
+        except sqlite3.Error as e:
+            st.warning(f"Could not save translations to history: {e}")
+    return translations
+
+
+def display_translated_evaluations(evaluation, translations, is_comparison=False,
+                                   parsed_response=None, raw_response=None):
+    """display_evaluation, with one tab per language when translations exist"""
+    if not translations:
+        display_evaluation(evaluation, is_comparison, parsed_response, raw_response)
+        return
+    tabs = st.tabs([st.session_state.output_language, *translations])
+    with tabs[0]:
+        display_evaluation(evaluation, is_comparison, parsed_response, raw_response)
+    for tab, translation in zip(tabs[1:], translations.values()):
+        with tab:
+            summary = translation.get("progress_summary")
+            display_evaluation(translation["evaluation"], is_comparison,
+                               {"progress_summary": summary} if summary else None)
+
+
+def build_system_prompt(mode, single_pass=False):
+    """Evaluation system prompt for `mode`: the precompiled variant, or the template filled as written"""
+    return evaluation_system_prompt(
+        mode, st.session_state.skill_level, st.session_state.output_language,
+        COMPILED_PROMPTS if st.session_state.compiled_prompts else None, single_pass)
+
+
+def get_score_index():
+    """Session ScoreIndex, rebuilt only if it no longer matches the iterations list"""
+    index = st.session_state.score_index
+    if index is None or len(index) != len(st.session_state.iterations):
+        index = ScoreIndex.from_evaluations(
+            [iteration.get("evaluation") for iteration in st.session_state.iterations])
+        st.session_state.score_index = index
+    return index
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_cohort_statistics():
+    """Per-category statistics over all persisted sessions (refreshed every minute)"""
+    session_ids, _, scores = build_cohort_matrix(SESSION_STORE.load_score_rows())
+    return cohort_statistics(session_ids, scores)
+
+
+def display_progress_analytics():
+    """Per-category score trends, deltas and cohort comparison"""
+    index = get_score_index()
+    scores = index.scores
+    iteration_numbers = list(range(1, len(index) + 1))
+
+    st.markdown("**Average score**")
+    st.line_chart({"Iteration": iteration_numbers, "Average": index.averages()},
+                  x="Iteration", height=180)
+
+    st.markdown("**Scores by category**")
+    st.line_chart({"Iteration": iteration_numbers,
+                   **{category: scores[:, col] for col, category in enumerate(index.categories)}},
+                  x="Iteration", height=260)
+
+    latest = scores[-1]
+    st.dataframe({
+        "Category": index.categories,
+        "Latest": latest,
+        "Δ previous": index.deltas()[-1],
+        "Δ first": index.deltas("first")[-1],
+        "Trend / iteration": index.trends(),
+    }, hide_index=True, use_container_width=True)
+
+    if SESSION_STORE is not None:
+        cohort = load_cohort_statistics()
+        if cohort["sessions"]:
+            st.markdown(f"**Cohort ({cohort['sessions']} sessions, latest scores)**")
+            st.dataframe({
+                "Category": index.categories,
+                "This session": latest,
+                "Cohort median": cohort["median"],
+                "Cohort P25": cohort["p25"],
+                "Cohort P75": cohort["p75"],
+                "Cohort mean gain": cohort["mean_gain"],
+            }, hide_index=True, use_container_width=True)
 
 
 def get_score_class(score):
@@ -391,92 +893,220 @@ def get_score_class(score):
     return "score-low"
 
 
-def get_export_data(iterations):
-    """Prepares data for export (without images)"""
-    export_list = []
-    for i, iteration in enumerate(iterations):
-        export_item = {
-            "iteration": i + 1,
-            "image_name": iteration.get("image_name", "Unknown"),
-            "timestamp": iteration.get("timestamp", "N/A"),
-            "evaluation": iteration.get("evaluation"),
-            "parsed_response": iteration.get("parsed_response"),
-            "raw_response": iteration.get("raw_response"),
+def bump_iterations_version():
+    """Marks `st.session_state.iterations` as changed (invalidates cached exports)"""
+    st.session_state.iterations_version += 1
+
+
+def build_export_item(iterations, i):
+    """Export record for one iteration (without images)"""
+    iteration = iterations[i]
+    details = get_iteration_details(iteration)
+    return {
+        "iteration": i + 1,
+        "image_name": iteration.get("image_name", "Unknown"),
+        "timestamp": iteration.get("timestamp", "N/A"),
+        "evaluation": iteration.get("evaluation"),
+        "parsed_response": details.get("parsed_response"),
+        "raw_response": details.get("raw_response"),
+        "translations": details.get("translations"),
+        "cost": iteration.get("cost"),
+    }
+
+
+def build_log_item(iterations, i):
+    """Full API log record for one iteration (without base64 images)"""
+    iteration = iterations[i]
+    details = get_iteration_details(iteration)
+    is_comparison = i > 0
+
+    # Build user content description (without base64)
+    if is_comparison:
+        # Get comparison data for this iteration
+        comparison_info = {
+            "first_iteration": {
+                "image_name": iterations[0].get("image_name", "Unknown"),
+                "evaluation": iterations[0].get("evaluation")
+            },
+            "previous_iteration": {
+                "image_name": iterations[i-1].get("image_name", "Unknown") if i > 1 else None,
+                "evaluation": iterations[i-1].get("evaluation") if i > 1 else None
+            } if i > 1 else None,
+            "current_iteration": {
+                "image_name": iteration.get("image_name", "Unknown")
+            }
         }
-        export_list.append(export_item)
-    return export_list
+        user_content_log = {
+            "type": "comparison",
+            "comparison_data": comparison_info
+        }
+    else:
+        user_content_log = {
+            "type": "standalone",
+            "image_name": iteration.get("image_name", "Unknown")
+        }
+
+    # Get actual system_prompt that was sent to API (with substituted variables)
+    actual_system_prompt = details.get("system_prompt")
+    if not actual_system_prompt:
+        # Fallback to template name if not saved
+        actual_system_prompt = "COMPARISON_PROMPT" if is_comparison else "EVALUATE_PORTRAIT_STANDALONE"
+
+    # Get model used for this iteration
+    model_used = iteration.get("model", "openai/gpt-5.2")
+
+    return {
+        "iteration_number": i + 1,
+        "timestamp": iteration.get("timestamp", "N/A"),
+        "image_name": iteration.get("image_name", "Unknown"),
+        "mode": "comparison" if is_comparison else "standalone",
+        "api_input": {
+            "model": model_used,
+            "temperature": 0.1,
+            "max_tokens": OPENROUTER_MAX_TOKENS,
+            "reasoning_effort": iteration.get(
+                "reasoning_effort", "none" if model_used == "openai/gpt-5.2" else None),
+            # Use actual prompt with substituted variables
+            "system_prompt": actual_system_prompt,
+            "user_content": user_content_log
+        },
+        "api_output": {
+            "raw_response": details.get("raw_response"),
+            "parsed_response": details.get("parsed_response"),
+            "evaluation": iteration.get("evaluation")
+        },
+        "translations": details.get("translations"),
+        "calls": details.get("calls") or [],
+        "cost": iteration.get("cost"),
+        "ensemble": iteration.get("ensemble"),
+        "requested_model": iteration.get("requested_model"),
+        "fallback_failures": iteration.get("fallback_failures")
+    }
 
 
-def get_full_logs(iterations):
-    """Prepares complete API logs for export (without base64 images)"""
-    logs = {
+def get_full_logs_header(iterations):
+    """Top-level fields of the full logs export"""
+    return {
         "export_timestamp": datetime.now().isoformat(),
         "total_iterations": len(iterations),
-        "iterations": []
+        "session_cost": summarize_ledger(st.session_state.cost_ledger),
     }
 
-    for i, iteration in enumerate(iterations):
-        is_comparison = i > 0
-
-        # Build user content description (without base64)
-        if is_comparison:
-            # Get comparison data for this iteration
-            comparison_info = {
-                "first_iteration": {
-                    "image_name": iterations[0].get("image_name", "Unknown"),
-                    "evaluation": iterations[0].get("evaluation")
-                },
-                "previous_iteration": {
-                    "image_name": iterations[i-1].get("image_name", "Unknown") if i > 1 else None,
-                    "evaluation": iterations[i-1].get("evaluation") if i > 1 else None
-                } if i > 1 else None,
-                "current_iteration": {
-                    "image_name": iteration.get("image_name", "Unknown")
-                }
-            }
-            user_content_log = {
-                "type": "comparison",
-                "comparison_data": comparison_info
-            }
-        else:
-            user_content_log = {
-                "type": "standalone",
-                "image_name": iteration.get("image_name", "Unknown")
-            }
 
-        # Get actual system_prompt that was sent to API (with substituted variables)
-        actual_system_prompt = iteration.get("system_prompt")
-        if not actual_system_prompt:
-            # Fallback to template name if not saved
-            actual_system_prompt = "COMPARISON_PROMPT" if is_comparison else "EVALUATE_PORTRAIT_STANDALONE"
-
-        # Get model used for this iteration
-        model_used = iteration.get("model", "openai/gpt-5.2")
-
-        iteration_log = {
-            "iteration_number": i + 1,
-            "timestamp": iteration.get("timestamp", "N/A"),
-            "image_name": iteration.get("image_name", "Unknown"),
-            "mode": "comparison" if is_comparison else "standalone",
-            "api_input": {
-                "model": model_used,
-                "temperature": 0.1,
-                "max_tokens": OPENROUTER_MAX_TOKENS,
-                "reasoning_effort": "none" if model_used == "openai/gpt-5.2" else None,
-                # Use actual prompt with substituted variables
-                "system_prompt": actual_system_prompt,
-                "user_content": user_content_log
-            },
-            "api_output": {
-                "raw_response": iteration.get("raw_response"),
-                "parsed_response": iteration.get("parsed_response"),
-                "evaluation": iteration.get("evaluation")
-            }
-        }
+EXPORT_BUILDERS = {
+    # kind: (item builder, header builder or None for a bare JSON list)
+    "history": (build_export_item, None),
+    "full_logs": (build_log_item, get_full_logs_header),
+}
+
+
+def encode_json_item(item, depth):
+    """Pretty-prints one list element, indented to sit at `depth` inside the document"""
+    text = json.dumps(item, indent=2, ensure_ascii=False, default=str)
+    pad = "  " * depth
+    return (pad + text.replace("\n", "\n" + pad)).encode("utf-8")
+
+
+def stream_export(kind, iterations, item_chunks):
+    """Yields an export document as UTF-8 chunks, one iteration at a time.
+
+    `item_chunks` memoizes encoded iterations by (index, timestamp), so only new
+    ones are serialized on a rebuild; an iteration changed after its evaluation
+    (a later translation) is dropped from it with forget_export_item.
+    """
+    build_item, build_header = EXPORT_BUILDERS[kind]
+    depth = 1
+    if build_header is None:
+        yield b"[\n"
+    else:
+        header = json.dumps(build_header(iterations), indent=2,
+                            ensure_ascii=False, default=str)
+        # Reopen the header object and append the "iterations" list to it
+        yield header[:header.rfind("}")].rstrip().encode("utf-8")
+        yield b',\n  "iterations": [\n'
+        depth = 2
+    for i in range(len(iterations)):
+        key = (i, iterations[i].get("timestamp"))
+        if key not in item_chunks:
+            item_chunks[key] = encode_json_item(build_item(iterations, i), depth)
+        yield item_chunks[key]
+        yield b",\n" if i < len(iterations) - 1 else b"\n"
+    yield b"]" if build_header is None else b"  ]\n}"
+
+
+def forget_export_item(iteration):
+    """Drops an iteration's memoized export chunks so the next export re-serializes it"""
+    index = next((i for i, item in enumerate(st.session_state.iterations) if item is iteration), None)
+    for cached in st.session_state.export_cache.values():
+        for key in [key for key in cached.get("chunks", ()) if key[0] == index]:
+            del cached["chunks"][key]
+
+
+def get_cached_export(kind):
+    """Returns serialized export bytes, or None if not built for the current iterations version"""
+    cached = st.session_state.export_cache.get(kind)
+    if cached and cached["version"] == st.session_state.iterations_version:
+        return cached["data"]
+    return None
+
+
+def build_cached_export(kind):
+    """Serializes an export on demand and memoizes it by iterations version"""
+    cached = st.session_state.export_cache.get(kind) or {"chunks": {}}
+    buffer = io.BytesIO()
+    for chunk in stream_export(kind, st.session_state.iterations, cached["chunks"]):
+        buffer.write(chunk)
+    st.session_state.export_cache[kind] = {
+        "version": st.session_state.iterations_version,
+        "data": buffer.getvalue(),
+        "chunks": cached["chunks"],
+    }
+    return st.session_state.export_cache[kind]["data"]
+
+
+def build_session_archive(compression, include_images):
+    """Compressed JSONL archive of the session (optionally with images), memoized by iterations version"""
+    kind = f"archive:{compression}:{int(include_images)}"
+    cached = get_cached_export(kind)
+    if cached is not None:
+        return cached
+
+    iterations = st.session_state.iterations
+
+    def records():
+        for iteration in iterations:
+            image_bytes, mime_type = get_iteration_image(iteration) if include_images else (None, None)
+            yield make_archive_record(iteration, get_iteration_details(iteration),
+                                      image_bytes, mime_type)
+
+    header = make_archive_header(st.session_state.session_id, {
+        "output_language": st.session_state.output_language,
+        "skill_level": st.session_state.skill_level,
+    }, len(iterations))
+    st.session_state.export_cache[kind] = {
+        "version": st.session_state.iterations_version,
+        "data": write_session_archive(header, records(), compression),
+    }
+    return st.session_state.export_cache[kind]["data"]
 
-        logs["iterations"].append(iteration_log)
 
-    return logs
+def display_ensemble_summary(ensemble_info):
+    """Shows which models answered and where their scores disagree"""
+    answered = [r["model"] for r in ensemble_info["responses"] if r["error"] is None]
+    failed = [r for r in ensemble_info["responses"] if r["error"] is not None]
+    st.caption(f"🧮 Ensemble ({ensemble_info['aggregation']}) of: {', '.join(answered)}")
+    for response in failed:
+        st.caption(f"⚠️ {response['model']} skipped: {response['error']}")
+
+    disagreements = {category: detail for category, detail in ensemble_info["categories"].items()
+                     if detail["disagreement"]}
+    if disagreements:
+        st.warning("Models disagree on: " + ", ".join(
+            f"{category} (spread {detail['spread']})" for category, detail in disagreements.items()))
+    with st.expander("🔍 Per-model scores", expanded=False):
+        for category, detail in ensemble_info["categories"].items():
+            scores = " | ".join(f"{model}: {score}" for model, score in detail["scores"].items())
+            st.write(f"• {category}: **{detail['aggregate']}** ({scores})")
 
 
 def display_evaluation(evaluation, is_comparison=False, parsed_response=None, raw_response=None):
@@ -527,154 +1157,488 @@ def display_evaluation(evaluation, is_comparison=False, parsed_response=None, ra
             st.code(raw_response, language="json")
 
 
+def record_section_time(name, started):
+    """Adds one UI section timing (since perf_counter value `started`) to the rerun profile"""
+    st.session_state.rerun_profile.append((name, (time.perf_counter() - started) * 1000))
+
+
+@contextmanager
+def profile_section(name):
+    """Times the enclosed UI section for the rerun profiler"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_section_time(name, started)
+
+
+def display_rerun_profile():
+    """Per-section render times of recent reruns (last, mean, p95)"""
+    timings = {}
+    for name, elapsed_ms in st.session_state.rerun_profile:
+        timings.setdefault(name, []).append(elapsed_ms)
+    rows = []
+    for name, values in timings.items():
+        ordered = sorted(values)
+        rows.append({
+            "section": name,
+            "renders": len(values),
+            "last_ms": round(values[-1], 1),
+            "mean_ms": round(statistics.fmean(values), 1),
+            "p95_ms": round(ordered[min(int(0.95 * len(ordered)), len(ordered) - 1)], 1),
+        })
+    rows.sort(key=lambda row: -row["mean_ms"])
+    st.dataframe(rows, hide_index=True, use_container_width=True)
+    st.caption("Fragment reruns (settings, sidebar, history) appear without a matching 'script' entry")
+
+
+# Resume a persisted session from `?session=<id>`, otherwise start a new one
+if "session_id" not in st.session_state:
+    requested_session = st.query_params.get("session")
+    if requested_session and SESSION_STORE is not None and SESSION_STORE.session_exists(requested_session):
+        load_persisted_session(requested_session)
+    else:
+        start_new_session()
+
+
 # === MAIN INTERFACE ===
 
 st.markdown("<h1 class='main-title'>🎨 Portrait Evaluation Assistant</h1>",
             unsafe_allow_html=True)
 st.markdown("<p class='subtitle'>Upload portraits and receive professional feedback with progress tracking</p>", unsafe_allow_html=True)
 
-# Sidebar for statistics only (no API key)
-with st.sidebar:
-    st.header("📊 Statistics")
-    st.metric("Number of Iterations", len(st.session_state.iterations))
-
-    if st.session_state.iterations:
-        first_avg = calculate_average_score(
-            st.session_state.iterations[0].get("evaluation"))
-        last_avg = calculate_average_score(
-            st.session_state.iterations[-1].get("evaluation"))
-        delta = last_avg - first_avg if last_avg and first_avg else 0
-
-        st.metric("First Score", f"{first_avg:.1f}" if first_avg else "N/A")
-        st.metric("Latest Score", f"{last_avg:.1f}" if last_avg else "N/A",
-                  delta=f"{delta:+.1f}" if delta else None)
-
-    st.divider()
-
-    if st.button("🗑️ Clear History", type="secondary"):
-        st.session_state.iterations = []
-        st.session_state.chat_history = []
-        st.rerun()
-
-    # Export data (without images)
-    if st.session_state.iterations:
-        export_data = get_export_data(st.session_state.iterations)
-        export_json = json.dumps(
-            export_data, indent=2, ensure_ascii=False, default=str)
-        st.download_button(
-            "📥 Export History",
-            export_json,
-            file_name=f"portrait_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-            mime="application/json"
+# Sidebar for statistics only (no API key); a fragment, so its widgets rerun only the sidebar
+@st.fragment
+def render_sidebar():
+    """Statistics, model health, session and export controls"""
+    with profile_section("sidebar"):
+        st.header("📊 Statistics")
+        st.metric("Number of Iterations", len(st.session_state.iterations))
+
+        if st.session_state.iterations:
+            averages = get_score_index().averages()
+            first_avg = averages[0]
+            last_avg = averages[-1]
+            delta = last_avg - first_avg if last_avg and first_avg else 0
+
+            st.metric("First Score", f"{first_avg:.1f}" if first_avg else "N/A")
+            st.metric("Latest Score", f"{last_avg:.1f}" if last_avg else "N/A",
+                      delta=f"{delta:+.1f}" if delta else None)
+
+        if st.session_state.cost_ledger:
+            session_cost = summarize_ledger(st.session_state.cost_ledger)
+            st.metric("Session Cost", format_cost(session_cost["cost_usd"]),
+                      help="All model calls this session, including image checks and rejected uploads")
+            st.caption(
+                f"🔢 {session_cost['calls']} calls | "
+                f"{session_cost['prompt_tokens']} prompt "
+                f"({session_cost['cached_tokens']} cached) | "
+                f"{session_cost['completion_tokens']} completion "
+                f"({session_cost['reasoning_tokens']} reasoning) tokens")
+            if session_cost["unpriced_calls"]:
+                st.caption(
+                    f"⚠️ {session_cost['unpriced_calls']} calls used models without a price entry")
+
+        with st.expander("🧭 Model health", expanded=False):
+            health_rows = []
+            for model in MODEL_ROUTER.tiers:
+                for call_type in ("standalone", "comparison"):
+                    snapshot = MODEL_ROUTER.stats.snapshot(model, call_type)
+                    if snapshot["samples"]:
+                        health_rows.append({"model": model, "call": call_type, **snapshot})
+            if health_rows:
+                st.dataframe(health_rows, hide_index=True, use_container_width=True)
+            else:
+                st.caption("No evaluation calls observed yet")
+            # Same model via different providers: the proxy hop shows up as latency
+            provider_latencies = {}
+            for entry in st.session_state.cost_ledger:
+                if entry.get("elapsed_s") is not None:
+                    provider_latencies.setdefault(
+                        (entry.get("provider", "openrouter"), entry["model"]), []).append(entry["elapsed_s"])
+            if len({provider for provider, _ in provider_latencies}) > 1:
+                st.dataframe([{"provider": provider, "model": model, "calls": len(latencies),
+                               "median_s": round(statistics.median(latencies), 2)}
+                              for (provider, model), latencies in sorted(provider_latencies.items())],
+                             hide_index=True, use_container_width=True)
+            flight_stats = MODEL_CALLS.stats()
+            if flight_stats["coalesced"]:
+                st.caption(f"🔗 {flight_stats['coalesced']} identical concurrent calls shared "
+                           f"an in-flight request (of {flight_stats['calls']} made by this server)")
+            if AUDIT_LOG is not None:
+                audit_stats = AUDIT_LOG.stats()
+                st.caption(f"📝 Audit log: {audit_stats['written']} written, {audit_stats['queued']} queued, "
+                           f"{audit_stats['dropped']} dropped")
+            tripped = {model: state for model, state in CIRCUIT_BREAKERS.states().items()
+                       if state != "closed"}
+            if tripped:
+                st.caption("🔌 Circuits: " + ", ".join(
+                    f"{model} {state.replace('_', '-')}" for model, state in sorted(tripped.items())))
+
+        st.divider()
+
+        if SESSION_STORE is not None:
+            st.caption(f"🔖 Session ID: `{st.session_state.session_id}`")
+            resume_id = st.text_input(
+                "Resume session", placeholder="Session ID",
+                help="Continue a saved session (history and comparison baseline) by its ID")
+            if resume_id and resume_id.strip() != st.session_state.session_id and st.button("↩️ Resume"):
+                if SESSION_STORE.session_exists(resume_id.strip()):
+                    load_persisted_session(resume_id.strip())
+                    st.rerun()
+                else:
+                    st.error("Session not found")
+
+        if st.button("🗑️ Clear History", type="secondary"):
+            start_new_session()
+            st.rerun()
+
+        # Export data (without images), serialized only on demand
+        if st.session_state.iterations:
+            exports_ready = all(get_cached_export(kind) is not None
+                                for kind in EXPORT_BUILDERS)
+            if not exports_ready and st.button("📦 Prepare Exports"):
+                with st.spinner("Preparing exports..."):
+                    for kind in EXPORT_BUILDERS:
+                        build_cached_export(kind)
+                exports_ready = True
+
+            if exports_ready:
+                st.download_button(
+                    "📥 Export History",
+                    get_cached_export("history"),
+                    file_name=f"portrait_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                    mime="application/json"
+                )
+
+                # Export full logs
+                st.download_button(
+                    "📋 Export Full Logs",
+                    get_cached_export("full_logs"),
+                    file_name=f"portrait_full_logs_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                    mime="application/json"
+                )
+
+        # Compressed session archive: resumable on another machine via import
+        with st.expander("💾 Session archive", expanded=False):
+            if st.session_state.iterations:
+                archive_compression = st.selectbox(
+                    "Compression", options=list(ARCHIVE_COMPRESSIONS), key="archive_compression")
+                archive_images = st.checkbox(
+                    "Include images", value=True, key="archive_images",
+                    help="Needed to continue comparison mode after import")
+                archive_kind = f"archive:{archive_compression}:{int(archive_images)}"
+                if get_cached_export(archive_kind) is None and st.button("📦 Prepare Archive"):
+                    with st.spinner("Compressing session..."):
+                        build_session_archive(archive_compression, archive_images)
+                if get_cached_export(archive_kind) is not None:
+                    st.download_button(
+                        "💾 Download Session Archive",
+                        get_cached_export(archive_kind),
+                        file_name=(f"portrait_session_{st.session_state.session_id}"
+                                   f"{ARCHIVE_COMPRESSIONS[archive_compression]}"),
+                        mime="application/octet-stream"
+                    )
+
+            archive_file = st.file_uploader(
+                "Import session archive", type=["gz", "zst", "jsonl"], key="archive_upload",
+                help="Starts a new session with the archived iterations; no model is called")
+            if archive_file is not None and st.button("📂 Import Archive"):
+                try:
+                    imported = import_session_archive(archive_file.getvalue())
+                except ValueError as e:
+                    st.error(f"Import failed: {e}")
+                else:
+                    st.toast(f"Imported {imported} iterations")
+                    st.rerun()
+
+
+@st.fragment
+def render_settings():
+    """Model, pipeline and feedback settings (a fragment: changing them reruns only this panel)"""
+    with profile_section("settings"):
+        st.header("⚙️ Settings")
+
+        # Model selection for evaluation prompts (vision-capable, fast)
+        # AUTO_MODEL goes last: unknown stored models fall back to index 0, and routing stays opt-in
+        model_options = [
+            "openai/gpt-5.2",
+            "x-ai/grok-4.20-multi-agent-beta",
+            "x-ai/grok-4.20-beta",
+            "openai/gpt-5.2-chat",
+            "anthropic/claude-haiku-4.5",
+            AUTO_MODEL,
+        ]
+
+        col_model1, col_model2 = st.columns(2)
+
+        with col_model1:
+            selected_standalone_model = st.selectbox(
+                "Model for Standalone Evaluation",
+                options=model_options,
+                index=model_options.index(
+                    st.session_state.standalone_model) if st.session_state.standalone_model in model_options else 0,
+                help="Select the model for first portrait evaluation (\"auto\" picks the fastest healthy model)"
+            )
+            st.session_state.standalone_model = selected_standalone_model
+
+        with col_model2:
+            selected_comparison_model = st.selectbox(
+                "Model for Comparison Evaluation",
+                options=model_options,
+                index=model_options.index(
+                    st.session_state.comparison_model) if st.session_state.comparison_model in model_options else 0,
+                help="Select the model for comparison evaluations (\"auto\" picks the fastest healthy model)"
+            )
+            st.session_state.comparison_model = selected_comparison_model
+
+        if AUTO_MODEL in (selected_standalone_model, selected_comparison_model):
+            tier_options = list(QUALITY_TIER_NAMES)
+            st.session_state.quality_tier = st.selectbox(
+                "Quality tier (auto routing)",
+                options=tier_options,
+                index=tier_options.index(st.session_state.quality_tier),
+                help="Auto routing only uses models at or above this tier, preferring the lowest observed latency within the SLOs"
+            )
+
+        # Ensemble: same payload to several models in parallel, scores aggregated per category
+        st.session_state.ensemble_enabled = st.toggle(
+            "Ensemble evaluation",
+            value=st.session_state.ensemble_enabled,
+            help="Send each standalone/comparison evaluation to several models at once and aggregate their scores"
+        )
+        if st.session_state.ensemble_enabled:
+            st.session_state.ensemble_models = st.multiselect(
+                "Ensemble models",
+                options=[m for m in model_options if m != AUTO_MODEL],
+                default=[m for m in st.session_state.ensemble_models if m in model_options],
+                help="Select at least two models; with fewer, the single model selected above is used"
+            )
+            col_aggregation, col_deadline = st.columns(2)
+            with col_aggregation:
+                aggregation_options = ["median", "mean"]
+                st.session_state.ensemble_aggregation = st.selectbox(
+                    "Score aggregation",
+                    options=aggregation_options,
+                    index=aggregation_options.index(st.session_state.ensemble_aggregation),
+                    help="Median is robust to one outlier model; mean uses every score"
+                )
+            with col_deadline:
+                st.session_state.ensemble_deadline = st.number_input(
+                    "Deadline (seconds)",
+                    min_value=10, max_value=600, step=10,
+                    value=int(st.session_state.ensemble_deadline),
+                    help="Aggregate whatever models have answered by then"
+                )
+
+        # Pre-filter model (agent1, agent2, agent3) - fast/cheap for classification
+        prefilter_options = ["openai/gpt-4o-mini",
+                             "openai/gpt-4.1-nano", "openai/gpt-4o", "openai/gpt-5.2"]
+        selected_prefilter = st.selectbox(
+            "Model for Image Check (agent1/2/3)",
+            options=prefilter_options,
+            index=prefilter_options.index(
+                st.session_state.prefilter_model) if st.session_state.prefilter_model in prefilter_options else 0,
+            help="Fast model for initial image classification (portrait/censored check). Default: gpt-4o-mini"
         )
+        st.session_state.prefilter_model = selected_prefilter
 
-        # Export full logs
-        full_logs = get_full_logs(st.session_state.iterations)
-        full_logs_json = json.dumps(
-            full_logs, indent=2, ensure_ascii=False, default=str)
-        st.download_button(
-            "📋 Export Full Logs",
-            full_logs_json,
-            file_name=f"portrait_full_logs_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-            mime="application/json"
+        st.session_state.single_call_prefilter = st.toggle(
+            "Single-call image check",
+            value=st.session_state.single_call_prefilter,
+            help="agent1 also writes the localized rejection message, so rejected uploads need one model call instead of two"
         )
 
-# Main content
-col_main, col_history = st.columns([2, 1])
+        st.session_state.eager_prefilter = st.toggle(
+            "Check image on upload",
+            value=st.session_state.eager_prefilter,
+            help="Start the image check in the background while you look at the preview. "
+                 "Replacing the file before pressing the button can still cost one image-check call."
+        )
 
-with col_main:
-    st.header("⚙️ Settings")
-
-    # Model selection for evaluation prompts (vision-capable, fast)
-    model_options = [
-        "openai/gpt-5.2",
-        "x-ai/grok-4.20-multi-agent-beta",
-        "x-ai/grok-4.20-beta",
-        "openai/gpt-5.2-chat",
-        "anthropic/claude-haiku-4.5",
-    ]
-
-    col_model1, col_model2 = st.columns(2)
-
-    with col_model1:
-        selected_standalone_model = st.selectbox(
-            "Model for Standalone Evaluation",
-            options=model_options,
-            index=model_options.index(
-                st.session_state.standalone_model) if st.session_state.standalone_model in model_options else 0,
-            help="Select the model for first portrait evaluation"
+        st.session_state.single_pass_evaluation = st.toggle(
+            "Single-pass evaluation (trusted accounts)",
+            value=st.session_state.single_pass_evaluation,
+            help="Skip agent1: the evaluation model also checks that the image is an allowed portrait, "
+                 "so accepted uploads need one model call. Rejected images still pay for the evaluation call."
         )
-        st.session_state.standalone_model = selected_standalone_model
-
-    with col_model2:
-        selected_comparison_model = st.selectbox(
-            "Model for Comparison Evaluation",
-            options=model_options,
-            index=model_options.index(
-                st.session_state.comparison_model) if st.session_state.comparison_model in model_options else 0,
-            help="Select the model for comparison evaluations"
+
+        local_precheck_options = {
+            "validate": "Reject unreadable/tiny images locally",
+            "skip_agent1": "Also skip image check for clear portraits",
+            "off": "Off",
+        }
+        st.session_state.local_precheck = st.selectbox(
+            "Local image check",
+            options=list(local_precheck_options),
+            format_func=local_precheck_options.get,
+            index=list(local_precheck_options).index(st.session_state.local_precheck),
+            help="Runs on the server CPU before agent1. Skipping agent1 for images with one large detected face "
+                 "saves a model call but also skips the censored-content check."
         )
-        st.session_state.comparison_model = selected_comparison_model
-
-    # Pre-filter model (agent1, agent2, agent3) - fast/cheap for classification
-    prefilter_options = ["openai/gpt-4o-mini",
-                         "openai/gpt-4.1-nano", "openai/gpt-4o", "openai/gpt-5.2"]
-    selected_prefilter = st.selectbox(
-        "Model for Image Check (agent1/2/3)",
-        options=prefilter_options,
-        index=prefilter_options.index(
-            st.session_state.prefilter_model) if st.session_state.prefilter_model in prefilter_options else 0,
-        help="Fast model for initial image classification (portrait/censored check). Default: gpt-4o-mini"
-    )
-    st.session_state.prefilter_model = selected_prefilter
-
-    st.divider()
-
-    # Reasoning effort (GPT-5 models only; OpenRouter normalizes this as `reasoning.effort`)
-    reasoning_effort_options = ["xhigh", "high", "medium", "low", "minimal", "none"]
-    selected_reasoning_effort = st.selectbox(
-        "Reasoning effort (GPT-5)",
-        options=reasoning_effort_options,
-        index=reasoning_effort_options.index(st.session_state.reasoning_effort)
-        if st.session_state.reasoning_effort in reasoning_effort_options else 0,
-        help="Controls how much effort GPT-5 models spend on reasoning. Higher can improve quality but may be slower/costlier."
-    )
-    st.session_state.reasoning_effort = selected_reasoning_effort
-
-    st.divider()
-
-    # Language selector
-    language_options = {
-        "English": "English",
-        "Ukrainian": "Ukrainian",
-        "Russian": "Russian",
-        "Spanish": "Spanish",
-        "French": "French",
-        "German": "German"
-    }
 
-    selected_language = st.selectbox(
-        "Output Language",
-        options=list(language_options.keys()),
-        index=list(language_options.keys()).index(
-            st.session_state.output_language) if st.session_state.output_language in language_options else 0,
-        help="Select the language for evaluation feedback"
-    )
-    st.session_state.output_language = selected_language
-
-    # Skill level (audience complexity)
-    skill_level_options = ["beginner", "hobbyist", "trained/advanced"]
-    selected_skill_level = st.selectbox(
-        "Skill Level (Audience)",
-        options=skill_level_options,
-        index=skill_level_options.index(
-            st.session_state.skill_level) if st.session_state.skill_level in skill_level_options else 0,
-        help="Beginner: very simple words, 12-14 yo. Hobbyist: accessible with some art terms. Trained/Advanced: professional terminology, deeper analysis."
-    )
-    st.session_state.skill_level = selected_skill_level
+        st.session_state.fallback_enabled = st.toggle(
+            "Fall back to other models on failure",
+            value=st.session_state.fallback_enabled,
+            help="If the selected model errors or its circuit breaker is open, retry on the next model of the fallback chain"
+        )
+
+        st.divider()
+
+        # Reasoning effort (GPT-5 models only; OpenRouter normalizes this as `reasoning.effort`)
+        reasoning_effort_options = ["xhigh", "high", "medium", "low", "minimal", "none"]
+        selected_reasoning_effort = st.selectbox(
+            "Reasoning effort (GPT-5)",
+            options=reasoning_effort_options,
+            index=reasoning_effort_options.index(st.session_state.reasoning_effort)
+            if st.session_state.reasoning_effort in reasoning_effort_options else 0,
+            help="Controls how much effort GPT-5 models spend on reasoning. Higher can improve quality but may be slower/costlier."
+        )
+        st.session_state.reasoning_effort = selected_reasoning_effort
+
+        st.divider()
+
+        # Language selector
+        language_options = {language: language for language in OUTPUT_LANGUAGES}
+
+        selected_language = st.selectbox(
+            "Output Language",
+            options=list(language_options.keys()),
+            index=list(language_options.keys()).index(
+                st.session_state.output_language) if st.session_state.output_language in language_options else 0,
+            help="Select the language for evaluation feedback"
+        )
+        st.session_state.output_language = selected_language
+
+        st.session_state.extra_languages = st.multiselect(
+            "Also translate feedback into",
+            options=[language for language in OUTPUT_LANGUAGES if language != selected_language],
+            default=[language for language in st.session_state.extra_languages
+                     if language != selected_language],
+            help=f"Evaluated once in {selected_language}, then translated concurrently by "
+                 f"{st.session_state.translation_model} (scores are never re-estimated)"
+        )
+
+        # Skill level (audience complexity)
+        skill_level_options = ["beginner", "hobbyist", "trained/advanced"]
+        selected_skill_level = st.selectbox(
+            "Skill Level (Audience)",
+            options=skill_level_options,
+            index=skill_level_options.index(
+                st.session_state.skill_level) if st.session_state.skill_level in skill_level_options else 0,
+            help="Beginner: very simple words, 12-14 yo. Hobbyist: accessible with some art terms. Trained/Advanced: professional terminology, deeper analysis."
+        )
+        st.session_state.skill_level = selected_skill_level
+
+        st.session_state.compiled_prompts = st.toggle(
+            "Compact prompts",
+            value=st.session_state.compiled_prompts,
+            help="Send the precompiled evaluation prompts (same rules, whitespace minified)"
+        )
+        with st.expander("🧾 Prompt token profile", expanded=False):
+            for mode in PROMPT_TEMPLATES:
+                compiled = COMPILED_PROMPTS[(mode, st.session_state.skill_level, st.session_state.output_language)]
+                st.caption(f"**{mode}**: {compiled['tokens']} tokens compiled "
+                           f"(template as written: {compiled['raw_tokens']})")
+                st.dataframe(sorted(compiled["sections"], key=lambda section: -section["tokens"]),
+                             hide_index=True, use_container_width=True)
+
+        st.divider()
+
+
+@st.fragment
+def render_history():
+    """Paginated iteration history (a fragment: paging and toggles rerun only this panel)"""
+    with profile_section("history"):
+        st.header("📜 Iteration History")
+
+        if not st.session_state.iterations:
+            st.info("History is empty. Upload your first portrait!")
+        else:
+            # Only the current page is rendered; raw JSON and images load when toggled on
+            total = len(st.session_state.iterations)
+            page_count = (total + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE
+            page = min(st.session_state.history_page, page_count - 1)
+            newest_idx = total - page * HISTORY_PAGE_SIZE
+            oldest_idx = max(newest_idx - HISTORY_PAGE_SIZE, 0) + 1
+
+            if page_count > 1:
+                col_newer, col_page, col_older = st.columns([1, 2, 1])
+                with col_newer:
+                    if st.button("◀", disabled=page == 0, help="Newer iterations"):
+                        st.session_state.history_page = page - 1
+                        st.rerun(scope="fragment")
+                with col_page:
+                    st.caption(
+                        f"Iterations {oldest_idx}–{newest_idx} of {total} (page {page + 1}/{page_count})")
+                with col_older:
+                    if st.button("▶", disabled=page == page_count - 1, help="Older iterations"):
+                        st.session_state.history_page = page + 1
+                        st.rerun(scope="fragment")
+
+            if total > 1 and st.toggle("📈 Progress analytics", key="show_progress_analytics"):
+                display_progress_analytics()
+
+            averages = get_score_index().averages()
+            for idx in range(newest_idx, oldest_idx - 1, -1):
+                iteration = st.session_state.iterations[idx - 1]
+                avg_score = averages[idx - 1]
+
+                with st.expander(f"**Iteration {idx}** - {avg_score:.1f}/10" if avg_score else f"**Iteration {idx}**", expanded=(idx == total)):
+                    st.caption(f"📁 {iteration.get('image_name', 'Unknown')}")
+                    st.caption(f"🕐 {iteration.get('timestamp', 'N/A')[:19]}")
+                    if iteration.get("cost"):
+                        st.caption(
+                            f"💵 {format_cost(iteration['cost']['cost_usd'])} | {iteration['cost']['total_tokens']} tokens")
+
+                    if iteration.get("evaluation"):
+                        for cat, data in iteration["evaluation"].items():
+                            if isinstance(data, dict) and "score" in data:
+                                st.write(f"• {cat}: **{data['score']}**/10")
+
+                    # Image and raw JSON are fetched only when requested
+                    key_suffix = f"{st.session_state.session_id}_{idx}_{iteration.get('timestamp')}"
+                    if st.toggle("🖼️ Image", key=f"history_image_{key_suffix}"):
+                        image_bytes = get_iteration_image_bytes(iteration)
+                        if image_bytes:
+                            st.image(image_bytes, use_container_width=True)
+                        else:
+                            st.caption("Image not available")
+                    if st.toggle("📄 Raw JSON", key=f"history_raw_{key_suffix}"):
+                        raw_response = get_iteration_details(iteration).get("raw_response")
+                        if raw_response:
+                            st.code(raw_response, language="json")
+                        else:
+                            st.caption("No raw response stored")
+                    # Earlier iterations are translated on demand (cached in the store per iteration)
+                    languages = past_iteration_languages(iteration)
+                    if languages and iteration.get("evaluation"):
+                        translations = iteration.get("translations")
+                        if translations is None:  # Resumed iteration: load once, keep in the record
+                            translations = iteration["translations"] = (
+                                get_iteration_details(iteration).get("translations") or {})
+                        missing = [language for language in languages if language not in translations]
+                        if missing and st.button(f"🌐 Translate into {', '.join(missing)}",
+                                                 key=f"history_translate_{key_suffix}"):
+                            translations = translate_past_iteration(iteration)
+                        shown = {language: translations[language]
+                                 for language in languages if language in translations}
+                        if shown and st.toggle("🌐 Translated feedback", key=f"history_translated_{key_suffix}"):
+                            for language, translation in shown.items():
+                                st.markdown(f"**{language}**")
+                                display_evaluation(translation["evaluation"], idx > 1)
+
+
+with st.sidebar:
+    render_sidebar()
 
-    st.divider()
+# Main content
+col_main, col_history = st.columns([2, 1])
 
+with col_main:
+    render_settings()
+
+    upload_started = time.perf_counter()
     st.header("📤 Upload Portrait")
 
     uploaded_file = st.file_uploader(
@@ -687,61 +1651,161 @@ with col_main:
         st.image(uploaded_file, caption="Uploaded portrait",
                  use_container_width=True)
 
-        if st.button("🚀 Get Evaluation", type="primary"):
+        # Near-duplicate of an earlier upload? Reuse its verdict / offer its evaluation
+        upload_sha = get_upload_sha(uploaded_file)
+        upload_phash = get_upload_precheck(uploaded_file)["phash"]
+        duplicate = find_session_duplicate(upload_sha, upload_phash)
+        # Only the same file reuses an earlier verdict; similar images are checked again
+        reused = duplicate if duplicate and duplicate["exact"] else None
+        evaluate_label = "🚀 Get Evaluation"
+
+        # Image check in the background while the preview is shown (exact duplicates reuse their verdict)
+        collect_prefilter_jobs()
+        prefilter_job = None
+        if st.session_state.eager_prefilter and reused is None:
+            prefilter_job = start_prefilter_job(uploaded_file, upload_sha)
+            if not prefilter_job["future"].done():
+                st.caption("⚡ Checking image in the background...")
+        if duplicate and duplicate["kind"] == "iteration":
+            duplicate_iteration = st.session_state.iterations[duplicate["index"]]
+            st.info(
+                f"🔁 This {'is the same image as' if duplicate['exact'] else 'looks like'} "
+                f"iteration {duplicate['index'] + 1} "
+                f"({duplicate_iteration.get('image_name', 'Unknown')}). "
+                "You can view its evaluation instead of spending a new one.")
+            evaluate_label = "🚀 Evaluate anyway"
+            if st.button(f"📄 Show iteration {duplicate['index'] + 1} evaluation"):
+                duplicate_details = get_iteration_details(duplicate_iteration)
+                st.subheader(f"📝 Evaluation Result (Iteration {duplicate['index'] + 1})")
+                display_evaluation(duplicate_iteration.get("evaluation"), duplicate["index"] > 0,
+                                   duplicate_details.get("parsed_response"),
+                                   duplicate_details.get("raw_response"))
+
+        if st.button(evaluate_label, type="primary"):
             time_start = time.perf_counter()
             with st.spinner("Analyzing portrait..."):
                 try:
                     iteration_added = False
-                    # Encode image
-                    image_base64 = encode_image_to_base64(uploaded_file)
-
-                    # Agent1: Initial analysis (first gate - image classification)
-                    with st.spinner("Checking image..."):
-                        agent1_text, _ = call_agent1_initial_analysis(
-                            API_KEY, image_base64,
-                            model=st.session_state.prefilter_model
-                        )
-                    agent1_data = parse_agent1_response(agent1_text)
+                    call_ledger = []
+                    # One budget for every model call of this evaluation (mode known up front)
+                    if st.session_state.ensemble_enabled and len(st.session_state.ensemble_models) >= 2:
+                        deadline_mode = "ensemble"
+                    else:
+                        deadline_mode = "comparison" if st.session_state.iterations else "standalone"
+                    deadline = start_deadline(deadline_mode)
+                    # Background check of this upload: wait for it instead of repeating its work,
+                    # unless it is still queued behind other sessions' checks (then check inline)
+                    prefiltered = None
+                    if prefilter_job is not None and prefilter_job["future"].cancel():
+                        st.session_state.prefilter_jobs.pop(
+                            (upload_sha, prefilter_settings()), None)
+                    elif prefilter_job is not None:
+                        try:
+                            prefiltered = prefilter_job["future"].result(
+                                timeout=call_timeout(deadline, "agent1")[1])
+                        except Exception:  # Still running at the deadline, or failed
+                            pass  # Checked below as if no background job existed
+                        collect_prefilter_jobs()
+                    # Base64-encoded while each request body streams (no per-call copies)
+                    image_bytes = uploaded_file.getvalue()
+                    image_mime_type = uploaded_file.type or "image/jpeg"
+                    image_part = ImagePart(image_bytes, image_mime_type)
+
+                    agent1_data = None
+                    agent1_model = st.session_state.prefilter_model
                     prefilter_passed = True
-
-                    if agent1_data:
-                        # Agent2: Censored content → reject
-                        if agent1_data.get("CENCORED_CONTENT") is True:
-                            agent2_text, _ = call_agent2_censored_message(
-                                API_KEY, json.dumps(agent1_data, indent=2),
-                                output_language=st.session_state.output_language,
-                                model=st.session_state.prefilter_model
-                            )
-                            st.error(
-                                agent2_text or "This content is not allowed.")
+                    # Single-pass: the evaluation call does the portrait gate (unless reused from the same file)
+                    single_pass = st.session_state.single_pass_evaluation and reused is None
+
+                    # Local check: decode/size/aspect validation and face detection (no model call)
+                    local_check = None
+                    if reused and reused["kind"] == "rejected":
+                        rejected = st.session_state.rejected_uploads[reused["index"]]
+                        st.error(rejected["message"])
+                        st.caption("🔁 Same verdict as an earlier upload of this image (no model call)")
+                        prefilter_passed = False
+                    elif reused:
+                        # Same file as an accepted iteration: its prefilter verdict still holds
+                        agent1_data = st.session_state.iterations[reused["index"]].get("prefilter")
+                        st.caption(
+                            f"🔁 Image check reused from iteration {reused['index'] + 1} (same file)")
+                    elif st.session_state.local_precheck != "off":
+                        local_check = get_upload_precheck(uploaded_file)
+                        if local_check["verdict"] == PRECHECK_REJECT:
+                            rejection_message = local_rejection_message(
+                                local_check, st.session_state.output_language)
+                            st.error(rejection_message)
+                            remember_rejection(upload_sha, rejection_message)
+                            st.caption(
+                                f"🔎 Local check: {local_check['reason']} ({local_check['elapsed_ms']} ms)")
                             prefilter_passed = False
-                            elapsed = time.perf_counter() - time_start
-                            st.caption(f"⏱️ Total time: {elapsed:.1f}s")
-
-                        # Agent3: Not a portrait → reject
-                        elif agent1_data.get("IS_PORTRAIT") is False:
-                            agent3_text, _ = call_agent3_not_portrait_message(
-                                API_KEY, json.dumps(agent1_data, indent=2),
-                                output_language=st.session_state.output_language,
-                                model=st.session_state.prefilter_model
-                            )
-                            st.error(
-                                agent3_text or "We only provide painting lessons for portraits.")
+                    skip_agent1 = (prefilter_passed and local_check is not None
+                                   and st.session_state.local_precheck == "skip_agent1"
+                                   and local_check["verdict"] == PRECHECK_PORTRAIT)
+                    if skip_agent1 and not single_pass:
+                        st.caption(
+                            f"🔎 Local check: {local_check['reason']} ({local_check['elapsed_ms']} ms), image check skipped")
+
+                    # Agent1: Initial analysis (first gate - image classification)
+                    if prefilter_passed and not skip_agent1 and reused is None and not single_pass:
+                        if prefiltered and prefiltered["agent1_text"] is not None:
+                            agent1_text, agent1_model = prefiltered["agent1_text"], prefiltered["model"]
+                            if not prefilter_job["consumed"]:
+                                call_ledger.extend(prefilter_job["ledger"])  # Already in the session ledger
+                                prefilter_job["consumed"] = True
+                            st.caption("⚡ Image check finished in the background")
+                            show_fallback_notice(st.session_state.prefilter_model,
+                                                 agent1_model, prefiltered["failures"])
+                        else:
+                            with st.spinner("Checking image..."):
+                                if st.session_state.single_call_prefilter:
+                                    agent1_text, agent1_model, agent1_failures = call_with_fallback(
+                                        "agent1", st.session_state.prefilter_model, call_ledger,
+                                        lambda model, timeout: call_agent1_with_rejection_message(
+                                            API_KEY, image_part,
+                                            output_language=st.session_state.output_language,
+                                            model=model,
+                                            reasoning_effort=st.session_state.reasoning_effort,
+                                            timeout=timeout
+                                        ), deadline)
+                                else:
+                                    agent1_text, agent1_model, agent1_failures = call_with_fallback(
+                                        "agent1", st.session_state.prefilter_model, call_ledger,
+                                        lambda model, timeout: call_agent1_initial_analysis(
+                                            API_KEY, image_part,
+                                            model=model,
+                                            reasoning_effort=st.session_state.reasoning_effort,
+                                            timeout=timeout
+                                        ), deadline)
+                                show_fallback_notice(st.session_state.prefilter_model,
+                                                     agent1_model, agent1_failures)
+                        agent1_data = parse_agent1_response(agent1_text)
+
+                    if agent1_data and reused is None:
+                        # Single-call mode: agent1 already wrote the message (agent2/3 only if it didn't)
+                        if reject_if_gate_failed(agent1_data, agent1_model, call_ledger,
+                                                 upload_sha, time_start, deadline):
                             prefilter_passed = False
-                            elapsed = time.perf_counter() - time_start
-                            st.caption(f"⏱️ Total time: {elapsed:.1f}s")
 
                     if not prefilter_passed:
                         pass  # Already showed error, skip evaluation
                     else:
                         # Add new iteration (without evaluation yet)
-                        new_iteration = {
-                            "image_base64": image_base64,
-                            "image_name": uploaded_file.name,
-                            "timestamp": datetime.now().isoformat(),
-                            "evaluation": None
-                        }
+                        new_iteration = IterationRecord(
+                            image_bytes=image_bytes,
+                            mime_type=image_mime_type,
+                            image_sha256=upload_sha,
+                            image_name=uploaded_file.name,
+                            timestamp=datetime.now().isoformat(),
+                            iteration_number=len(st.session_state.iterations) + 1,
+                            mode="comparison" if st.session_state.iterations else "standalone",
+                            output_language=st.session_state.output_language,
+                            phash=upload_phash,
+                            prefilter=agent1_data or ({"local_check": local_check["reason"]} if skip_agent1 else None),
+                        )
                         st.session_state.iterations.append(new_iteration)
+                        bump_iterations_version()
+                        st.session_state.history_page = 0
                         iteration_added = True
 
                         # Determine mode
@@ -754,107 +1818,189 @@ with col_main:
                             comparison_data = get_comparison_data(
                                 st.session_state.iterations)
                             user_content = build_comparison_content(
-                                comparison_data)
-                            system_prompt = COMPARISON_PROMPT.format(
-                                julia_style_rules=JULIA_STYLE_RULES,
-                                audience_complexity=AUDIENCE_COMPLEXITY.get(
-                                    st.session_state.skill_level, AUDIENCE_COMPLEXITY_BEGINNER),
-                                output_language=st.session_state.output_language
-                            )
+                                comparison_data, get_iteration_image_part)
+                            system_prompt = build_system_prompt("comparison", single_pass)
                             selected_model = st.session_state.comparison_model
                         else:
                             # First evaluation
                             st.info("🎨 First portrait evaluation")
                             user_content = build_standalone_content(
-                                image_base64)
-                            system_prompt = EVALUATE_PORTRAIT_STANDALONE.format(
-                                reference_context="",  # Empty by default, can be customized if needed
-                                julia_style_rules=JULIA_STYLE_RULES,
-                                audience_complexity=AUDIENCE_COMPLEXITY.get(
-                                    st.session_state.skill_level, AUDIENCE_COMPLEXITY_BEGINNER),
-                                output_language=st.session_state.output_language
-                            )
+                                image_part)
+                            system_prompt = build_system_prompt("standalone", single_pass)
                             selected_model = st.session_state.standalone_model
 
-                        # API call
-                        response_text, usage = call_openai_api(
-                            API_KEY,
-                            system_prompt,
-                            user_content,
-                            model=selected_model,
-                            response_format={"type": "json_object"},
-                        )
-
-                        # Parse response
-                        parsed_response = parse_evaluation_response(
-                            response_text, is_comparison)
-                        standard_eval = extract_standard_evaluation(
-                            parsed_response, is_comparison)
-
-                        # Save evaluation
-                        st.session_state.iterations[-1]["evaluation"] = standard_eval
-                        st.session_state.iterations[-1]["raw_response"] = response_text
-                        st.session_state.iterations[-1]["parsed_response"] = parsed_response
-                        st.session_state.iterations[-1]["system_prompt"] = system_prompt
-                        st.session_state.iterations[-1]["model"] = selected_model
-
-                        # Add to chat history
-                        st.session_state.chat_history.append({
-                            "role": "user",
-                            "content": f"Uploaded: {uploaded_file.name}",
-                            "image": image_base64
-                        })
-                        st.session_state.chat_history.append({
-                            "role": "assistant",
-                            "content": response_text,
-                            "evaluation": standard_eval,
-                            "is_comparison": is_comparison,
-                            "parsed_response": parsed_response
-                        })
-
-                        elapsed = time.perf_counter() - time_start
-                        st.success(
-                            f"✅ Evaluation received! Tokens used: {usage.get('total_tokens', 'N/A')} | ⏱️ Total time: {elapsed:.1f}s")
-
-                        # Display result
-                        st.divider()
-                        st.subheader(
-                            f"📝 Evaluation Result (Iteration {len(st.session_state.iterations)})")
-                        display_evaluation(
-                            standard_eval, is_comparison, parsed_response, response_text)
+                        call_type = "comparison" if is_comparison else "standalone"
+                        # Models with an open circuit sit out the ensemble
+                        open_models = CIRCUIT_BREAKERS.open_models()
+                        ensemble_models = [m for m in st.session_state.ensemble_models
+                                           if m not in open_models]
+                        ensemble_info = None
+                        requested_model = None
+                        fallback_failures = []
+
+                        if st.session_state.ensemble_enabled and len(ensemble_models) >= 2:
+                            # Ensemble: all models in parallel, wall time bounded by the slowest (or deadline)
+                            with st.spinner(f"Evaluating with {len(ensemble_models)} models..."):
+                                results = call_models_concurrently(
+                                    API_KEY, system_prompt, user_content, ensemble_models,
+                                    reasoning_effort=st.session_state.reasoning_effort,
+                                    response_format={"type": "json_object"},
+                                    deadline_s=min(st.session_state.ensemble_deadline,
+                                                   call_timeout(deadline, "ensemble")[1]),
+                                )
+                            for result in results:
+                                breaker = CIRCUIT_BREAKERS.get(result["model"])
+                                if result["error"] is None:
+                                    record_call_cost(call_ledger, call_type, result["model"],
+                                                     result["usage"], result["elapsed"])
+                                    if not result["usage"].get("coalesced"):
+                                        breaker.record_success()
+                                elif not isinstance(result["error"], CoalescedError):
+                                    record_call_failure(call_type, result["model"], result["elapsed"])
+                                    breaker.record_failure()
+                            parsed_response, ensemble_details = aggregate_ensemble_responses(
+                                results, is_comparison, st.session_state.ensemble_aggregation)
+                            if parsed_response is None:
+                                errors = [result["error"] for result in results if result["error"]]
+                                if errors:
+                                    raise errors[0]
+                                raise ValueError("No ensemble model returned a parseable evaluation")
+                            response_text = json.dumps(
+                                parsed_response, indent=2, ensure_ascii=False)
+                            # The gate needs every member's verdict, not just the merged one
+                            gate_responses = [response for response in (
+                                parse_evaluation_response(result["response_text"], is_comparison)
+                                for result in results if result["error"] is None) if response]
+                            selected_model = "ensemble: " + ", ".join(ensemble_models)
+                            ensemble_info = {
+                                "models": ensemble_models,
+                                "aggregation": st.session_state.ensemble_aggregation,
+                                "categories": ensemble_details,
+                                "responses": [{
+                                    "model": result["model"],
+                                    "raw_response": result["response_text"],
+                                    "error": str(result["error"]) if result["error"] else None,
+                                    "elapsed_s": round(result["elapsed"], 2),
+                                } for result in results],
+                            }
+                        else:
+                            if selected_model == AUTO_MODEL:
+                                selected_model, route_reason = MODEL_ROUTER.choose(
+                                    call_type, QUALITY_TIER_NAMES[st.session_state.quality_tier],
+                                    exclude=open_models)
+                                st.caption(f"🧭 Auto-routed to {selected_model} ({route_reason})")
+
+                            # API call (falls back down the chain if the model fails)
+                            requested_model = selected_model
+                            response_text, selected_model, fallback_failures = call_with_fallback(
+                                call_type, requested_model, call_ledger,
+                                lambda model, timeout: call_openai_api(
+                                    API_KEY,
+                                    system_prompt,
+                                    user_content,
+                                    model=model,
+                                    response_format={"type": "json_object"},
+                                    reasoning_effort=st.session_state.reasoning_effort,
+                                    timeout=timeout,
+                                ), deadline)
+                            show_fallback_notice(requested_model, selected_model, fallback_failures)
+
+                            # Parse response
+                            parsed_response = parse_evaluation_response(
+                                response_text, is_comparison)
+                            gate_responses = [parsed_response] if parsed_response else []
+                        iteration_cost = summarize_ledger(call_ledger)
+
+                        # Single-pass gate: discard the evaluation of a censored / non-portrait image
+                        # (or of one whose gate fields are missing)
+                        gate_rejected = False
+                        if single_pass and parsed_response is not None:
+                            gate_data = single_pass_gate(gate_responses)
+                            st.session_state.iterations[-1]["prefilter"] = {
+                                "IS_PORTRAIT": gate_data["IS_PORTRAIT"],
+                                "CENCORED_CONTENT": gate_data["CENCORED_CONTENT"],
+                                "single_pass": True,
+                            }
+                            if reject_if_gate_failed(gate_data, st.session_state.prefilter_model,
+                                                     call_ledger, upload_sha, time_start, deadline):
+                                st.session_state.iterations.pop()
+                                bump_iterations_version()
+                                iteration_added = False
+                                gate_rejected = True
+
+                        if not gate_rejected:
+                            standard_eval = extract_standard_evaluation(
+                                parsed_response, is_comparison)
+
+                            # Save evaluation
+                            st.session_state.iterations[-1]["evaluation"] = standard_eval
+                            st.session_state.iterations[-1]["raw_response"] = response_text
+                            st.session_state.iterations[-1]["parsed_response"] = parsed_response
+                            st.session_state.iterations[-1]["system_prompt"] = system_prompt
+                            st.session_state.iterations[-1]["model"] = selected_model
+                            st.session_state.iterations[-1]["reasoning_effort"] = st.session_state.reasoning_effort
+                            st.session_state.iterations[-1]["calls"] = call_ledger
+                            st.session_state.iterations[-1]["cost"] = iteration_cost
+                            translations = {}
+                            if standard_eval and st.session_state.extra_languages:
+                                try:
+                                    translations = translate_iteration(
+                                        st.session_state.iterations[-1],
+                                        st.session_state.extra_languages, call_ledger, deadline)
+                                except DeadlineExceeded:
+                                    st.caption("⏱️ No time left for translations")
+                                iteration_cost = summarize_ledger(call_ledger)
+                                st.session_state.iterations[-1]["cost"] = iteration_cost
+                            if ensemble_info:
+                                st.session_state.iterations[-1]["ensemble"] = ensemble_info
+                            if requested_model and requested_model != selected_model:
+                                st.session_state.iterations[-1]["requested_model"] = requested_model
+                                st.session_state.iterations[-1]["fallback_failures"] = [
+                                    {"model": model, "error": str(error)} for model, error in fallback_failures]
+                            st.session_state.iterations[-1].compact()  # Keep the raw response only
+                            bump_iterations_version()
+                            if st.session_state.score_index is not None:
+                                st.session_state.score_index.append(standard_eval)
+                            persist_iteration(st.session_state.iterations[-1],
+                                              image_bytes, image_mime_type)
 
+                            elapsed = time.perf_counter() - time_start
+                            st.success(
+                                f"✅ Evaluation received! Tokens used: {iteration_cost['total_tokens']} | "
+                                f"💵 Cost: {format_cost(iteration_cost['cost_usd'])} | ⏱️ Total time: {elapsed:.1f}s")
+
+                            # Display result
+                            st.divider()
+                            st.subheader(
+                                f"📝 Evaluation Result (Iteration {len(st.session_state.iterations)})")
+                            if ensemble_info:
+                                display_ensemble_summary(ensemble_info)
+                            display_translated_evaluations(
+                                standard_eval, translations, is_comparison, parsed_response, response_text)
+
+                except (DeadlineExceeded, requests.exceptions.Timeout) as e:
+                    if iteration_added:
+                        st.session_state.iterations.pop()
+                        bump_iterations_version()
+                    elapsed = time.perf_counter() - time_start
+                    st.error(f"⏱️ Evaluation timed out after {elapsed:.1f}s: {e}")
+                    st.caption(
+                        f"Completed calls: {', '.join(entry['call_type'] for entry in call_ledger) or 'none'} | "
+                        f"💵 {format_cost(summarize_ledger(call_ledger)['cost_usd'])} spent. Please try again.")
                 except requests.exceptions.RequestException as e:
                     if iteration_added:
                         st.session_state.iterations.pop()  # Remove failed iteration
+                        bump_iterations_version()
                     st.error(f"API Error: {e}")
                 except Exception as e:
                     if iteration_added:
                         st.session_state.iterations.pop()
+                        bump_iterations_version()
                     st.error(f"Error: {e}")
+    record_section_time("upload", upload_started)
 
 with col_history:
-    st.header("📜 Iteration History")
-
-    if not st.session_state.iterations:
-        st.info("History is empty. Upload your first portrait!")
-    else:
-        for i, iteration in enumerate(reversed(st.session_state.iterations)):
-            idx = len(st.session_state.iterations) - i
-            avg_score = calculate_average_score(iteration.get("evaluation"))
-
-            with st.expander(f"**Iteration {idx}** - {avg_score:.1f}/10" if avg_score else f"**Iteration {idx}**", expanded=(i == 0)):
-                st.caption(f"📁 {iteration.get('image_name', 'Unknown')}")
-                st.caption(f"🕐 {iteration.get('timestamp', 'N/A')[:19]}")
-
-                if iteration.get("evaluation"):
-                    for cat, data in iteration["evaluation"].items():
-                        if isinstance(data, dict) and "score" in data:
-                            st.write(f"• {cat}: **{data['score']}**/10")
-
-                # Raw JSON view button for each iteration
-                if iteration.get("raw_response"):
-                    with st.expander("📄 Raw JSON", expanded=False):
-                        st.code(iteration.get("raw_response"), language="json")
+    render_history()
 
 # Footer
 st.divider()
@@ -863,3 +2009,7 @@ st.markdown("""
     🎨 Portrait Evaluation Assistant | Powered by GPT-4o
 </div>
 """, unsafe_allow_html=True)
+
+record_section_time("script", script_started)
+with st.expander("⏱️ Rerun profile", expanded=False):
+    display_rerun_profile()
@@ -0,0 +1,136 @@
+"""Low-copy streaming JSON request bodies for image-heavy model calls (shared by Streamlit app and CLI scripts).
+
+`json=` in requests serializes the whole message list, every image data URL
+included, into one more in-memory buffer. StreamingJSONBody instead encodes
+only the small JSON skeleton and streams image segments in chunks: data URLs
+already held as `str` are sliced verbatim, raw image bytes are base64-encoded
+incrementally from a memoryview. Peak memory per call stays at roughly one
+copy of each image plus one chunk.
+"""
+
+import base64
+import json
+import uuid
+
+# Raw bytes base64-encoded per chunk (multiple of 3, so chunks join without padding)
+BODY_CHUNK_BYTES = 3 * 16 * 1024
+
+
+class ImagePart:
+    """An image inside a request payload, used in place of its data URL string.
+
+    Holds either raw bytes (bytes/bytearray/memoryview, not copied) plus a MIME
+    type, or an existing `data:` URL string that is streamed verbatim. A `bare`
+    part emits only the base64 payload, without the `data:...;base64,` prefix.
+    """
+
+    __slots__ = ("data", "mime_type", "data_url", "bare")
+
+    def __init__(self, data=None, mime_type="image/jpeg", data_url=None, bare=False):
+        if (data is None) == (data_url is None):
+            raise ValueError("ImagePart needs exactly one of data or data_url")
+        self.data = memoryview(data).cast("B") if data is not None else None
+        if data_url is not None and data_url.startswith("data:") and ";" in data_url:
+            mime_type = data_url[len("data:"):data_url.index(";")]
+        self.mime_type = mime_type
+        self.data_url = data_url
+        self.bare = bare
+
+    @classmethod
+    def from_data_url(cls, data_url):
+        return cls(data_url=data_url)
+
+    def base64_part(self):
+        """The same image as a bare base64 string (for APIs that take media type and data separately)"""
+        if self.data_url is not None:
+            return ImagePart(data_url=self.data_url, bare=True)
+        return ImagePart(self.data, self.mime_type, bare=True)
+
+    def _prefix(self):
+        return b"" if self.bare else f"data:{self.mime_type};base64,".encode("ascii")
+
+    def _url_offset(self):
+        return self.data_url.find(",") + 1 if self.bare else 0
+
+    def __len__(self):
+        """Length of the encoded data URL (or bare base64) in bytes"""
+        if self.data_url is not None:
+            return len(self.data_url) - self._url_offset()
+        return len(self._prefix()) + 4 * ((len(self.data) + 2) // 3)
+
+    def chunks(self, chunk_size=BODY_CHUNK_BYTES):
+        """Yields the data URL (or bare base64) as ASCII byte chunks"""
+        if self.data_url is not None:
+            step = 4 * chunk_size // 3
+            for start in range(self._url_offset(), len(self.data_url), step):
+                yield self.data_url[start:start + step].encode("ascii")
+            return
+        yield self._prefix()
+        for start in range(0, len(self.data), chunk_size):
+            yield base64.b64encode(self.data[start:start + chunk_size])
+
+
+class StreamingJSONBody:
+    """File-like request body: the JSON encoding of `payload`, produced on read.
+
+    ImagePart values anywhere in `payload` are emitted as their data URL
+    strings. Supports len() (so requests sends a Content-Length header) and
+    read(size) (so http.client streams it block by block).
+    """
+
+    def __init__(self, payload, chunk_size=BODY_CHUNK_BYTES):
+        marker = f"@@image-part-{uuid.uuid4().hex}-"
+        images = []
+
+        def replace(value):
+            if isinstance(value, ImagePart):
+                images.append(value)
+                return f"{marker}{len(images) - 1}@@"
+            if isinstance(value, dict):
+                return {key: replace(item) for key, item in value.items()}
+            if isinstance(value, (list, tuple)):
+                return [replace(item) for item in value]
+            return value
+
+        # Same encoding as requests' `json=` (ASCII-escaped, NaN rejected)
+        skeleton = json.dumps(replace(payload), allow_nan=False)
+        self._segments = []
+        for index, piece in enumerate(skeleton.split(marker)):
+            if index:
+                image_index, piece = piece.split("@@", 1)
+                self._segments.append(images[int(image_index)])
+            self._segments.append(piece.encode("utf-8"))
+        self._chunk_size = chunk_size
+        self._length = sum(len(segment) for segment in self._segments)
+        self._iterator = self._chunks()
+        self._pending = b""
+
+    def __len__(self):
+        return self._length
+
+    def _chunks(self):
+        for segment in self._segments:
+            if isinstance(segment, ImagePart):
+                yield from segment.chunks(self._chunk_size)
+            elif segment:
+                yield segment
+
+    def __iter__(self):
+        return self._chunks()
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            data = self._pending + b"".join(self._iterator)
+            self._pending = b""
+            return data
+        parts = [self._pending]
+        available = len(self._pending)
+        while available < size:
+            chunk = next(self._iterator, None)
+            if chunk is None:
+                break
+            parts.append(chunk)
+            available += len(chunk)
+        data = b"".join(parts)
+        self._pending = data[size:]
+        return data[:size]
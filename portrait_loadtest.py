@@ -0,0 +1,202 @@
+"""Concurrent-session load test against a local stand-in provider (capacity planning, no API cost).
+
+Each simulated session uploads `--uploads` images in sequence, the way a
+student does: the first upload is a standalone evaluation, every later one a
+comparison against the session's history, each behind the local image check
+and the agent1 gate, as in the app. Uploads are real JPEGs (random noise, so
+they do not compress below the requested size). All models are routed to the portrait_providers stand-in, whose latency models the
+provider. For every session count the report shows throughput, p50/p95/p99
+upload latency and peak traced memory (total and per session).
+
+    python portrait_loadtest.py --sessions 1,10,25,50 --uploads 3 --latency 1.5 --jitter 1.0
+
+With --api the same sequences are sent to a running portrait_api.py instead
+of the in-process pipeline (start that server with PORTRAIT_PROVIDERS pointing
+at a stand-in; its PORTRAIT_API_TOKEN must be set here too); memory is then the
+server's business and not reported.
+"""
+
+import argparse
+import functools
+import io
+import json
+import math
+import os
+import statistics
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from PIL import Image
+
+from portrait_http import ImagePart
+from portrait_pipeline import DEFAULT_SETTINGS, EVALUATION_DEADLINES_S, make_deadline, run_evaluation
+from portrait_precheck import PRECHECK_REJECT, precheck_image
+from portrait_providers import configure_providers, make_stand_in_server
+
+# Seconds between job polls in --api mode
+API_POLL_INTERVAL_S = 0.25
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def make_noise_jpeg(size_kb, aspect=0.75):
+    """A decodable portrait-shaped JPEG of random noise, about `size_kb` large"""
+    target = size_kb * 1024
+
+    def encode(width):
+        height = max(round(width / aspect), 1)
+        image = Image.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=85)
+        return buffer.getvalue()
+
+    # Noise JPEG size grows with the pixel count; one corrected re-encode lands close
+    width = 256
+    data = encode(width)
+    return encode(max(round(width * math.sqrt(target / len(data))), 128))
+
+
+def make_images(count, size_kb):
+    """Distinct uploads that pass the local image check (it decodes them, like the app)"""
+    return [make_noise_jpeg(size_kb) for _ in range(count)]
+
+
+def run_pipeline_session(images, settings):
+    """One session through the local check and run_evaluation(); returns per-upload (latency_s, ok)"""
+    history, samples = [], []
+    for image_bytes in images:
+        mode = "comparison" if history else "standalone"
+        started = time.perf_counter()
+        try:
+            if precheck_image(image_bytes)["verdict"] == PRECHECK_REJECT:
+                raise ValueError("upload rejected by the local image check")
+            result = run_evaluation("stand-in", ImagePart(image_bytes, "image/jpeg"), history, settings,
+                                    deadline=make_deadline(EVALUATION_DEADLINES_S[mode]))
+            ok = result["status"] == "evaluated"
+        except Exception:
+            result, ok = None, False
+        samples.append((time.perf_counter() - started, ok))
+        if ok:
+            history.append({"evaluation": result["evaluation"],
+                            "image_bytes": image_bytes, "mime_type": "image/jpeg"})
+    return samples
+
+
+def run_api_session(base_url, images, settings, token=None):
+    """One session through a running portrait_api.py; latency includes queueing and polling"""
+    http = requests.Session()
+    if token:
+        http.headers["Authorization"] = f"Bearer {token}"
+    created = http.post(f"{base_url}/v1/sessions")
+    created.raise_for_status()  # 401: PORTRAIT_API_TOKEN does not match the server's
+    session_id = created.json()["session_id"]
+    samples = []
+    for image_bytes in images:
+        started = time.perf_counter()
+        response = http.post(f"{base_url}/v1/sessions/{session_id}/evaluations",
+                             files={"image": ("upload.jpg", image_bytes, "image/jpeg")},
+                             data={"settings": json.dumps(settings)})
+        ok = response.status_code == 202
+        while ok:
+            job = http.get(f"{base_url}/v1/jobs/{response.json()['job_id']}").json()
+            if job["status"] in ("done", "failed"):
+                ok = job["status"] == "done" and job["result"]["status"] == "evaluated"
+                break
+            time.sleep(API_POLL_INTERVAL_S)
+        samples.append((time.perf_counter() - started, ok))
+    return samples
+
+
+def run_level(session_count, uploads, image_kb, run_session, trace_memory=True):
+    """Runs `session_count` concurrent sessions; returns one report row"""
+    sessions = [make_images(uploads, image_kb) for _ in range(session_count)]
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=session_count) as pool:
+        results = list(pool.map(run_session, sessions))
+    wall_s = time.perf_counter() - started
+    peak_bytes = None
+    if trace_memory:
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    samples = [sample for session in results for sample in session]
+    latencies = [latency for latency, ok in samples if ok]
+    row = {
+        "sessions": session_count,
+        "uploads": len(samples),
+        "failed": sum(1 for _, ok in samples if not ok),
+        "wall_s": round(wall_s, 2),
+        "uploads_per_s": round(len(latencies) / wall_s, 2),
+    }
+    if latencies:
+        row.update({f"p{p}_s": round(percentile(latencies, p / 100), 2) for p in (50, 95, 99)})
+        row["mean_s"] = round(statistics.fmean(latencies), 2)
+    if peak_bytes is not None:
+        row["peak_mb"] = round(peak_bytes / 2**20, 1)
+        row["kb_per_session"] = round(peak_bytes / 1024 / session_count)
+    return row
+
+
+def print_report(rows):
+    columns = ["sessions", "uploads", "failed", "uploads_per_s", "p50_s", "p95_s", "p99_s",
+               "peak_mb", "kb_per_session"]
+    columns = [column for column in columns if any(column in row for row in rows)]
+    print("  ".join(f"{column:>14}" for column in columns))
+    for row in rows:
+        print("  ".join(f"{row.get(column, '-'):>14}" for column in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-session load test with a stand-in provider")
+    parser.add_argument("--sessions", default="1,5,10,25",
+                        help="comma-separated concurrent session counts")
+    parser.add_argument("--uploads", type=int, default=3, help="uploads per session")
+    parser.add_argument("--image-kb", type=int, default=300, help="size of each upload")
+    parser.add_argument("--latency", type=float, default=1.0, help="stand-in seconds per call")
+    parser.add_argument("--jitter", type=float, default=0.5, help="extra random seconds per call")
+    parser.add_argument("--single-pass", action="store_true", help="skip the separate agent1 call")
+    parser.add_argument("--api", metavar="URL", help="drive a running portrait_api.py instead")
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc (it slows Python down)")
+    parser.add_argument("--json", metavar="PATH", help="also write the report rows as JSON")
+    args = parser.parse_args()
+
+    settings = {"single_pass_evaluation": args.single_pass}
+    if args.api:
+        if args.single_pass:
+            parser.error("--single-pass is a server setting in --api mode (PORTRAIT_API_SETTINGS)")
+        settings = {}
+        base_url = args.api.rstrip("/")
+        run_session = functools.partial(run_api_session, base_url, settings=settings,
+                                        token=os.environ.get("PORTRAIT_API_TOKEN"))
+        trace_memory = False
+    else:
+        server = make_stand_in_server(latency_s=args.latency, jitter_s=args.jitter)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        # Every model, whatever its id, goes to the stand-in
+        configure_providers({"stand-in": {"base_url": f"http://127.0.0.1:{server.server_port}/v1",
+                                          "dialect": "openai", "models": [""]}})
+        run_session = functools.partial(run_pipeline_session, settings={**DEFAULT_SETTINGS, **settings})
+        trace_memory = not args.no_memory
+
+    rows = []
+    for session_count in [int(count) for count in args.sessions.split(",")]:
+        rows.append(run_level(session_count, args.uploads, args.image_kb, run_session, trace_memory))
+        print(f"{session_count} sessions: {rows[-1]['wall_s']}s")
+    print()
+    print_report(rows)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,673 @@
+"""Evaluation building blocks without Streamlit (shared by the Streamlit app, the HTTP API and CLI scripts).
+
+Model calls (agent1 gate, rejection messages, standalone/comparison
+evaluations, ensembles, translations), request content builders, response
+parsers and per-call deadlines. The Streamlit app drives these functions step
+by step with its UI in between and adds fallback chains, circuit breakers,
+ensembles and background image checks. run_evaluation() is the headless flow
+for the HTTP API and the load test: one model per stage, none of those extras.
+"""
+
+import copy
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+
+from portrait_audit import audit_event
+from portrait_costs import make_ledger_entry, summarize_ledger
+from portrait_http import ImagePart, StreamingJSONBody
+from portrait_prompts import (
+    AGENT1_INITIAL_ANALYSIS,
+    AGENT1_WITH_REJECTION_MESSAGE,
+    AGENT2_CENSORED_MESSAGE,
+    AGENT3_NOT_PORTRAIT_MESSAGE,
+    AUDIENCE_COMPLEXITY,
+    AUDIENCE_COMPLEXITY_BEGINNER,
+    EVALUATION_CATEGORIES,
+    JULIA_STYLE_RULES,
+    SINGLE_PASS_GATE_INSTRUCTIONS,
+    TRANSLATE_EVALUATION_PROMPT,
+)
+from portrait_prompt_compiler import PROMPT_TEMPLATES
+from portrait_providers import build_request, parse_response, resolve_provider
+from portrait_singleflight import MODEL_CALLS, request_key
+
+# OpenRouter completion cap (comparison JSON can exceed 6k tokens)
+OPENROUTER_MAX_TOKENS = 12000
+
+# Ensemble evaluation: models whose category scores differ by at least this much are flagged
+ENSEMBLE_DISAGREEMENT_THRESHOLD = 2.0
+
+# End-to-end budget (seconds) of one evaluation: agent1, rejection and evaluation calls together
+EVALUATION_DEADLINES_S = {"standalone": 180, "comparison": 240, "ensemble": 240}
+# Connect timeout of a model call, and the least budget worth starting a call with
+CALL_CONNECT_TIMEOUT_S = 10
+CALL_MIN_TIMEOUT_S = 5
+# Read timeout of model calls made without an evaluation deadline
+CALL_DEFAULT_TIMEOUT_S = 300
+
+# Settings used by run_evaluation() for keys the caller leaves out (the app's defaults)
+DEFAULT_SETTINGS = {
+    "standalone_model": "openai/gpt-5.2",
+    "comparison_model": "openai/gpt-5.2",
+    "prefilter_model": "openai/gpt-4o-mini",
+    "reasoning_effort": "none",
+    "output_language": "English",
+    "skill_level": "beginner",
+    "single_call_prefilter": False,
+    "single_pass_evaluation": False,
+    # Languages produced by translating the evaluation (no extra vision calls)
+    "extra_languages": [],
+    "translation_model": "openai/gpt-4o-mini",
+}
+
+REJECTION_FALLBACK_MESSAGES = {
+    "agent2": "This content is not allowed.",
+    "agent3": "We only provide painting lessons for portraits.",
+}
+
+
+class DeadlineExceeded(TimeoutError):
+    """The evaluation budget ran out before a stage could start its model call"""
+
+    def __init__(self, stage, budget_s):
+        super().__init__(f"the {budget_s:.0f}s evaluation budget ran out before the {stage} call")
+        self.stage = stage
+        self.budget_s = budget_s
+
+
+def call_timeout(deadline, stage):
+    """(connect, read) timeout for the next call from the remaining budget.
+
+    `deadline` is a (monotonic deadline, budget_s) pair or None (default timeout).
+    Raises DeadlineExceeded if too little budget is left to start a call.
+    """
+    if deadline is None:
+        return (CALL_CONNECT_TIMEOUT_S, CALL_DEFAULT_TIMEOUT_S)
+    deadline_at, budget_s = deadline
+    remaining = deadline_at - time.monotonic()
+    if remaining < CALL_MIN_TIMEOUT_S:
+        raise DeadlineExceeded(stage, budget_s)
+    return (min(CALL_CONNECT_TIMEOUT_S, remaining), remaining)
+
+
+def make_deadline(budget_s):
+    """(monotonic deadline, budget_s) pair for call_timeout()"""
+    return time.monotonic() + budget_s, budget_s
+
+
+def call_agent1_initial_analysis(api_key, image, model="openai/gpt-4o-mini", reasoning_effort=None,
+                                 timeout=None):
+    """Agent1: Initial image analysis - classifies portrait, censored, etc. Takes image (data URL or ImagePart) as input."""
+    user_content = [
+        {"type": "text", "text": "Analyze this image and return the classification JSON."},
+        {"type": "image_url", "image_url": {"url": image, "detail": "low"}}
+    ]
+    return call_openai_api(api_key, AGENT1_INITIAL_ANALYSIS, user_content, model=model,
+                           reasoning_effort=reasoning_effort, timeout=timeout)
+
+
+def call_agent1_with_rejection_message(api_key, image, output_language="English",
+                                      model="openai/gpt-4o-mini", reasoning_effort=None, timeout=None):
+    """Agent1 single-call mode: classification JSON plus REJECTION_MESSAGE (replaces agent2/agent3)."""
+    user_content = [
+        {"type": "text", "text": "Analyze this image and return the classification JSON."},
+        {"type": "image_url", "image_url": {"url": image, "detail": "low"}}
+    ]
+    prompt = AGENT1_WITH_REJECTION_MESSAGE.format(output_language=output_language)
+    return call_openai_api(api_key, prompt, user_content, model=model,
+                           response_format={"type": "json_object"},
+                           reasoning_effort=reasoning_effort, timeout=timeout)
+
+
+def call_agent2_censored_message(api_key, agent1_output_json, output_language="English", model="openai/gpt-4o-mini",
+                                 reasoning_effort=None, timeout=None):
+    """Agent2: Generates censored content rejection message. Text-only input."""
+    prompt = AGENT2_CENSORED_MESSAGE.format(
+        input_data=agent1_output_json, output_language=output_language)
+    return call_openai_api(api_key, prompt, user_content="Generate the rejection message.", model=model,
+                           reasoning_effort=reasoning_effort, timeout=timeout)
+
+
+def call_agent3_not_portrait_message(api_key, agent1_output_json, output_language="English", model="openai/gpt-4o-mini",
+                                     reasoning_effort=None, timeout=None):
+    """Agent3: Generates not-portrait rejection message. Text-only input."""
+    prompt = AGENT3_NOT_PORTRAIT_MESSAGE.format(
+        input_data=agent1_output_json, output_language=output_language)
+    return call_openai_api(api_key, prompt, user_content="Generate the rejection message.", model=model,
+                           reasoning_effort=reasoning_effort, timeout=timeout)
+
+
+def parse_agent1_response(response_text):
+    """Parse agent1 JSON response. Returns dict or None."""
+    try:
+        start_idx = response_text.find('{')
+        end_idx = response_text.rfind('}') + 1
+        if start_idx != -1 and end_idx > start_idx:
+            return json.loads(response_text[start_idx:end_idx])
+    except json.JSONDecodeError:
+        pass
+    return None
+
+
+def call_translate_evaluation(api_key, texts, source_language, target_language,
+                              model="openai/gpt-4o-mini", timeout=None):
+    """Translates the feedback texts of an evaluation (see translatable_texts). Text-only input."""
+    prompt = TRANSLATE_EVALUATION_PROMPT.format(
+        source_language=source_language, target_language=target_language)
+    return call_openai_api(api_key, prompt, json.dumps(texts, ensure_ascii=False), model=model,
+                           response_format={"type": "json_object"}, timeout=timeout)
+
+
+def call_openai_api(api_key, system_prompt, user_content=None, model="openai/gpt-5.2",
+                      response_format=None, reasoning_effort=None, timeout=None):
+    """Call a chat model (via OpenRouter, or a direct provider from portrait_providers).
+
+    Does not touch st.session_state, so it is safe in worker threads. `timeout`
+    is a requests (connect, read) timeout; every call has one, so a hung
+    connection cannot pin a session or a worker thread. Images in `user_content`
+    may be ImagePart objects; the body is streamed, never serialized in one piece.
+    The returned usage carries the provider name for the cost ledger. Every
+    exchange, failed ones included, goes to the audit log (if configured).
+    Concurrent identical requests share one call (portrait_singleflight); the
+    callers that did not make it get usage marked "coalesced".
+    """
+    provider, provider_model = resolve_provider(model)
+    url, headers, data = build_request(
+        provider, model, provider_model, system_prompt, user_content,
+        response_format=response_format, reasoning_effort=reasoning_effort,
+        max_tokens=OPENROUTER_MAX_TOKENS, api_key=api_key)
+
+    timeout = timeout or (CALL_CONNECT_TIMEOUT_S, CALL_DEFAULT_TIMEOUT_S)
+    # A waiter's connection already exists (the leader's), so only the read timeout bounds its wait
+    (text, usage), shared = MODEL_CALLS.do(
+        request_key(url, data, api_key),
+        lambda: _post_model_request(provider, model, url, headers, data, timeout),
+        timeout=timeout[1] if isinstance(timeout, tuple) else timeout)
+    if shared:
+        usage = {**usage, "coalesced": True}
+    return text, usage
+
+
+def _post_model_request(provider, model, url, headers, data, timeout):
+    """The HTTP exchange behind call_openai_api (audited, failed ones included)"""
+    call_start = time.perf_counter()
+    exchange = {"provider": provider["name"], "model": model, "url": url, "request": data}
+    try:
+        response = requests.post(url, headers=headers, data=StreamingJSONBody(data),
+                                 timeout=timeout)
+        exchange["status"] = response.status_code
+        response.raise_for_status()
+        exchange["response"] = result = response.json()
+    except Exception as e:
+        exchange["error"] = f"{type(e).__name__}: {e}"
+        if exchange.get("status"):
+            exchange["response"] = response.text
+        raise
+    finally:
+        exchange["elapsed_s"] = round(time.perf_counter() - call_start, 3)
+        audit_event(exchange)  # Serialized on the audit thread
+
+    text, usage = parse_response(provider, result)
+    return text, {**usage, "provider": provider["name"]}
+
+
+def _timed_model_call(api_key, system_prompt, user_content, model, reasoning_effort, response_format,
+                      timeout=None):
+    """Runs one call_openai_api in a worker thread; errors are returned, not raised"""
+    call_start = time.perf_counter()
+    try:
+        response_text, usage = call_openai_api(
+            api_key, system_prompt, user_content, model=model,
+            response_format=response_format, reasoning_effort=reasoning_effort, timeout=timeout)
+        return {"model": model, "response_text": response_text, "usage": usage,
+                "elapsed": time.perf_counter() - call_start, "error": None}
+    except Exception as e:
+        return {"model": model, "response_text": None, "usage": {},
+                "elapsed": time.perf_counter() - call_start, "error": e}
+
+
+def call_models_concurrently(api_key, system_prompt, user_content, models, reasoning_effort=None,
+                             response_format=None, deadline_s=None):
+    """Sends the same request to several models at once.
+
+    Returns one result dict per model, in `models` order. Models still running
+    when `deadline_s` expires are reported with a TimeoutError and not awaited;
+    their requests carry the same read timeout, so the worker threads end too.
+    """
+    timeout = (CALL_CONNECT_TIMEOUT_S, deadline_s) if deadline_s else None
+    executor = ThreadPoolExecutor(max_workers=len(models))
+    futures = {
+        executor.submit(_timed_model_call, api_key, system_prompt, user_content,
+                        model, reasoning_effort, response_format, timeout): model
+        for model in models
+    }
+    done, _ = wait(futures, timeout=deadline_s)
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    results = []
+    for future, model in futures.items():
+        if future in done:
+            results.append(future.result())
+        else:
+            results.append({"model": model, "response_text": None, "usage": {}, "elapsed": deadline_s,
+                            "error": TimeoutError(f"{model}: no response within {deadline_s}s")})
+    return results
+
+
+def _aggregate_scores(values, method):
+    """Combines one category's scores from several models"""
+    combined = statistics.median(values) if method == "median" else statistics.fmean(values)
+    return round(combined, 1)
+
+
+def aggregate_ensemble_responses(results, is_comparison=False, method="median"):
+    """Merges parsed responses of several models into one response of the usual shape.
+
+    Each category gets the aggregated score(s) and the feedback of the model whose
+    score is closest to the aggregate. Returns (merged_response, details) or
+    (None, None) if no model produced parseable JSON.
+    """
+    parsed = {}
+    for result in results:
+        if result["error"] is None:
+            response = parse_evaluation_response(result["response_text"], is_comparison)
+            if response:
+                parsed[result["model"]] = response
+    if not parsed:
+        return None, None
+
+    score_keys = ["first_score", "previous_score", "current_score"] if is_comparison else ["score"]
+    main_key = score_keys[-1]
+    merged_categories = {}
+    details = {}
+
+    for category in EVALUATION_CATEGORIES:
+        category_data = {model: response[category] for model, response in parsed.items()
+                         if isinstance(response.get(category), dict)}
+        model_scores = {model: float(data[main_key]) for model, data in category_data.items()
+                        if isinstance(data.get(main_key), (int, float))}
+        if not model_scores:
+            continue
+
+        aggregate = _aggregate_scores(list(model_scores.values()), method)
+        chosen = min(model_scores, key=lambda model: abs(model_scores[model] - aggregate))
+        merged = dict(category_data[chosen])
+        for key in score_keys:
+            values = [data[key] for data in category_data.values()
+                      if isinstance(data.get(key), (int, float))]
+            if values:
+                merged[key] = _aggregate_scores(values, method)
+        if is_comparison and isinstance(merged.get("previous_score"), (int, float)):
+            change = round(merged[main_key] - merged["previous_score"], 1)
+            merged["score_change"] = f"{change:+.1f}" if change else "unchanged"
+
+        spread = max(model_scores.values()) - min(model_scores.values())
+        merged_categories[category] = merged
+        details[category] = {
+            "scores": model_scores,
+            "aggregate": aggregate,
+            "spread": round(spread, 1),
+            "disagreement": spread >= ENSEMBLE_DISAGREEMENT_THRESHOLD,
+            "feedback_from": chosen,
+        }
+
+    # Non-category fields (e.g. progress_summary) come from the most-picked model
+    picks = [detail["feedback_from"] for detail in details.values()]
+    base_model = max(parsed, key=picks.count)
+    merged_response = copy.deepcopy(parsed[base_model])
+    merged_response.update(merged_categories)
+    return merged_response, details
+
+
+def iteration_image_part(iteration):
+    """An iteration's image for a request body: an ImagePart, its data URL, or raw bytes"""
+    if isinstance(iteration.get("image"), ImagePart):
+        return iteration["image"]
+    if iteration.get("image_base64"):
+        return ImagePart.from_data_url(iteration["image_base64"])
+    if iteration.get("image_bytes") is not None:
+        return ImagePart(iteration["image_bytes"], iteration.get("mime_type") or "image/jpeg")
+    return None
+
+
+def evaluation_system_prompt(mode, skill_level="beginner", output_language="English",
+                             compiled_prompts=None, single_pass=False):
+    """System prompt for `mode` ("standalone"/"comparison"): the precompiled variant if
+    `compiled_prompts` has it, else the template filled as written"""
+    compiled = (compiled_prompts or {}).get((mode, skill_level, output_language))
+    if compiled:
+        prompt = compiled["text"]
+    else:
+        prompt = PROMPT_TEMPLATES[mode].format(
+            reference_context="",  # Empty by default, can be customized if needed
+            julia_style_rules=JULIA_STYLE_RULES,
+            audience_complexity=AUDIENCE_COMPLEXITY.get(skill_level, AUDIENCE_COMPLEXITY_BEGINNER),
+            output_language=output_language
+        )
+    if single_pass:
+        prompt += SINGLE_PASS_GATE_INSTRUCTIONS.format(output_language=output_language)
+    return prompt
+
+
+def get_comparison_data(iterations):
+    """Returns data for comparison"""
+    n = len(iterations)
+
+    if n == 1:
+        return {"first": None, "previous": None, "current": iterations[0]}
+    elif n == 2:
+        return {"first": iterations[0], "previous": None, "current": iterations[1]}
+    else:
+        return {"first": iterations[0], "previous": iterations[n-2], "current": iterations[n-1]}
+
+
+def build_standalone_content(image):
+    """Builds content for standalone evaluation (image: data URL or ImagePart)"""
+    return [
+        {"type": "text", "text": "This is a portrait painted by a student. Please evaluate it."},
+        {"type": "image_url", "image_url": {"url": image, "detail": "high"}}
+    ]
+
+
+def build_comparison_content(comparison_data, image_of=None):
+    """Builds content for comparison (`image_of(iteration)` returns an iteration's image for the request)"""
+    image_of = image_of or iteration_image_part
+    user_content = []
+
+    # First iteration
+    if comparison_data["first"]:
+        first = comparison_data["first"]
+        user_content.append(
+            {"type": "text", "text": "=== FIRST ITERATION (Initial Portrait) ==="})
+        user_content.append({"type": "image_url", "image_url": {
+                            "url": image_of(first), "detail": "high"}})
+        user_content.append(
+            {"type": "text", "text": f"First iteration expert evaluation:\n{json.dumps(first['evaluation'], indent=2, ensure_ascii=False)}"})
+
+    # Previous iteration
+    if comparison_data["previous"]:
+        previous = comparison_data["previous"]
+        user_content.append(
+            {"type": "text", "text": "=== PREVIOUS ITERATION (Most Recent Before Current) ==="})
+        user_content.append({"type": "image_url", "image_url": {
+                            "url": image_of(previous), "detail": "high"}})
+        user_content.append(
+            {"type": "text", "text": f"Previous iteration expert evaluation:\n{json.dumps(previous['evaluation'], indent=2, ensure_ascii=False)}"})
+
+    # Current iteration
+    current = comparison_data["current"]
+    user_content.append(
+        {"type": "text", "text": "=== CURRENT ITERATION (To Be Evaluated) ==="})
+    user_content.append({"type": "image_url", "image_url": {
+                        "url": image_of(current), "detail": "high"}})
+    user_content.append(
+        {"type": "text", "text": "Please analyze the current portrait, compare it with the previous iterations, and provide a comprehensive evaluation."})
+
+    return user_content
+
+
+def parse_evaluation_response(response_text, is_comparison=False):
+    """Parses API response"""
+    try:
+        # Try to find JSON in response
+        start_idx = response_text.find('{')
+        end_idx = response_text.rfind('}') + 1
+        if start_idx != -1 and end_idx > start_idx:
+            json_str = response_text[start_idx:end_idx]
+            return json.loads(json_str)
+    except json.JSONDecodeError:
+        pass
+    return None
+
+
+def extract_standard_evaluation(parsed_response, is_comparison=False):
+    """Extracts standard evaluation format from response"""
+    if not parsed_response:
+        return None
+
+    standard_eval = {}
+
+    for category in EVALUATION_CATEGORIES:
+        if category in parsed_response:
+            cat_data = parsed_response[category]
+            if is_comparison and "current_score" in cat_data:
+                standard_eval[category] = {
+                    "score": cat_data.get("current_score"),
+                    "feedback": cat_data.get("feedback", "")
+                }
+            elif "score" in cat_data:
+                standard_eval[category] = {
+                    "score": cat_data.get("score"),
+                    "feedback": cat_data.get("feedback", "")
+                }
+
+    return standard_eval if standard_eval else None
+
+
+def calculate_average_score(evaluation):
+    """Calculates average score"""
+    if not evaluation:
+        return 0
+    scores = [v.get("score", 0) for v in evaluation.values()
+              if isinstance(v, dict) and "score" in v]
+    return sum(scores) / len(scores) if scores else 0
+
+
+def translatable_texts(evaluation, parsed_response=None):
+    """The feedback strings of an evaluation, keyed for translation (scores stay out of it)"""
+    texts = {"categories": {category: data.get("feedback", "") for category, data in evaluation.items()
+                            if isinstance(data, dict) and data.get("feedback")}}
+    summary = (parsed_response or {}).get("progress_summary")
+    if isinstance(summary, dict):
+        texts["progress_summary"] = {key: value for key, value in summary.items()
+                                     if isinstance(value, str) and value}
+    return texts
+
+
+def apply_translation(evaluation, texts, response_text):
+    """{"evaluation", "progress_summary"} in the translated language, or None if unparseable.
+
+    Scores always come from the original evaluation; texts the model dropped stay untranslated.
+    """
+    translated = parse_evaluation_response(response_text)
+    if not isinstance(translated, dict):
+        return None
+    categories = translated.get("categories") or {}
+    summary = translated.get("progress_summary") or {}
+    return {
+        "evaluation": {
+            category: {**data, "feedback": categories.get(category) or data.get("feedback", "")}
+            if isinstance(data, dict) else data
+            for category, data in evaluation.items()
+        },
+        "progress_summary": {key: summary.get(key) or value
+                             for key, value in texts.get("progress_summary", {}).items()} or None,
+    }
+
+
+def _timed_translation(api_key, evaluation, texts, source_language, language, model, timeout):
+    call_start = time.perf_counter()
+    try:
+        response_text, usage = call_translate_evaluation(
+            api_key, texts, source_language, language, model=model, timeout=timeout)
+        translation = apply_translation(evaluation, texts, response_text)
+        error = None if translation else ValueError(f"{model} returned no parseable translation")
+        return {"language": language, "translation": translation, "usage": usage,
+                "elapsed": time.perf_counter() - call_start, "error": error}
+    except Exception as e:
+        return {"language": language, "translation": None, "usage": {},
+                "elapsed": time.perf_counter() - call_start, "error": e}
+
+
+def translate_evaluation_concurrently(api_key, evaluation, parsed_response, source_language,
+                                      languages, model="openai/gpt-4o-mini", deadline_s=None):
+    """Translates one evaluation into several languages at once (one cheap text call each).
+
+    Returns one result dict per language, in `languages` order, like
+    call_models_concurrently: "translation" is None when the call failed or
+    missed `deadline_s`, with the reason in "error".
+    """
+    texts = translatable_texts(evaluation, parsed_response)
+    timeout = (CALL_CONNECT_TIMEOUT_S, deadline_s) if deadline_s else None
+    executor = ThreadPoolExecutor(max_workers=len(languages))
+    futures = {
+        executor.submit(_timed_translation, api_key, evaluation, texts, source_language,
+                        language, model, timeout): language
+        for language in languages
+    }
+    done, _ = wait(futures, timeout=deadline_s)
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    results = []
+    for future, language in futures.items():
+        if future in done:
+            results.append(future.result())
+        else:
+            results.append({"language": language, "translation": None, "usage": {}, "elapsed": deadline_s,
+                            "error": TimeoutError(f"{language}: no translation within {deadline_s}s")})
+    return results
+
+
+def rejection_call_type(gate_data):
+    """"agent2" (censored), "agent3" (not a portrait) or None if the gate passed"""
+    if gate_data.get("CENCORED_CONTENT") is True:
+        return "agent2"
+    if gate_data.get("IS_PORTRAIT") is False:
+        return "agent3"
+    return None
+
+
+def single_pass_gate(responses):
+    """Gate verdict of single-pass responses (one per model, e.g. an ensemble), failing closed.
+
+    The image counts as censored if any response says so or leaves CENCORED_CONTENT
+    out, and as not a portrait if any response says so or leaves IS_PORTRAIT out.
+    REJECTION_MESSAGE comes from a response that rejected for that same reason.
+    """
+    responses = list(responses) or [{}]  # No verdict at all fails closed too
+    censored = [response for response in responses if response.get("CENCORED_CONTENT") is not False]
+    not_portrait = [response for response in responses if response.get("IS_PORTRAIT") is not True]
+    deciding = censored or not_portrait
+    messages = [response.get("REJECTION_MESSAGE") for response in deciding]
+    return {"IS_PORTRAIT": not not_portrait, "CENCORED_CONTENT": bool(censored),
+            "REJECTION_MESSAGE": next((message for message in messages if message), None)}
+
+
+def run_evaluation(api_key, image, history=(), settings=None, deadline=None,
+                   prices=None, compiled_prompts=None):
+    """Runs the agent1 gate and the standalone/comparison evaluation for one upload.
+
+    `image` is an ImagePart (or data URL); `history` holds the session's earlier
+    accepted iterations, oldest first, each with an "evaluation" and an image
+    (see iteration_image_part). Returns a dict with "status" "rejected"
+    (+ "message") or "evaluated" (+ evaluation fields), the gate verdict as
+    "prefilter", and the call ledger as "calls"/"cost". Model errors and
+    DeadlineExceeded propagate to the caller.
+    """
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+    language = settings["output_language"]
+    calls = []
+
+    def timed_call(call_type, model, make_call):
+        timeout = call_timeout(deadline, call_type)
+        call_start = time.perf_counter()
+        text, usage = make_call(model, timeout)
+        calls.append(make_ledger_entry(call_type, model, usage, prices,
+                                       time.perf_counter() - call_start))
+        return text
+
+    def result(status, **fields):
+        return {"status": status, "calls": calls, "cost": summarize_ledger(calls), **fields}
+
+    # Agent1 gate (skipped in single-pass mode, where the evaluation call does it)
+    prefilter = None
+    if not settings["single_pass_evaluation"]:
+        if settings["single_call_prefilter"]:
+            agent1_text = timed_call("agent1", settings["prefilter_model"], lambda model, timeout:
+                                     call_agent1_with_rejection_message(
+                                         api_key, image, output_language=language, model=model,
+                                         reasoning_effort=settings["reasoning_effort"], timeout=timeout))
+        else:
+            agent1_text = timed_call("agent1", settings["prefilter_model"], lambda model, timeout:
+                                     call_agent1_initial_analysis(
+                                         api_key, image, model=model,
+                                         reasoning_effort=settings["reasoning_effort"], timeout=timeout))
+        prefilter = parse_agent1_response(agent1_text)
+
+    def rejected(gate_data):
+        call_type = rejection_call_type(gate_data)
+        message = gate_data.pop("REJECTION_MESSAGE", None)
+        if not message:
+            make_message = (call_agent2_censored_message if call_type == "agent2"
+                            else call_agent3_not_portrait_message)
+            try:
+                message = timed_call(call_type, settings["prefilter_model"], lambda model, timeout:
+                                     make_message(api_key, json.dumps(gate_data, indent=2),
+                                                  output_language=language, model=model,
+                                                  reasoning_effort=settings["reasoning_effort"],
+                                                  timeout=timeout))
+            except (requests.exceptions.RequestException, DeadlineExceeded):
+                message = None
+        return result("rejected", message=message or REJECTION_FALLBACK_MESSAGES[call_type],
+                      prefilter=gate_data)
+
+    if prefilter and rejection_call_type(prefilter):
+        return rejected(prefilter)
+    if prefilter:
+        prefilter.pop("REJECTION_MESSAGE", None)
+
+    # Standalone / comparison evaluation
+    is_comparison = len(history) > 0
+    mode = "comparison" if is_comparison else "standalone"
+    system_prompt = evaluation_system_prompt(
+        mode, settings["skill_level"], language, compiled_prompts,
+        single_pass=settings["single_pass_evaluation"])
+    if is_comparison:
+        current = {"image": image if isinstance(image, ImagePart) else ImagePart.from_data_url(image)}
+        user_content = build_comparison_content(get_comparison_data(list(history) + [current]))
+    else:
+        user_content = build_standalone_content(image)
+    model = settings[f"{mode}_model"]
+    response_text = timed_call(mode, model, lambda model, timeout: call_openai_api(
+        api_key, system_prompt, user_content, model=model,
+        response_format={"type": "json_object"},
+        reasoning_effort=settings["reasoning_effort"], timeout=timeout))
+    parsed_response = parse_evaluation_response(response_text, is_comparison)
+
+    if settings["single_pass_evaluation"] and parsed_response is not None:
+        gate_data = single_pass_gate([parsed_response])
+        if rejection_call_type(gate_data):
+            return rejected(gate_data)
+        prefilter = {"IS_PORTRAIT": gate_data["IS_PORTRAIT"],
+                     "CENCORED_CONTENT": gate_data["CENCORED_CONTENT"], "single_pass": True}
+
+    evaluation = extract_standard_evaluation(parsed_response, is_comparison)
+    if evaluation is None:
+        raise ValueError(f"{model} returned no parseable evaluation")
+
+    # Extra languages: translate the finished evaluation instead of evaluating again
+    translations = {}
+    translation_results = []
+    languages = [lang for lang in settings["extra_languages"] if lang != language]
+    if languages:
+        try:
+            translation_results = translate_evaluation_concurrently(
+                api_key, evaluation, parsed_response, language, languages,
+                settings["translation_model"], call_timeout(deadline, "translation")[1])
+        except DeadlineExceeded:
+            pass  # The evaluation itself is done; it is returned untranslated
+    for item in translation_results:
+        if item["usage"]:
+            calls.append(make_ledger_entry("translation", settings["translation_model"],
+                                           item["usage"], prices, item["elapsed"]))
+        if item["translation"]:
+            translations[item["language"]] = item["translation"]
+
+    return result("evaluated", evaluation=evaluation, parsed_response=parsed_response,
+                  raw_response=response_text, system_prompt=system_prompt, model=model,
+                  reasoning_effort=settings["reasoning_effort"], is_comparison=is_comparison,
+                  prefilter=prefilter, translations=translations, output_language=language)
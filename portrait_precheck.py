@@ -0,0 +1,188 @@
+"""Local CPU image checks run before the agent1 call (shared by Streamlit app and CLI scripts).
+
+Decides in milliseconds what needs no model: unreadable files, tiny images and
+extreme aspect ratios are rejected; a single large detected face marks a
+high-confidence portrait. Everything else is left to agent1. Face detection
+uses OpenCV's Haar cascade when opencv-python(-headless) is installed.
+A 64-bit difference hash (dHash) of each upload finds near-duplicates.
+"""
+
+import io
+import time
+
+from PIL import Image, UnidentifiedImageError
+
+try:
+    import cv2
+    import numpy as np
+except ImportError:  # Face detection is optional; validation still runs
+    cv2 = None
+
+PRECHECK_REJECT = "reject"
+PRECHECK_PORTRAIT = "portrait"
+PRECHECK_UNKNOWN = "unknown"
+
+# Upload limits
+PRECHECK_MAX_BYTES = 20 * 1024 * 1024
+PRECHECK_MIN_SIDE_PX = 128
+PRECHECK_MAX_ASPECT_RATIO = 4.0
+# Longest side the face detector works on (downscaled for speed)
+PRECHECK_DETECT_SIDE_PX = 640
+# One face covering at least this share of the image counts as a clear portrait
+PRECHECK_PORTRAIT_FACE_AREA = 0.08
+
+# dHash bits (of 64) two uploads may differ in and still count as near-duplicates. Kept
+# tight: successive progress photos of one painting differ by only a few bits.
+PHASH_DUPLICATE_DISTANCE = 2
+
+# Reason code -> localized message shown for local rejections (no model call)
+LOCAL_REJECTION_MESSAGES = {
+    "unreadable": {
+        "English": "We couldn't open this file as an image. Please upload a JPG, PNG or WEBP photo of your portrait.",
+        "Ukrainian": "Не вдалося відкрити цей файл як зображення. Будь ласка, завантажте фото портрета у форматі JPG, PNG або WEBP.",
+        "Russian": "Не удалось открыть этот файл как изображение. Пожалуйста, загрузите фото портрета в формате JPG, PNG или WEBP.",
+        "Spanish": "No pudimos abrir este archivo como imagen. Sube una foto de tu retrato en JPG, PNG o WEBP.",
+        "French": "Nous n'avons pas pu ouvrir ce fichier comme image. Merci d'envoyer une photo de ton portrait en JPG, PNG ou WEBP.",
+        "German": "Diese Datei konnte nicht als Bild geöffnet werden. Bitte lade ein Foto deines Porträts als JPG, PNG oder WEBP hoch.",
+    },
+    "unsuitable": {
+        "English": "This image is too small or has an unusual shape to evaluate. Please upload a clear, complete photo of your portrait.",
+        "Ukrainian": "Це зображення замале або має незвичну форму для оцінювання. Будь ласка, завантажте чітке повне фото портрета.",
+        "Russian": "Это изображение слишком маленькое или имеет необычную форму для оценки. Пожалуйста, загрузите чёткое полное фото портрета.",
+        "Spanish": "Esta imagen es demasiado pequeña o tiene una forma inusual para evaluarla. Sube una foto clara y completa de tu retrato.",
+        "French": "Cette image est trop petite ou a une forme inhabituelle pour être évaluée. Merci d'envoyer une photo nette et complète de ton portrait.",
+        "German": "Dieses Bild ist zu klein oder hat ein ungewöhnliches Format für eine Bewertung. Bitte lade ein klares, vollständiges Foto deines Porträts hoch.",
+    },
+}
+
+_FACE_CASCADE = None
+# Set once the detector failed to load; detection then stays off for the process
+_FACE_CASCADE_FAILED = False
+
+
+def _face_detector():
+    """Lazily loaded Haar cascade (None without OpenCV or if it cannot be loaded)"""
+    global _FACE_CASCADE, _FACE_CASCADE_FAILED
+    if cv2 is None or _FACE_CASCADE_FAILED:
+        return None
+    if _FACE_CASCADE is None:
+        try:
+            cascade = cv2.CascadeClassifier(
+                cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+            if cascade.empty():
+                raise ValueError("Haar cascade file not loaded")
+        except Exception:  # Missing API in another OpenCV release, missing data files
+            _FACE_CASCADE_FAILED = True
+            return None
+        _FACE_CASCADE = cascade
+    return _FACE_CASCADE
+
+
+def detect_faces(gray_image):
+    """Face boxes (x, y, w, h) in a grayscale PIL image, or None if detection is unavailable"""
+    detector = _face_detector()
+    if detector is None:
+        return None
+    try:
+        pixels = np.asarray(gray_image, dtype=np.uint8)
+        min_side = max(24, min(pixels.shape) // 10)
+        faces = detector.detectMultiScale(
+            pixels, scaleFactor=1.1, minNeighbors=5, minSize=(min_side, min_side))
+        return [tuple(int(v) for v in face) for face in faces]
+    except Exception:  # A detector error only costs the shortcut; agent1 still decides
+        return None
+
+
+def dhash(gray_image):
+    """64-bit difference hash of a grayscale PIL image, as 16 hex chars"""
+    small = gray_image.resize((9, 8), Image.BILINEAR)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] < pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+
+def perceptual_hash(image_bytes):
+    """dHash of encoded image bytes, or None if the image cannot be decoded"""
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        image.draft("L", (64, 64))
+        return dhash(image.convert("L"))
+    except (UnidentifiedImageError, OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+
+def hash_distance(hash_a, hash_b):
+    """Number of differing bits between two hex hashes"""
+    return (int(hash_a, 16) ^ int(hash_b, 16)).bit_count()
+
+
+def find_near_duplicate(phash, candidates, max_distance=PHASH_DUPLICATE_DISTANCE):
+    """Closest (key, distance) among `candidates` ((key, phash) pairs) within max_distance, else (None, None)"""
+    best_key, best_distance = None, None
+    if not phash:
+        return best_key, best_distance
+    for key, candidate_hash in candidates:
+        if not candidate_hash:
+            continue
+        distance = hash_distance(phash, candidate_hash)
+        if distance <= max_distance and (best_distance is None or distance < best_distance):
+            best_key, best_distance = key, distance
+    return best_key, best_distance
+
+
+def precheck_image(image_bytes):
+    """Runs the local checks and returns a verdict dict.
+
+    verdict is PRECHECK_REJECT (with `reason_code` "unreadable"/"unsuitable"),
+    PRECHECK_PORTRAIT (one large face) or PRECHECK_UNKNOWN (ask agent1).
+    """
+    started = time.perf_counter()
+    result = {"verdict": PRECHECK_UNKNOWN, "reason": None, "reason_code": None,
+              "width": None, "height": None, "faces": None, "phash": None}
+
+    def done(verdict, reason=None, reason_code=None):
+        result.update(verdict=verdict, reason=reason, reason_code=reason_code,
+                      elapsed_ms=round((time.perf_counter() - started) * 1000, 1))
+        return result
+
+    if not image_bytes:
+        return done(PRECHECK_REJECT, "empty file", "unreadable")
+    if len(image_bytes) > PRECHECK_MAX_BYTES:
+        return done(PRECHECK_REJECT, f"file larger than {PRECHECK_MAX_BYTES // (1024 * 1024)} MB", "unsuitable")
+
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        width, height = image.size
+        # JPEG can decode at reduced scale directly; other formats are decoded fully
+        image.draft("L", (PRECHECK_DETECT_SIDE_PX, PRECHECK_DETECT_SIDE_PX))
+        gray = image.convert("L")
+    except (UnidentifiedImageError, OSError, ValueError, Image.DecompressionBombError) as e:
+        return done(PRECHECK_REJECT, f"cannot decode image: {e}", "unreadable")
+
+    result.update(width=width, height=height, phash=dhash(gray))
+    if min(width, height) < PRECHECK_MIN_SIDE_PX:
+        return done(PRECHECK_REJECT, f"image smaller than {PRECHECK_MIN_SIDE_PX}px", "unsuitable")
+    if max(width, height) / min(width, height) > PRECHECK_MAX_ASPECT_RATIO:
+        return done(PRECHECK_REJECT, f"aspect ratio above {PRECHECK_MAX_ASPECT_RATIO}:1", "unsuitable")
+
+    gray.thumbnail((PRECHECK_DETECT_SIDE_PX, PRECHECK_DETECT_SIDE_PX))
+    faces = detect_faces(gray)
+    result["faces"] = None if faces is None else len(faces)
+    if faces and len(faces) == 1:
+        _, _, face_w, face_h = faces[0]
+        face_share = face_w * face_h / (gray.width * gray.height)
+        if face_share >= PRECHECK_PORTRAIT_FACE_AREA:
+            return done(PRECHECK_PORTRAIT, f"one face covering {face_share:.0%} of the image")
+    # No face is not proof of a non-portrait (stylized drawings often evade
+    # Haar cascades), so those cases go to agent1
+    return done(PRECHECK_UNKNOWN)
+
+
+def local_rejection_message(precheck, output_language="English"):
+    """Localized user message for a PRECHECK_REJECT verdict"""
+    messages = LOCAL_REJECTION_MESSAGES.get(precheck.get("reason_code"),
+                                            LOCAL_REJECTION_MESSAGES["unsuitable"])
+    return messages.get(output_language, messages["English"])
@@ -0,0 +1,105 @@
+"""Prompt build step: named sections, minified, precompiled per variant (shared by Streamlit app and CLI scripts).
+
+The templates in portrait_prompts.py stay the hand-edited source. Compiling a
+template fills its placeholders, splits the result into named sections at its
+markdown headings and minifies whitespace; every rule is kept where the
+template states it, repeats included. Every (mode, skill level, language)
+variant is compiled once, and each carries a per-section token profile.
+
+    python portrait_prompt_compiler.py   # prints the token profile of every variant
+"""
+
+import re
+
+from portrait_prompts import (
+    AUDIENCE_COMPLEXITY,
+    COMPARISON_PROMPT,
+    EVALUATE_PORTRAIT_STANDALONE,
+    JULIA_STYLE_RULES,
+    OUTPUT_LANGUAGES,
+)
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:  # Optional (and may need a download); estimates are used without it
+    _ENCODING = None
+
+PROMPT_TEMPLATES = {
+    "standalone": EVALUATE_PORTRAIT_STANDALONE,
+    "comparison": COMPARISON_PROMPT,
+}
+
+# Section boundaries: markdown headings ("## ..." / "### ...")
+_HEADING = re.compile(r"^#{2,3} +(.+?):?\s*$")
+
+
+def count_tokens(text):
+    """Token count with tiktoken if installed, else the ~4 characters per token estimate"""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return (len(text) + 3) // 4
+
+
+def split_sections(text):
+    """[(name, text)] split at markdown headings; text before the first heading is "preamble" """
+    sections = [["preamble", []]]
+    for line in text.splitlines():
+        match = _HEADING.match(line.strip())
+        if match:
+            sections.append([match.group(1).strip("* "), []])
+        sections[-1][1].append(line)
+    return [(name, "\n".join(lines)) for name, lines in sections if "".join(lines).strip()]
+
+
+def minify(text):
+    """Strips trailing spaces, collapses inner space runs and blank-line runs (indentation is kept)"""
+    lines = []
+    for line in text.splitlines():
+        indent = len(line) - len(line.lstrip(" "))
+        line = " " * indent + re.sub(r"[ \t]+", " ", line.strip())
+        if line or (lines and lines[-1]):
+            lines.append(line)
+    return "\n".join(lines).strip()
+
+
+def compile_prompt(template, **values):
+    """Fills, sections and minifies a template.
+
+    Returns {"text", "tokens", "raw_tokens", "sections": [{"name", "tokens", "raw_tokens"}]}.
+    """
+    raw = template.format(**values)
+    raw_sections = split_sections(raw)
+    sections = [(name, minify(text)) for name, text in raw_sections]
+    text = "\n\n".join(section_text for _, section_text in sections if section_text)
+    return {
+        "text": text,
+        "tokens": count_tokens(text),
+        "raw_tokens": count_tokens(raw),
+        "sections": [{"name": name, "tokens": count_tokens(section_text),
+                      "raw_tokens": count_tokens(raw_text)}
+                     for (name, section_text), (_, raw_text) in zip(sections, raw_sections)],
+    }
+
+
+def compile_prompt_variants(languages=OUTPUT_LANGUAGES, skill_levels=tuple(AUDIENCE_COMPLEXITY)):
+    """Compiles every (mode, skill level, language) variant; keyed by that tuple"""
+    variants = {}
+    for mode, template in PROMPT_TEMPLATES.items():
+        for skill_level in skill_levels:
+            for language in languages:
+                variants[(mode, skill_level, language)] = compile_prompt(
+                    template,
+                    reference_context="",
+                    julia_style_rules=JULIA_STYLE_RULES,
+                    audience_complexity=AUDIENCE_COMPLEXITY[skill_level],
+                    output_language=language,
+                )
+    return variants
+
+
+if __name__ == "__main__":
+    for (mode, skill_level, language), compiled in compile_prompt_variants(languages=["English"]).items():
+        print(f"\n{mode} / {skill_level}: {compiled['raw_tokens']} -> {compiled['tokens']} tokens")
+        for section in sorted(compiled["sections"], key=lambda s: -s["tokens"]):
+            print(f"  {section['tokens']:6d}  (raw {section['raw_tokens']:6d})  {section['name']}")
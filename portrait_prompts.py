@@ -64,6 +64,16 @@ Important:
 - Always express suggestions as concrete, small actions (e.g., "make this darker", "soften this edge", "add a small highlight"), not abstract advice
 """
 
+# Evaluation categories (JSON keys of the standalone and comparison outputs, in prompt order)
+EVALUATION_CATEGORIES = [
+    "Composition and Design", "Proportions and Anatomy", "Perspective and Depth",
+    "Use of Light and Shadow", "Color Theory and Application", "Brushwork and Technique",
+    "Expression and Emotion", "Creativity and Originality", "Attention to Detail", "Overall Impact"
+]
+
+# Languages the feedback can be written in ({output_language})
+OUTPUT_LANGUAGES = ["English", "Ukrainian", "Russian", "Spanish", "French", "German"]
+
 # Audience complexity levels (affects feedback vocabulary and depth)
 AUDIENCE_COMPLEXITY_BEGINNER = """AUDIENCE AND COMPLEXITY (Beginner):
 - The reader is a 12-14 year old girl or a complete beginner. Use very simple words and short sentences.
@@ -699,3 +709,122 @@ Before finalizing your response, verify each of these points:
 
 **OUTPUT LANGUAGE:** All feedback text, progress_summary, and advanced_feedback must be written in {output_language}.
 """
+
+# Appended to the evaluation prompt in single-pass mode: the evaluation call also
+# does agent1's portrait/censorship gate, so accepted uploads need one model call
+SINGLE_PASS_GATE_INSTRUCTIONS = """
+
+### Image Gate (answer first, in the same JSON object):
+Before evaluating, classify the (current) image and add these top-level fields to your JSON output:
+    "IS_PORTRAIT": <Bool>,          // true if the image is a portrait (focuses on a person's face or upper body)
+    "CENCORED_CONTENT": <Bool>,     // true if it contains nudity, explicit material or other sensitive elements
+    "REJECTION_MESSAGE": "<String or null>"
+
+- If "CENCORED_CONTENT" is true: set "REJECTION_MESSAGE" to a short message (maximum 300 characters, in {output_language}) explaining that this content is not allowed, and leave out all evaluation categories.
+- Else if "IS_PORTRAIT" is false: set "REJECTION_MESSAGE" to a short message (maximum 300 characters, in {output_language}) explaining that at the moment you only provide painting lessons for portraits, and leave out all evaluation categories.
+- Otherwise set "REJECTION_MESSAGE" to null and give the full evaluation as specified above.
+"""
+
+# Prompts - Pre-filter agents (agent1, agent2, agent3)
+AGENT1_INITIAL_ANALYSIS = """### Task:
+You are provided with an image from a painting student. Your task is to analyze the uploaded image and classify its contents. Based on your analysis, return a JSON-formatted output containing the following variables:
+
+### Output Format:
+The output should be a JSON object with the following structure:
+{{
+    "OBJECT_ON_IMAGE": "<String>",
+    "IS_PORTRAIT": <Bool>,
+    "CENCORED_CONTENT": <Bool>,
+    "PAINTING_OR_DRAWING_OR_ELSE": "<String>",
+    "DRAWING_STYLE": "<String>"
+}}
+
+### Variables:
+1. **OBJECT_ON_IMAGE**: A string describing the objects visible on the image.
+2. **IS_PORTRAIT**: A Boolean value indicating whether the image contains a portrait.
+   - Return `True` if the image contains a portrait (i.e., focuses on a person's face or upper body).
+   - Return `False` if the image does not contains a portrait.
+3. **CENCORED_CONTENT**: A Boolean value indicating whether the image contains censored content.
+   - Return `True` if the image includes censored content such as nudity, explicit material, or other sensitive elements.
+   - Return `False` if the image does not contain censored content.
+4. **PAINTING_OR_DRAWING_OR_ELSE**: A string indicating the type of the artwork.
+   - Return `"Painting"` if the image is of a painting (i.e., an artwork created using paints, such as oil, acrylic, or watercolor).
+   - Return `"Drawing"` if the image is of a drawing (i.e., an artwork created using dry media like pencils, charcoal, or ink).
+   - Return `"Manga"` if the image is of a manga style drawing or painting.
+   - Return `"Cartoon"` if the image is of a cartoon style drawing or painting.
+   - Return `"Else"` if the image is neither a painting nor a drawing.
+5. **DRAWING_STYLE**: A string indicating the style of the drawing.
+
+### Rules:
+- Always provide concise and accurate descriptions for the "OBJECT_ON_IMAGE".
+- Ensure the Boolean values for "IS_PORTRAIT" and "CENCORED_CONTENT" are accurate based on the image content.
+- Correctly classify the image type in "PAINTING_OR_DRAWING_OR_ELSE" according to the visual cues.
+- Carefully examine the input image to ensure the accuracy of the output format in JSON.
+- If unsure about any classification, use your best judgment based on the image content.
+"""
+# Single-call variant of agent1: classification plus, when rejecting, the agent2/agent3 message
+AGENT1_WITH_REJECTION_MESSAGE = """### Task:
+You are provided with an image from a painting student. Your task is to analyze the uploaded image and classify its contents. Based on your analysis, return a JSON-formatted output containing the following variables:
+
+### Output Format:
+The output should be a JSON object with the following structure:
+{{
+    "OBJECT_ON_IMAGE": "<String>",
+    "IS_PORTRAIT": <Bool>,
+    "CENCORED_CONTENT": <Bool>,
+    "PAINTING_OR_DRAWING_OR_ELSE": "<String>",
+    "DRAWING_STYLE": "<String>",
+    "REJECTION_MESSAGE": "<String or null>"
+}}
+
+### Variables:
+1. **OBJECT_ON_IMAGE**: A string describing the objects visible on the image.
+2. **IS_PORTRAIT**: A Boolean value indicating whether the image contains a portrait.
+   - Return `True` if the image contains a portrait (i.e., focuses on a person's face or upper body).
+   - Return `False` if the image does not contains a portrait.
+3. **CENCORED_CONTENT**: A Boolean value indicating whether the image contains censored content.
+   - Return `True` if the image includes censored content such as nudity, explicit material, or other sensitive elements.
+   - Return `False` if the image does not contain censored content.
+4. **PAINTING_OR_DRAWING_OR_ELSE**: A string indicating the type of the artwork.
+   - Return `"Painting"` if the image is of a painting (i.e., an artwork created using paints, such as oil, acrylic, or watercolor).
+   - Return `"Drawing"` if the image is of a drawing (i.e., an artwork created using dry media like pencils, charcoal, or ink).
+   - Return `"Manga"` if the image is of a manga style drawing or painting.
+   - Return `"Cartoon"` if the image is of a cartoon style drawing or painting.
+   - Return `"Else"` if the image is neither a painting nor a drawing.
+5. **DRAWING_STYLE**: A string indicating the style of the drawing.
+6. **REJECTION_MESSAGE**: A message to the student, written in {output_language}, maximum 300 characters.
+   - If "CENCORED_CONTENT" is `True`: explain that this censored content is not allowed.
+   - Else if "IS_PORTRAIT" is `False`: explain that at the moment you only provide painting lessons for portraits.
+   - Otherwise return `null`.
+
+### Rules:
+- Always provide concise and accurate descriptions for the "OBJECT_ON_IMAGE".
+- Ensure the Boolean values for "IS_PORTRAIT" and "CENCORED_CONTENT" are accurate based on the image content.
+- Correctly classify the image type in "PAINTING_OR_DRAWING_OR_ELSE" according to the visual cues.
+- Carefully examine the input image to ensure the accuracy of the output format in JSON.
+- If unsure about any classification, use your best judgment based on the image content.
+"""
+AGENT2_CENSORED_MESSAGE = """### Task:
+You were provided with an image from a painting student. Your task was to analyze the image and classify its contents. Based on your analysis, you have found that the image has censored content.
+This was your output:
+{input_data}
+
+Your task is to write a message in {output_language} explaining that this censored content is not allowed. Maximum amount of characters is 300.
+"""
+AGENT3_NOT_PORTRAIT_MESSAGE = """### Task:
+You were provided with an image from a painting student. Your task was to analyze the image and classify its contents. Based on your analysis, you have found that the image does not contain a portrait.
+This was your output:
+{input_data}
+
+Your task is to write a message in {output_language} explaining that at the moment you only provide painting lessons for portraits. Maximum amount of characters is 300.
+"""
+TRANSLATE_EVALUATION_PROMPT = """### Task:
+You translate feedback that an art teacher wrote for a painting student from {source_language} into {target_language}.
+The input is a JSON object whose values are the feedback texts.
+
+### Rules:
+- Return a JSON object with exactly the same keys and nesting; translate only the string values.
+- Keep the meaning, tone and vocabulary level of the original; do not add, drop or soften advice.
+- Keep numbers, names and art terms that have no common {target_language} equivalent unchanged.
+- Return only the JSON object.
+"""
@@ -0,0 +1,238 @@
+"""Model provider endpoints and payload dialects (shared by Streamlit app and CLI scripts).
+
+Every call goes to OpenRouter unless a direct provider is configured for the
+model. A provider is a base URL, an API key and a payload dialect:
+
+    "openrouter"  OpenAI chat completions plus `reasoning: {effort}`
+    "openai"      OpenAI chat completions (`reasoning_effort`, `max_completion_tokens`)
+    "anthropic"   Anthropic messages API (top-level system, base64 image sources, `thinking`)
+
+Config (Streamlit `[providers.<name>]` secrets, or PORTRAIT_PROVIDERS JSON):
+
+    [providers.openai]
+    base_url = "https://api.openai.com/v1"
+    dialect = "openai"
+    api_key = "sk-..."
+    models = ["openai/"]     # model id prefixes routed here; the prefix is stripped
+
+`model_map` renames individual models ({"anthropic/claude-haiku-4.5":
+"claude-haiku-4-5"}). A base URL like http://127.0.0.1:8900/v1 targets a
+local stand-in:
+
+    python portrait_providers.py --stand-in 8900 --latency 0.5
+"""
+
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from portrait_http import ImagePart
+from portrait_prompts import EVALUATION_CATEGORIES
+
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+DIALECT_PATHS = {
+    "openrouter": "/chat/completions",
+    "openai": "/chat/completions",
+    "anthropic": "/messages",
+}
+
+ANTHROPIC_VERSION = "2023-06-01"
+# Extended-thinking token budget per reasoning effort (must stay below max_tokens)
+ANTHROPIC_THINKING_BUDGETS = {"minimal": 1024, "low": 2048, "medium": 4096, "high": 8192}
+
+# Models that take a reasoning effort (OpenRouter-style ids, before prefix stripping);
+# extend to route efforts to Anthropic models as thinking budgets
+REASONING_MODEL_PREFIXES = ("openai/gpt-5",)
+
+DEFAULT_PROVIDER = {
+    "name": "openrouter",
+    "base_url": OPENROUTER_BASE_URL,
+    "dialect": "openrouter",
+    "api_key": None,  # The api_key passed to the call
+    "models": [],
+    "model_map": {},
+}
+
+_providers = []
+
+
+def configure_providers(config=None):
+    """Sets the direct providers from a {name: settings} mapping; raises ValueError on bad entries"""
+    providers = []
+    for name, settings in (config or {}).items():
+        settings = dict(settings)
+        provider = {**DEFAULT_PROVIDER, "name": name, **settings,
+                    "models": list(settings.get("models", [])),
+                    "model_map": dict(settings.get("model_map", {}))}
+        if provider["dialect"] not in DIALECT_PATHS:
+            raise ValueError(f"Provider {name}: unknown dialect {provider['dialect']!r}")
+        if not provider["models"] and not provider["model_map"]:
+            raise ValueError(f"Provider {name}: needs `models` prefixes or a `model_map`")
+        provider["base_url"] = provider["base_url"].rstrip("/")
+        providers.append(provider)
+    _providers[:] = providers
+    return providers
+
+
+def resolve_provider(model):
+    """(provider, provider model id) for a model; OpenRouter unless a direct provider matches.
+
+    Exact `model_map` entries win, then the longest matching `models` prefix.
+    """
+    best, best_prefix = None, ""
+    for provider in _providers:
+        if model in provider["model_map"]:
+            return provider, provider["model_map"][model]
+        for prefix in provider["models"]:
+            if model.startswith(prefix) and (best is None or len(prefix) > len(best_prefix)):
+                best, best_prefix = provider, prefix
+    if best is None:
+        return DEFAULT_PROVIDER, model
+    return best, model[len(best_prefix):] if best_prefix.endswith("/") else model
+
+
+def _anthropic_content(content):
+    """OpenAI-style user content -> Anthropic content blocks (images as base64 sources)"""
+    if isinstance(content, str):
+        return content
+    blocks = []
+    for item in content:
+        if item.get("type") == "image_url":
+            image = item["image_url"]["url"]
+            if not isinstance(image, ImagePart):
+                image = ImagePart.from_data_url(image)
+            blocks.append({"type": "image", "source": {
+                "type": "base64", "media_type": image.mime_type, "data": image.base64_part()}})
+        else:
+            blocks.append(item)
+    return blocks
+
+
+def build_request(provider, model, provider_model, system_prompt, user_content=None,
+                  response_format=None, reasoning_effort=None, max_tokens=12000,
+                  temperature=0.1, api_key=None):
+    """(url, headers, payload) for one chat call in the provider's dialect"""
+    dialect = provider["dialect"]
+    key = provider.get("api_key") or api_key
+    url = provider["base_url"] + DIALECT_PATHS[dialect]
+    reasoning = (reasoning_effort is not None
+                 and model.startswith(REASONING_MODEL_PREFIXES))
+
+    if dialect == "anthropic":
+        headers = {"x-api-key": key, "anthropic-version": ANTHROPIC_VERSION,
+                   "Content-Type": "application/json"}
+        payload = {"model": provider_model, "max_tokens": max_tokens,
+                   "system": [{"type": "text", "text": system_prompt}],
+                   "messages": []}
+        if user_content is not None:
+            payload["messages"].append({"role": "user", "content": _anthropic_content(user_content)})
+        budget = ANTHROPIC_THINKING_BUDGETS.get(reasoning_effort) if reasoning else None
+        if budget:
+            # Extended thinking only allows the default temperature
+            payload["thinking"] = {"type": "enabled", "budget_tokens": budget}
+        else:
+            payload["temperature"] = temperature
+        # No response_format in this API; the prompts already demand JSON
+        return url, headers, payload
+
+    headers = {"Authorization": f"Bearer {key}", "Content-Type": "application/json"}
+    messages = [{"role": "system", "content": [{"type": "text", "text": system_prompt}]}]
+    if user_content is not None:
+        messages.append({"role": "user", "content": user_content})
+    payload = {"model": provider_model, "messages": messages}
+    if response_format is not None:
+        payload["response_format"] = response_format
+
+    if dialect == "openrouter":
+        headers["HTTP-Referer"] = "http://localhost:8501"  # Client URL
+        headers["X-Title"] = "Portrait Evaluation Assistant"  # Client title
+        payload.update(temperature=temperature, max_tokens=max_tokens)
+        if reasoning:
+            payload["reasoning"] = {"effort": reasoning_effort}
+    elif reasoning:
+        # Reasoning models reject a custom temperature and `max_tokens`
+        payload.update(reasoning_effort=reasoning_effort, max_completion_tokens=max_tokens)
+    else:
+        payload.update(temperature=temperature, max_tokens=max_tokens)
+    return url, headers, payload
+
+
+def parse_response(provider, result):
+    """(text, usage) from a provider response; usage in OpenAI shape for portrait_costs"""
+    if provider["dialect"] != "anthropic":
+        return result["choices"][0]["message"]["content"], result.get("usage", {})
+    text = "".join(block.get("text", "") for block in result.get("content", [])
+                   if block.get("type") == "text")
+    usage = result.get("usage") or {}
+    cached = usage.get("cache_read_input_tokens") or 0
+    prompt_tokens = ((usage.get("input_tokens") or 0) + cached
+                     + (usage.get("cache_creation_input_tokens") or 0))
+    completion_tokens = usage.get("output_tokens") or 0
+    return text, {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": cached},
+    }
+
+
+# Passes the agent1 gate and parses as a standalone or a comparison evaluation
+STAND_IN_REPLY = json.dumps({
+    "IS_PORTRAIT": True, "CENCORED_CONTENT": False, "REJECTION_MESSAGE": "",
+    **{category: {"score": 6, "previous_score": 5, "current_score": 6,
+                  "feedback": "Stand-in feedback."} for category in EVALUATION_CATEGORIES},
+})
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Local stand-in for both dialects: canned evaluation JSON after a fixed latency (+ jitter)"""
+
+    latency_s = 0.0
+    jitter_s = 0.0
+    reply = STAND_IN_REPLY
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real endpoints
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        time.sleep(self.latency_s + random.uniform(0, self.jitter_s))
+        prompt_tokens = len(body) // 4
+        if self.path.endswith(DIALECT_PATHS["anthropic"]):
+            result = {"content": [{"type": "text", "text": self.reply}],
+                      "usage": {"input_tokens": prompt_tokens, "output_tokens": 50}}
+        else:
+            result = {"choices": [{"message": {"role": "assistant", "content": self.reply}}],
+                      "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 50,
+                                "total_tokens": prompt_tokens + 50}}
+        data = json.dumps(result).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_stand_in_server(port=0, latency_s=0.0, reply=None, jitter_s=0.0):
+    """Threaded stand-in server on 127.0.0.1 (port 0 picks a free one); call serve_forever()"""
+    handler = type("StandIn", (StandInHandler,), {
+        "latency_s": latency_s, "jitter_s": jitter_s, "reply": reply or STAND_IN_REPLY})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local provider stand-in")
+    parser.add_argument("--stand-in", type=int, default=8900, metavar="PORT")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random seconds per response")
+    args = parser.parse_args()
+    server = make_stand_in_server(args.stand_in, args.latency, jitter_s=args.jitter)
+    print(f"Stand-in provider on http://127.0.0.1:{server.server_port}/v1 "
+          f"(openai and anthropic dialects)")
+    server.serve_forever()
@@ -0,0 +1,153 @@
+"""Compact in-memory iteration records (shared by Streamlit app and CLI scripts).
+
+A session keeps all of its iterations in memory. As plain dicts they held the
+model output three times (raw_response, parsed_response, evaluation), the
+full system prompt and the image as a base64 data URL. IterationRecord keeps
+the raw response and the evaluation shown, derives the parsed view on first
+access (cached in the record until raw_response changes), references the
+prompt by hash (each distinct text is interned once per process) and holds
+the image as bytes. It reads and writes like the dict it
+replaces (get, [], in, items), so the store, exports and archives take it as is.
+"""
+
+import base64
+
+from portrait_pipeline import extract_standard_evaluation, parse_evaluation_response
+from portrait_store import sha256_hex
+
+# sha256 -> system prompt text, shared by every session of the process. The
+# distinct prompts are few (mode x skill level x language x prompt options).
+PROMPTS = {}
+
+# Marks a derived view that has not been computed yet (None is a valid result)
+_UNSET = object()
+
+
+def intern_prompt(text):
+    """Registers a prompt text once and returns its hash"""
+    sha = sha256_hex(text)
+    PROMPTS.setdefault(sha, text)
+    return sha
+
+
+class IterationRecord:
+    """One iteration of a session with dict-style access.
+
+    Derived keys: "parsed_response" and "evaluation" are computed from
+    raw_response unless set to something else (ensemble merges, resumed
+    iterations without their raw response); "system_prompt" maps to the
+    interned prompt; "image_base64" is decoded into image_bytes on assignment.
+    Derived views are parsed once and kept until a key they depend on is set.
+    "mode" ("standalone"/"comparison") says how raw_response parses; it is set
+    once, from iteration_number if not given, so renumbering never changes it.
+    Keys outside the known fields go to a small overflow dict.
+    """
+
+    FIELDS = ("iteration_number", "timestamp", "image_name", "image_sha256", "image_bytes",
+              "mime_type", "phash", "prefilter", "model", "reasoning_effort", "raw_response",
+              "prompt_sha256", "calls", "cost", "translations", "ensemble", "requested_model",
+              "fallback_failures", "output_language", "mode")
+    DERIVED = ("evaluation", "parsed_response", "system_prompt")
+    # Keys the cached parsed/standard views are computed from
+    VIEW_INPUTS = ("raw_response", "mode", "evaluation", "parsed_response")
+
+    __slots__ = FIELDS + ("_evaluation", "_parsed_response", "_extra",
+                          "_parsed_view", "_evaluation_view")
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, None)
+        self._clear_views()
+        for key, value in fields.items():
+            self[key] = value
+        if self.mode is None:
+            self.mode = "comparison" if (self.iteration_number or 1) > 1 else "standalone"
+
+    @classmethod
+    def from_dict(cls, item):
+        return cls(**item).compact()
+
+    @property
+    def is_comparison(self):
+        return self.mode == "comparison"
+
+    def _clear_views(self):
+        self._parsed_view = self._evaluation_view = _UNSET
+
+    @property
+    def parsed_response(self):
+        if self._parsed_response is not None or self.raw_response is None:
+            return self._parsed_response
+        if self._parsed_view is _UNSET:
+            self._parsed_view = parse_evaluation_response(self.raw_response, self.is_comparison)
+        return self._parsed_view
+
+    @property
+    def evaluation(self):
+        if self._evaluation is not None:
+            return self._evaluation
+        if self._evaluation_view is _UNSET:
+            parsed = self.parsed_response
+            self._evaluation_view = (extract_standard_evaluation(parsed, self.is_comparison)
+                                     if parsed else None)
+        return self._evaluation_view
+
+    @property
+    def system_prompt(self):
+        return PROMPTS.get(self.prompt_sha256) if self.prompt_sha256 else None
+
+    def compact(self):
+        """Drops a stored parsed_response that is equal to what raw_response parses to.
+
+        The stored evaluation is always kept: it is the record of what the user was shown.
+        """
+        if self.raw_response is None or self._parsed_response is None:
+            return self
+        stored, self._parsed_response = self._parsed_response, None
+        self._clear_views()
+        if self.parsed_response != stored:
+            self._parsed_response = stored
+        return self
+
+    def __getitem__(self, key):
+        if key in self.FIELDS or key in self.DERIVED:
+            return getattr(self, key)
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self.VIEW_INPUTS:
+            self._clear_views()
+        if key == "evaluation":
+            self._evaluation = value
+        elif key == "parsed_response":
+            self._parsed_response = value
+        elif key == "system_prompt":
+            self.prompt_sha256 = intern_prompt(value) if value else None
+        elif key == "image_base64":
+            header, encoded = value.split(",", 1)
+            self.image_bytes = base64.b64decode(encoded)
+            self.mime_type = header[len("data:"):].split(";", 1)[0]
+        elif key in self.FIELDS:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def get(self, key, default=None):
+        try:
+            value = self[key]
+        except KeyError:
+            return default
+        return default if value is None else value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def keys(self):
+        return [key for key in self.FIELDS + self.DERIVED + tuple(self._extra or ()) if key in self]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
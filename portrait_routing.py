@@ -0,0 +1,299 @@
+"""Latency- and cost-aware model routing (shared by Streamlit app and CLI scripts).
+
+Every evaluation call reports its outcome to ModelStats (a rolling window per
+model and call type). ModelRouter picks, for an "auto" model selection, the
+fastest model of the required quality tier that currently meets the SLOs.
+Per-model circuit breakers and ordered fallback chains keep calls flowing when
+a model is down or timing out.
+"""
+
+import random
+import threading
+import time
+from collections import defaultdict, deque
+
+from portrait_singleflight import CoalescedError
+
+# Quality tier of each evaluation model (higher is better); "auto" only routes
+# to models at or above the tier the user asked for
+MODEL_QUALITY_TIERS = {
+    "openai/gpt-5.2": 3,
+    "x-ai/grok-4.20-multi-agent-beta": 3,
+    "x-ai/grok-4.20-beta": 2,
+    "openai/gpt-5.2-chat": 2,
+    "anthropic/claude-haiku-4.5": 1,
+}
+
+QUALITY_TIER_NAMES = {"basic": 1, "standard": 2, "premium": 3}
+
+# Defaults; override with the `routing_slos` table in Streamlit secrets
+ROUTING_SLOS = {
+    "max_p95_latency_s": 90.0,
+    "max_error_rate": 0.25,
+    "max_cost_usd": None,  # per call; None = no cost ceiling
+}
+
+# Observations kept per (model, call type)
+ROUTING_WINDOW = 20
+# Below this many observations a model's latency is assumed, not measured
+ROUTING_MIN_SAMPLES = 3
+# Latency assumed for models without enough observations
+ROUTING_PRIOR_LATENCY_S = 30.0
+# Share of auto calls sent to a random healthy candidate to keep statistics fresh
+ROUTING_EXPLORE_RATE = 0.05
+
+
+def _percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(int(round(q / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class ModelStats:
+    """Thread-safe rolling window of call outcomes per (model, call type)"""
+
+    def __init__(self, window=ROUTING_WINDOW):
+        self._lock = threading.Lock()
+        self._observations = defaultdict(lambda: deque(maxlen=window))
+
+    def record(self, model, call_type, latency_s, ok, cost_usd=None):
+        with self._lock:
+            self._observations[(model, call_type)].append((latency_s, ok, cost_usd))
+
+    def snapshot(self, model, call_type):
+        """Summary of the window: samples, p50/p95 latency of successes, error rate, mean cost"""
+        with self._lock:
+            observations = list(self._observations.get((model, call_type), ()))
+        latencies = sorted(latency for latency, ok, _ in observations if ok)
+        costs = [cost for _, ok, cost in observations if ok and cost is not None]
+        return {
+            "samples": len(observations),
+            "p50_latency_s": _percentile(latencies, 50),
+            "p95_latency_s": _percentile(latencies, 95),
+            "error_rate": (sum(1 for _, ok, _ in observations if not ok) / len(observations)
+                           if observations else 0.0),
+            "mean_cost_usd": sum(costs) / len(costs) if costs else None,
+        }
+
+
+class ModelRouter:
+    """Chooses a model for "auto" selections from live ModelStats"""
+
+    def __init__(self, stats, tiers=None, slos=None, rng=None):
+        self.stats = stats
+        self.tiers = dict(tiers if tiers is not None else MODEL_QUALITY_TIERS)
+        self.slos = {**ROUTING_SLOS, **(slos or {})}
+        self._rng = rng or random.Random()
+
+    def _estimated_latency(self, snapshot):
+        if snapshot["samples"] >= ROUTING_MIN_SAMPLES and snapshot["p50_latency_s"] is not None:
+            return snapshot["p50_latency_s"]
+        return ROUTING_PRIOR_LATENCY_S
+
+    def _meets_slos(self, snapshot):
+        if snapshot["samples"] < ROUTING_MIN_SAMPLES:
+            return True  # Not enough data to rule it out
+        if snapshot["error_rate"] > self.slos["max_error_rate"]:
+            return False
+        p95 = snapshot["p95_latency_s"]
+        if p95 is not None and p95 > self.slos["max_p95_latency_s"]:
+            return False
+        max_cost = self.slos.get("max_cost_usd")
+        cost = snapshot["mean_cost_usd"]
+        return max_cost is None or cost is None or cost <= max_cost
+
+    def candidates(self, min_tier, exclude=()):
+        return [model for model, tier in self.tiers.items()
+                if tier >= min_tier and model not in exclude]
+
+    def choose(self, call_type, min_tier=1, exclude=()):
+        """Returns (model, reason). Falls back to the least-bad model if none meets the SLOs."""
+        models = self.candidates(min_tier, exclude) or self.candidates(1, exclude) or list(self.tiers)
+        snapshots = {model: self.stats.snapshot(model, call_type) for model in models}
+        healthy = [model for model in models if self._meets_slos(snapshots[model])]
+
+        if healthy and self._rng.random() < ROUTING_EXPLORE_RATE:
+            return self._rng.choice(healthy), "exploration"
+        if healthy:
+            # Ties: measured models first, and an unknown cost is never taken as free
+            model = min(healthy, key=lambda m: (
+                self._estimated_latency(snapshots[m]),
+                snapshots[m]["samples"] < ROUTING_MIN_SAMPLES,
+                float("inf") if snapshots[m]["mean_cost_usd"] is None else snapshots[m]["mean_cost_usd"]))
+            snapshot = snapshots[model]
+            if snapshot["samples"] >= ROUTING_MIN_SAMPLES:
+                return model, f"fastest healthy: p50 {snapshot['p50_latency_s']:.1f}s"
+            return model, "not enough observations yet"
+        model = min(models, key=lambda m: (snapshots[m]["error_rate"],
+                                           self._estimated_latency(snapshots[m])))
+        return model, "no model meets SLOs; least-bad choice"
+
+
+# Ordered fallback models per call type, tried after the selected model fails
+# (override with the `fallback_chains` table in Streamlit secrets)
+FALLBACK_CHAINS = {
+    "standalone": ["openai/gpt-5.2", "anthropic/claude-haiku-4.5", "openai/gpt-5.2-chat"],
+    "comparison": ["openai/gpt-5.2", "anthropic/claude-haiku-4.5", "openai/gpt-5.2-chat"],
+    "prefilter": ["openai/gpt-4o-mini", "openai/gpt-4.1-nano", "openai/gpt-4o"],
+}
+
+# Consecutive failures (errors and timeouts) that open a model's circuit; a slow
+# answer is still an answer and only shows up in the latency stats
+BREAKER_FAILURE_THRESHOLD = 3
+# Seconds an open circuit waits before letting one probe call through
+BREAKER_COOLDOWN_S = 60.0
+
+
+class CircuitBreaker:
+    """Per-model circuit breaker: closed -> open after repeated failures -> half-open probe"""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD,
+                 cooldown_s=BREAKER_COOLDOWN_S, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def allow(self):
+        """True if a call may be sent now (at most one probe while half-open)"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self._clock() - self.opened_at >= self.cooldown_s:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def is_open(self):
+        with self._lock:
+            return self.state == self.OPEN and self._clock() - self.opened_at < self.cooldown_s
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def release(self):
+        """Returns an unused half-open probe (the call was abandoned before reaching the model)"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = self._clock()
+            self._probe_in_flight = False
+
+
+class CircuitBreakerRegistry:
+    """One CircuitBreaker per model, created on first use"""
+
+    def __init__(self, **breaker_options):
+        self._lock = threading.Lock()
+        self._breakers = {}
+        self._options = breaker_options
+
+    def get(self, model):
+        with self._lock:
+            if model not in self._breakers:
+                self._breakers[model] = CircuitBreaker(**self._options)
+            return self._breakers[model]
+
+    def open_models(self):
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {model for model, breaker in breakers.items() if breaker.is_open()}
+
+    def states(self):
+        """model -> state for every model that has been called"""
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {model: breaker.state for model, breaker in breakers.items()}
+
+
+def fallback_order(selected_model, chain):
+    """Selected model first, then the chain (without duplicates)"""
+    return [selected_model] + [model for model in chain if model != selected_model]
+
+
+def run_with_fallback(models, attempt, breakers, retryable=(Exception,), is_shared=None):
+    """Calls `attempt(model)` down `models` until one succeeds.
+
+    Models whose circuit is open are skipped (if every circuit is open the first
+    model is tried anyway). Each attempt's outcome is fed to its breaker, except
+    results for which `is_shared(result)` is true and CoalescedError failures:
+    another caller's request produced those, and that caller records it.
+    Returns (result, served_model, failures) where failures is a list of
+    (model, exception); re-raises the last error if every model fails.
+    Non-retryable errors propagate immediately without counting against the model.
+    """
+    failures = []
+    attempted = False
+    for model in models:
+        # Checked lazily: allow() hands out the single half-open probe
+        if not breakers.get(model).allow():
+            continue
+        attempted = True
+        try:
+            result = attempt(model)
+        except retryable as e:
+            if isinstance(e, CoalescedError):
+                breakers.get(model).release()
+            else:
+                breakers.get(model).record_failure()
+            failures.append((model, e))
+            continue
+        except BaseException:
+            breakers.get(model).release()
+            raise
+        if is_shared is not None and is_shared(result):
+            breakers.get(model).release()
+        else:
+            breakers.get(model).record_success()
+        return result, model, failures
+
+    if not attempted:
+        # Every circuit is open: still try the selected model rather than fail outright
+        return run_with_fallback(models[:1], attempt, _AlwaysAllow(breakers), retryable, is_shared)
+    raise failures[-1][1]
+
+
+class _AlwaysAllow:
+    """Registry view whose breakers never block (outcomes are still recorded)"""
+
+    def __init__(self, breakers):
+        self._breakers = breakers
+
+    def get(self, model):
+        return _AllowingBreaker(self._breakers.get(model))
+
+
+class _AllowingBreaker:
+    def __init__(self, breaker):
+        self._breaker = breaker
+
+    def allow(self):
+        return True
+
+    def record_success(self):
+        self._breaker.record_success()
+
+    def release(self):
+        self._breaker.release()
+
+    def record_failure(self):
+        self._breaker.record_failure()
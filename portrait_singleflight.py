@@ -0,0 +1,132 @@
+"""Coalescing of identical in-flight model calls (shared by Streamlit app and CLI scripts).
+
+A double-click, a second tab or a teacher re-running a student's upload sends
+the same image with the same prompt and settings while the first call is still
+running. call_openai_api keys each request by a hash of its URL, API key and
+payload (images hashed from their raw bytes) and runs it through MODEL_CALLS:
+the first caller makes the request, concurrent callers with the same key wait
+for it and receive its result, or its exception. A waiter waits no longer than
+its own timeout and then fails like a timed-out request. Nothing is cached once
+the call returns; a later identical request calls the model again.
+
+Only the leader's call says anything about the model: a waiter's request
+failures come as CoalescedError (CoalescedTimeout for timeouts, its own
+included) so that router statistics and circuit breakers can leave them out.
+"""
+
+import base64
+import hashlib
+import json
+import threading
+
+import requests
+
+from portrait_http import ImagePart
+
+
+class CoalescedError(requests.exceptions.RequestException):
+    """A waiter's failure: the shared call failed (the cause) or outlasted the waiter's timeout"""
+
+
+class CoalescedTimeout(CoalescedError, requests.exceptions.ReadTimeout):
+    """A waiter's timeout, or the shared call's"""
+
+
+def _image_digest(image):
+    if image.data_url is not None:
+        # Raw bytes either way, so a data URL and a bytes part of one image match
+        data = base64.b64decode(image.data_url[image.data_url.find(",") + 1:])
+    else:
+        data = image.data
+    return {"image": image.mime_type, "sha256": hashlib.sha256(data).hexdigest()}
+
+
+def request_key(url, payload, api_key=None):
+    """SHA-256 identifying a request; ImageParts count by content, not by object"""
+
+    def replace(value):
+        if isinstance(value, ImagePart):
+            return _image_digest(value)
+        if isinstance(value, dict):
+            return {key: replace(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [replace(item) for item in value]
+        return value
+
+    digest = hashlib.sha256()
+    digest.update(url.encode("utf-8") + b"\n")
+    digest.update((api_key or "").encode("utf-8") + b"\n")
+    digest.update(json.dumps(replace(payload), sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Thread-safe key -> in-flight call table"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, timeout=None):
+        """(result, shared): runs fn() unless a call with this key is in flight, then waits for it.
+
+        `shared` is True for callers that received another caller's result. A
+        waiter gives up after `timeout` seconds (None: until the leader returns)
+        with CoalescedTimeout, a requests ReadTimeout, so timeout handling and
+        fallbacks apply as usual. The leader's requests errors reach waiters as
+        CoalescedError / CoalescedTimeout; other errors as they are.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                self.calls += 1
+                leader = True
+            else:
+                flight.waiters += 1
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            if not flight.done.wait(timeout):
+                raise CoalescedTimeout(
+                    f"identical in-flight request did not finish within {timeout:.1f}s")
+            if isinstance(flight.error, requests.exceptions.Timeout):
+                raise CoalescedTimeout(f"shared request timed out: {flight.error}") from flight.error
+            if isinstance(flight.error, requests.exceptions.RequestException):
+                raise CoalescedError(f"shared request failed: {flight.error}") from flight.error
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = fn()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result, False
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._flights)
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": in_flight}
+
+
+# Process-wide, so identical requests from different sessions (and threads) meet
+MODEL_CALLS = SingleFlight()
@@ -0,0 +1,251 @@
+"""SQLite-backed persistent session history (shared by Streamlit app and CLI scripts).
+
+Iterations are appended as they complete and are never overwritten. Listing a session returns only the
+light per-iteration fields (scores, names, cost); raw responses, prompts and
+image bytes are fetched one iteration at a time when actually needed.
+"""
+
+import hashlib
+import json
+import math
+import sqlite3
+import threading
+import uuid
+from array import array
+from datetime import datetime
+
+from portrait_prompts import EVALUATION_CATEGORIES
+
+DEFAULT_DB_PATH = "portrait_sessions.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    settings TEXT
+);
+CREATE TABLE IF NOT EXISTS images (
+    sha256 TEXT PRIMARY KEY,
+    mime_type TEXT NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS prompts (
+    sha256 TEXT PRIMARY KEY,
+    text TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS iterations (
+    session_id TEXT NOT NULL REFERENCES sessions(session_id),
+    iteration_number INTEGER NOT NULL,
+    timestamp TEXT,
+    image_name TEXT,
+    image_sha256 TEXT REFERENCES images(sha256),
+    model TEXT,
+    reasoning_effort TEXT,
+    evaluation TEXT,
+    cost TEXT,
+    raw_response TEXT,
+    parsed_response TEXT,
+    prompt_sha256 TEXT REFERENCES prompts(sha256),
+    calls TEXT,
+    scores BLOB,
+    phash TEXT,
+    prefilter TEXT,
+    translations TEXT,
+    output_language TEXT,
+    PRIMARY KEY (session_id, iteration_number)
+);
+"""
+
+# Columns added after the first release: (table, column, declaration)
+MIGRATIONS = [
+    ("iterations", "scores", "BLOB"),
+    ("iterations", "phash", "TEXT"),
+    ("iterations", "prefilter", "TEXT"),
+    ("iterations", "translations", "TEXT"),
+    ("iterations", "output_language", "TEXT"),
+]
+
+# Columns returned by list_iterations (cheap to keep in session state)
+SUMMARY_FIELDS = ["iteration_number", "timestamp", "image_name", "image_sha256",
+                  "model", "reasoning_effort", "evaluation", "cost", "phash", "prefilter", "output_language"]
+
+# Columns returned only by load_iteration_details
+DETAIL_FIELDS = ["raw_response", "parsed_response", "system_prompt", "calls", "translations"]
+
+JSON_FIELDS = {"evaluation", "cost", "parsed_response", "calls", "settings", "prefilter",
+               "translations"}
+
+
+def new_session_id():
+    """Returns a short random session ID suitable for a URL query parameter"""
+    return uuid.uuid4().hex[:12]
+
+
+def sha256_hex(data):
+    """SHA-256 of bytes or str, hex-encoded"""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def pack_scores(evaluation):
+    """Packs category scores as float64 bytes in EVALUATION_CATEGORIES order (NaN if missing)"""
+    values = array("d", [math.nan] * len(EVALUATION_CATEGORIES))
+    for col, category in enumerate(EVALUATION_CATEGORIES):
+        data = (evaluation or {}).get(category)
+        if isinstance(data, dict) and isinstance(data.get("score"), (int, float)):
+            values[col] = float(data["score"])
+    return values.tobytes()
+
+
+def _decode_row(row):
+    item = dict(row)
+    for key in JSON_FIELDS & item.keys():
+        if item[key] is not None:
+            item[key] = json.loads(item[key])
+    return item
+
+
+class SessionStore:
+    """Append-only iteration history in a single SQLite file (WAL mode).
+
+    One instance is shared by all Streamlit sessions of a process; a lock
+    serializes access to the single connection.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA foreign_keys=ON")
+            self._conn.executescript(SCHEMA)
+            for table, column, declaration in MIGRATIONS:
+                columns = {row["name"] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+                if column not in columns:
+                    self._conn.execute(
+                        f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def session_exists(self, session_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row is not None
+
+    def ensure_session(self, session_id, settings=None):
+        """Creates the session row if missing; updates stored settings if given"""
+        now = datetime.now().isoformat()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO sessions (session_id, created_at, updated_at, settings) "
+                "VALUES (?, ?, ?, ?)",
+                (session_id, now, now, json.dumps(settings) if settings else None))
+            if settings:
+                self._conn.execute(
+                    "UPDATE sessions SET settings = ?, updated_at = ? WHERE session_id = ?",
+                    (json.dumps(settings), now, session_id))
+
+    def get_session(self, session_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return _decode_row(row) if row else None
+
+    def append_iteration(self, session_id, iteration, image_bytes=None, mime_type="image/jpeg"):
+        """Persists one completed iteration as the session's next one; returns its iteration number.
+
+        The number is allocated inside the write transaction, so writers sharing a
+        session (two tabs, the app and the API) never overwrite each other's rows.
+        The image is stored once per content hash.
+        """
+        image_sha = iteration.get("image_sha256")
+        prompt = iteration.get("system_prompt")
+        prompt_sha = sha256_hex(prompt) if prompt else None
+        now = datetime.now().isoformat()
+        with self._lock, self._conn:
+            # Write lock up front: other processes cannot allocate the same number in between
+            self._conn.execute("BEGIN IMMEDIATE")
+            iteration_number = self._conn.execute(
+                "SELECT COALESCE(MAX(iteration_number), 0) + 1 FROM iterations WHERE session_id = ?",
+                (session_id,)).fetchone()[0]
+            if image_bytes is not None:
+                image_sha = image_sha or sha256_hex(image_bytes)
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO images (sha256, mime_type, data) VALUES (?, ?, ?)",
+                    (image_sha, mime_type, sqlite3.Binary(image_bytes)))
+            if prompt_sha:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO prompts (sha256, text) VALUES (?, ?)",
+                    (prompt_sha, prompt))
+            self._conn.execute(
+                "INSERT INTO iterations (session_id, iteration_number, timestamp, "
+                "image_name, image_sha256, model, reasoning_effort, evaluation, cost, "
+                "raw_response, parsed_response, prompt_sha256, calls, scores, phash, prefilter, "
+                "translations, output_language) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (session_id, iteration_number, iteration.get("timestamp"),
+                 iteration.get("image_name"), image_sha, iteration.get("model"),
+                 iteration.get("reasoning_effort"),
+                 json.dumps(iteration.get("evaluation"), ensure_ascii=False),
+                 json.dumps(iteration.get("cost")),
+                 iteration.get("raw_response"),
+                 json.dumps(iteration.get("parsed_response"), ensure_ascii=False),
+                 prompt_sha,
+                 json.dumps(iteration.get("calls", [])),
+                 sqlite3.Binary(pack_scores(iteration.get("evaluation"))),
+                 iteration.get("phash"),
+                 json.dumps(iteration.get("prefilter"), ensure_ascii=False),
+                 json.dumps(iteration.get("translations") or None, ensure_ascii=False),
+                 iteration.get("output_language")))
+            self._conn.execute(
+                "UPDATE sessions SET updated_at = ? WHERE session_id = ?", (now, session_id))
+        return iteration_number
+
+    def save_translations(self, session_id, iteration_number, translations):
+        """Replaces the cached translations ({language: translation}) of one iteration"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE iterations SET translations = ? WHERE session_id = ? AND iteration_number = ?",
+                (json.dumps(translations, ensure_ascii=False), session_id, iteration_number))
+
+    def list_iterations(self, session_id):
+        """Light iteration records (no raw response, prompt or image data), in order"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(SUMMARY_FIELDS)} FROM iterations "
+                "WHERE session_id = ? ORDER BY iteration_number", (session_id,)).fetchall()
+        return [_decode_row(row) for row in rows]
+
+    def load_iteration_details(self, session_id, iteration_number):
+        """Heavy fields of one iteration: raw/parsed response, system prompt, call ledger"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT i.raw_response, i.parsed_response, p.text AS system_prompt, i.calls, "
+                "i.translations "
+                "FROM iterations i LEFT JOIN prompts p ON p.sha256 = i.prompt_sha256 "
+                "WHERE i.session_id = ? AND i.iteration_number = ?",
+                (session_id, iteration_number)).fetchone()
+        return _decode_row(row) if row else {}
+
+    def load_score_rows(self):
+        """(session_id, iteration_number, packed scores) for every scored iteration, in order"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT session_id, iteration_number, scores FROM iterations "
+                "WHERE scores IS NOT NULL ORDER BY session_id, iteration_number").fetchall()
+        return [(row["session_id"], row["iteration_number"], bytes(row["scores"])) for row in rows]
+
+    def load_image(self, image_sha256):
+        """Returns (bytes, mime_type) for a stored image, or (None, None)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, mime_type FROM images WHERE sha256 = ?", (image_sha256,)).fetchone()
+        return (bytes(row["data"]), row["mime_type"]) if row else (None, None)
@@ -0,0 +1,7 @@
+"""Unit tests for the Streamlit-free modules; run from the repository root with `python -m pytest tests`."""
+
+import os
+import sys
+
+# The portrait_* modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
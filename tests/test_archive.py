@@ -0,0 +1,90 @@
+import gzip
+import json
+
+import pytest
+
+from portrait_archive import (
+    ARCHIVE_COMPRESSIONS,
+    ARCHIVE_FORMAT,
+    make_archive_header,
+    make_archive_record,
+    read_session_archive,
+    write_session_archive,
+)
+
+EVALUATION = {"Composition and Design": {"score": 6, "feedback": "Balanced"}}
+
+
+def archive_with(*records, header=None):
+    return write_session_archive(header or make_archive_header("s1", {"output_language": "German"}),
+                                 list(records))
+
+
+@pytest.mark.parametrize("compression", sorted(ARCHIVE_COMPRESSIONS))
+def test_round_trip_keeps_fields_and_image_bytes(compression):
+    iteration = {"iteration_number": 1, "timestamp": "2026-01-01T00:00:00", "image_name": "p.jpg",
+                 "evaluation": EVALUATION, "image_bytes": b"not sent twice"}
+    record = make_archive_record(iteration, {"raw_response": "{}", "calls": []},
+                                 b"\xff\xd8image", "image/jpeg")
+    data = write_session_archive(make_archive_header("s1", {"skill_level": "beginner"}, 1),
+                                 iter([record]), compression)
+
+    header, records = read_session_archive(data)
+
+    assert header["format"] == ARCHIVE_FORMAT and header["settings"] == {"skill_level": "beginner"}
+    assert records == [{"iteration_number": 1, "timestamp": "2026-01-01T00:00:00",
+                        "image_name": "p.jpg", "evaluation": EVALUATION, "raw_response": "{}",
+                        "calls": [], "image": {"mime_type": "image/jpeg", "data": b"\xff\xd8image"}}]
+
+
+def test_uncompressed_json_lines_are_accepted():
+    data = (json.dumps(make_archive_header("s1")) + "\n" + json.dumps({"evaluation": EVALUATION})).encode()
+    assert read_session_archive(data)[1] == [{"evaluation": EVALUATION}]
+
+
+@pytest.mark.parametrize("data", [b"", b"hello", gzip.compress(b"[1, 2]"),
+                                  gzip.compress(json.dumps({"format": "other"}).encode())])
+def test_not_an_archive(data):
+    with pytest.raises(ValueError, match="Not a session archive"):
+        read_session_archive(data)
+
+
+@pytest.mark.parametrize("version", ["1", True, None, 99])
+def test_unsupported_versions(version):
+    header = {**make_archive_header("s1"), "version": version}
+    with pytest.raises(ValueError, match="version"):
+        read_session_archive(archive_with(header=header))
+
+
+@pytest.mark.parametrize("record, problem", [
+    ([1], "record is not an object"),
+    ({"iteration_number": "2"}, "iteration_number"),
+    ({"iteration_number": True}, "iteration_number"),
+    ({"evaluation": [6]}, "evaluation"),
+    ({"calls": {}}, "calls"),
+    ({"raw_response": {"a": 1}}, "raw_response"),
+    ({"image": "data"}, "image is not an object"),
+    ({"image": {"mime_type": "x"}}, "mime_type"),
+    ({"image": {"data": "AAAA"}}, "mime_type"),
+    ({"image": {"mime_type": "image/jpeg"}}, "image.data"),
+    ({"image": {"mime_type": "image/jpeg", "data": "not base64!"}}, "base64"),
+])
+def test_malformed_records_raise_value_error(record, problem):
+    with pytest.raises(ValueError, match=problem):
+        read_session_archive(archive_with({"evaluation": EVALUATION}, record))
+
+
+def test_error_names_the_line():
+    with pytest.raises(ValueError, match="line 3"):
+        read_session_archive(archive_with({"evaluation": EVALUATION}, {"calls": "x"}))
+
+
+def test_truncated_archive():
+    data = archive_with({"evaluation": EVALUATION}, {"evaluation": EVALUATION})
+    with pytest.raises(ValueError):
+        read_session_archive(data[:-12])
+
+
+def test_unknown_compression_is_rejected():
+    with pytest.raises(ValueError):
+        write_session_archive(make_archive_header("s1"), [], compression="lz4")
@@ -0,0 +1,77 @@
+import base64
+import json
+
+import pytest
+
+from portrait_http import ImagePart, StreamingJSONBody
+
+IMAGE = bytes(range(256)) * 700 + b"\x01\x02"  # Not a multiple of 3 or of the chunk size
+
+
+def data_url(data, mime_type="image/jpeg"):
+    return f"data:{mime_type};base64," + base64.b64encode(data).decode("ascii")
+
+
+def payload_with(image):
+    return {"model": "m", "messages": [
+        {"role": "system", "content": "Évaluez «ce» portrait"},
+        {"role": "user", "content": [{"type": "text", "text": "x"},
+                                     {"type": "image_url", "image_url": {"url": image}}]},
+    ], "temperature": 0.1}
+
+
+@pytest.mark.parametrize("image", [ImagePart(IMAGE), ImagePart(IMAGE, "image/png"),
+                                   ImagePart.from_data_url(data_url(IMAGE))])
+@pytest.mark.parametrize("chunk_size", [3, 300, 3 * 16 * 1024])
+def test_body_is_byte_identical_to_json_dumps(image, chunk_size):
+    url = image.data_url or data_url(IMAGE, image.mime_type)
+    expected = json.dumps(payload_with(url)).encode("utf-8")
+
+    body = StreamingJSONBody(payload_with(image), chunk_size=chunk_size)
+
+    assert len(body) == len(expected)
+    assert body.read() == expected
+
+
+def test_read_in_blocks_matches_full_read():
+    expected = json.dumps(payload_with(data_url(IMAGE))).encode("utf-8")
+    body = StreamingJSONBody(payload_with(ImagePart(IMAGE)), chunk_size=300)
+
+    blocks = []
+    while True:
+        block = body.read(1000)
+        if not block:
+            break
+        assert len(block) <= 1000
+        blocks.append(block)
+
+    assert b"".join(blocks) == expected
+
+
+def test_iteration_yields_the_same_bytes():
+    body = StreamingJSONBody(payload_with(ImagePart(IMAGE)))
+    assert b"".join(body) == json.dumps(payload_with(data_url(IMAGE))).encode("utf-8")
+
+
+def test_bare_part_has_no_data_url_prefix():
+    for image in (ImagePart(IMAGE), ImagePart.from_data_url(data_url(IMAGE))):
+        bare = image.base64_part()
+        encoded = b"".join(bare.chunks())
+        assert encoded == base64.b64encode(IMAGE)
+        assert len(bare) == len(encoded)
+
+
+def test_data_url_sets_mime_type():
+    assert ImagePart.from_data_url(data_url(b"x", "image/webp")).mime_type == "image/webp"
+
+
+def test_image_part_needs_exactly_one_source():
+    with pytest.raises(ValueError):
+        ImagePart()
+    with pytest.raises(ValueError):
+        ImagePart(IMAGE, data_url=data_url(IMAGE))
+
+
+def test_nan_is_rejected_like_requests_json():
+    with pytest.raises(ValueError):
+        StreamingJSONBody({"temperature": float("nan")})
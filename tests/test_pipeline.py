@@ -0,0 +1,49 @@
+import pytest
+
+from portrait_pipeline import rejection_call_type, single_pass_gate
+
+PASS = {"IS_PORTRAIT": True, "CENCORED_CONTENT": False, "REJECTION_MESSAGE": ""}
+
+
+def test_clean_responses_pass():
+    gate = single_pass_gate([PASS, dict(PASS)])
+    assert gate == {"IS_PORTRAIT": True, "CENCORED_CONTENT": False, "REJECTION_MESSAGE": None}
+    assert rejection_call_type(gate) is None
+
+
+def test_any_member_flagging_censored_content_rejects():
+    flagged = {**PASS, "CENCORED_CONTENT": True, "REJECTION_MESSAGE": "Not allowed"}
+    for responses in ([flagged, PASS, PASS], [PASS, PASS, flagged]):
+        gate = single_pass_gate(responses)
+        assert rejection_call_type(gate) == "agent2"
+        assert gate["REJECTION_MESSAGE"] == "Not allowed"
+
+
+def test_any_member_saying_not_a_portrait_rejects():
+    gate = single_pass_gate([PASS, {**PASS, "IS_PORTRAIT": False, "REJECTION_MESSAGE": "Portraits only"}])
+    assert rejection_call_type(gate) == "agent3"
+    assert gate["REJECTION_MESSAGE"] == "Portraits only"
+
+
+def test_censored_wins_and_brings_its_own_message():
+    gate = single_pass_gate([{**PASS, "IS_PORTRAIT": False, "REJECTION_MESSAGE": "Portraits only"},
+                             {**PASS, "CENCORED_CONTENT": True, "REJECTION_MESSAGE": "Not allowed"}])
+    assert rejection_call_type(gate) == "agent2"
+    assert gate["REJECTION_MESSAGE"] == "Not allowed"
+
+
+@pytest.mark.parametrize("missing, call_type", [("CENCORED_CONTENT", "agent2"), ("IS_PORTRAIT", "agent3")])
+def test_missing_gate_fields_fail_closed(missing, call_type):
+    incomplete = {key: value for key, value in PASS.items() if key != missing}
+    assert rejection_call_type(single_pass_gate([incomplete])) == call_type
+    assert rejection_call_type(single_pass_gate([PASS, incomplete])) == call_type
+
+
+@pytest.mark.parametrize("value", [None, "false", 0, "true", 1])
+def test_non_boolean_gate_values_fail_closed(value):
+    assert rejection_call_type(single_pass_gate([{**PASS, "CENCORED_CONTENT": value}])) == "agent2"
+    assert rejection_call_type(single_pass_gate([{**PASS, "IS_PORTRAIT": value}])) == "agent3"
+
+
+def test_no_responses_fail_closed():
+    assert rejection_call_type(single_pass_gate([])) is not None
@@ -0,0 +1,66 @@
+import base64
+from unittest import mock
+
+import portrait_records
+from portrait_pipeline import extract_standard_evaluation, parse_evaluation_response
+from portrait_providers import STAND_IN_REPLY
+from portrait_records import PROMPTS, IterationRecord
+
+
+def evaluated(number, **fields):
+    """A record as the app builds it: raw response plus the views it showed"""
+    is_comparison = number > 1
+    parsed = parse_evaluation_response(STAND_IN_REPLY, is_comparison)
+    return IterationRecord.from_dict({
+        "iteration_number": number, "raw_response": STAND_IN_REPLY, "parsed_response": parsed,
+        "evaluation": extract_standard_evaluation(parsed, is_comparison), **fields})
+
+
+def test_mode_defaults_from_the_iteration_number():
+    assert IterationRecord(iteration_number=1).mode == "standalone"
+    assert IterationRecord(iteration_number=2).mode == "comparison"
+    assert IterationRecord(iteration_number=2, mode="standalone").mode == "standalone"
+
+
+def test_renumbering_keeps_mode_and_evaluation():
+    record = evaluated(2)
+    shown = record["evaluation"]
+    assert shown
+
+    record["iteration_number"] = 1  # The store numbered it lower
+
+    assert record.mode == "comparison" and record.is_comparison
+    assert record["evaluation"] == shown
+    assert record["parsed_response"] == parse_evaluation_response(STAND_IN_REPLY, True)
+
+
+def test_stored_evaluation_is_kept_and_parsed_duplicate_dropped():
+    record = evaluated(1)
+    assert record._evaluation is not None
+    assert record._parsed_response is None
+    assert record["parsed_response"] == parse_evaluation_response(STAND_IN_REPLY, False)
+
+
+def test_parsed_view_is_computed_once_until_its_input_changes():
+    record = IterationRecord(iteration_number=1, raw_response=STAND_IN_REPLY)
+    with mock.patch.object(portrait_records, "parse_evaluation_response",
+                           wraps=parse_evaluation_response) as parse:
+        first = record["parsed_response"]
+        assert record["parsed_response"] is first
+        record["evaluation"]
+        assert parse.call_count == 1
+
+        record["raw_response"] = STAND_IN_REPLY
+        record["parsed_response"]
+        assert parse.call_count == 2
+
+
+def test_dict_style_access():
+    record = IterationRecord(iteration_number=1, system_prompt="prompt text",
+                             image_base64="data:image/png;base64," + base64.b64encode(b"png").decode(),
+                             custom="kept")
+    assert record["system_prompt"] == "prompt text" and PROMPTS[record.prompt_sha256] == "prompt text"
+    assert (record.image_bytes, record.mime_type) == (b"png", "image/png")
+    assert record["custom"] == "kept" and "custom" in record
+    assert record.get("cost", "none") == "none" and "cost" not in record
+    assert dict(record.items())["mode"] == "standalone"
@@ -0,0 +1,141 @@
+import pytest
+import requests
+
+from portrait_routing import CircuitBreaker, CircuitBreakerRegistry, fallback_order, run_with_fallback
+from portrait_singleflight import CoalescedTimeout
+
+RETRYABLE = (requests.exceptions.RequestException,)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def registry(clock=None, threshold=2, cooldown_s=60.0):
+    return CircuitBreakerRegistry(failure_threshold=threshold, cooldown_s=cooldown_s,
+                                  clock=clock or Clock())
+
+
+def failing(*models):
+    def attempt(model):
+        if model in models:
+            raise requests.exceptions.ConnectionError(model)
+        return f"answer from {model}"
+    return attempt
+
+
+def test_breaker_opens_after_consecutive_failures_and_probes_after_cooldown():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=2, cooldown_s=10.0, clock=clock)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+
+    clock.now = 10.0
+    assert breaker.allow()  # The one half-open probe
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.consecutive_failures == 0
+
+
+def test_failed_probe_reopens_the_circuit():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=3, cooldown_s=10.0, clock=clock)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now = 10.0
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and breaker.opened_at == 10.0
+
+
+def test_released_probe_can_be_taken_again():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=1, cooldown_s=1.0, clock=clock)
+    breaker.record_failure()
+    clock.now = 1.0
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_fallback_serves_from_the_next_model_and_reports_failures():
+    breakers = registry()
+    result, model, failures = run_with_fallback(["a", "b", "c"], failing("a"), breakers, RETRYABLE)
+    assert (result, model) == ("answer from b", "b")
+    assert [failed for failed, _ in failures] == ["a"]
+    assert breakers.get("a").consecutive_failures == 1
+    assert breakers.states() == {"a": "closed", "b": "closed"}
+
+
+def test_open_circuit_is_skipped():
+    breakers = registry(threshold=1)
+    run_with_fallback(["a", "b"], failing("a"), breakers, RETRYABLE)
+    assert breakers.open_models() == {"a"}
+
+    calls = []
+    result, model, failures = run_with_fallback(
+        ["a", "b"], lambda model: calls.append(model) or model, breakers, RETRYABLE)
+    assert calls == ["b"] and model == "b" and failures == []
+
+
+def test_all_circuits_open_still_tries_the_first_model():
+    breakers = registry(threshold=1)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        run_with_fallback(["a", "b"], failing("a", "b"), breakers, RETRYABLE)
+    assert breakers.open_models() == {"a", "b"}
+
+    result, model, _ = run_with_fallback(["a", "b"], failing(), breakers, RETRYABLE)
+    assert model == "a"
+    assert breakers.states()["a"] == "closed"
+
+
+def test_every_model_failing_reraises_the_last_error():
+    with pytest.raises(requests.exceptions.ConnectionError, match="b"):
+        run_with_fallback(["a", "b"], failing("a", "b"), registry(), RETRYABLE)
+
+
+def test_non_retryable_error_propagates_without_counting():
+    breakers = registry(threshold=1)
+
+    def attempt(model):
+        raise KeyError(model)
+
+    with pytest.raises(KeyError):
+        run_with_fallback(["a", "b"], attempt, breakers, RETRYABLE)
+    assert breakers.states() == {"a": "closed"}
+
+
+def test_coalesced_outcomes_do_not_touch_the_breaker():
+    breakers = registry(threshold=2)
+
+    def waiter_timeout(model):
+        raise CoalescedTimeout(model)
+
+    with pytest.raises(CoalescedTimeout):
+        run_with_fallback(["a"], waiter_timeout, breakers, RETRYABLE)
+    assert breakers.get("a").consecutive_failures == 0
+
+    breakers.get("a").record_failure()
+    result, model, _ = run_with_fallback(["a"], lambda model: ("text", {"coalesced": True}), breakers,
+                                         RETRYABLE, is_shared=lambda result: result[1].get("coalesced"))
+    assert model == "a" and breakers.get("a").consecutive_failures == 1
+
+
+def test_fallback_order_puts_the_selected_model_first_once():
+    assert fallback_order("b", ["a", "b", "c"]) == ["b", "a", "c"]
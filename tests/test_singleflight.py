@@ -0,0 +1,143 @@
+import base64
+import threading
+
+import pytest
+import requests
+
+from portrait_http import ImagePart
+from portrait_singleflight import CoalescedError, CoalescedTimeout, SingleFlight, request_key
+
+
+def run_concurrently(flights, key, fn, callers, timeout=None):
+    """Starts `callers` threads on flights.do(key, fn); returns [(result, shared) or exception]"""
+    outcomes = [None] * callers
+
+    def call(index):
+        try:
+            outcomes[index] = flights.do(key, fn, timeout=timeout)
+        except Exception as e:
+            outcomes[index] = e
+
+    threads = [threading.Thread(target=call, args=(index,)) for index in range(callers)]
+    for thread in threads:
+        thread.start()
+    return threads, outcomes
+
+
+def wait_for_waiters(flights, count):
+    while flights.stats()["coalesced"] < count:
+        threading.Event().wait(0.001)
+
+
+def test_concurrent_identical_calls_share_one_call():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return "answer"
+
+    threads, outcomes = run_concurrently(flights, "k", fn, 4)
+    wait_for_waiters(flights, 3)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in outcomes) == [False, True, True, True]
+    assert all(result == "answer" for result, _ in outcomes)
+    assert flights.stats() == {"calls": 1, "coalesced": 3, "in_flight": 0}
+
+
+def test_sequential_calls_are_not_cached():
+    flights = SingleFlight()
+    assert flights.do("k", lambda: 1) == (1, False)
+    assert flights.do("k", lambda: 2) == (2, False)
+
+
+def test_leader_request_error_reaches_waiters_as_coalesced_error():
+    flights = SingleFlight()
+    release = threading.Event()
+
+    def fn():
+        release.wait(5)
+        raise requests.exceptions.ConnectionError("provider down")
+
+    threads, outcomes = run_concurrently(flights, "k", fn, 3)
+    wait_for_waiters(flights, 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    leaders = [e for e in outcomes if not isinstance(e, CoalescedError)]
+    waiters = [e for e in outcomes if isinstance(e, CoalescedError)]
+    assert len(leaders) == 1 and isinstance(leaders[0], requests.exceptions.ConnectionError)
+    assert len(waiters) == 2
+    assert all(e.__cause__ is leaders[0] for e in waiters)
+
+
+def test_leader_timeout_reaches_waiters_as_coalesced_timeout():
+    flights = SingleFlight()
+    release = threading.Event()
+
+    def fn():
+        release.wait(5)
+        raise requests.exceptions.ReadTimeout("slow")
+
+    threads, outcomes = run_concurrently(flights, "k", fn, 2)
+    wait_for_waiters(flights, 1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert sum(isinstance(e, CoalescedTimeout) for e in outcomes) == 1
+    assert all(isinstance(e, requests.exceptions.Timeout) for e in outcomes)
+
+
+def test_other_errors_reach_waiters_unchanged():
+    flights = SingleFlight()
+    release = threading.Event()
+    error = KeyError("choices")
+
+    def fn():
+        release.wait(5)
+        raise error
+
+    threads, outcomes = run_concurrently(flights, "k", fn, 2)
+    wait_for_waiters(flights, 1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert outcomes == [error, error]
+
+
+def test_waiter_gives_up_after_its_timeout():
+    flights = SingleFlight()
+    release = threading.Event()
+    leader_threads, leader = run_concurrently(flights, "k", lambda: release.wait(5) and "late", 1)
+    while flights.stats()["in_flight"] == 0:
+        threading.Event().wait(0.001)
+
+    with pytest.raises(CoalescedTimeout):
+        flights.do("k", lambda: "unused", timeout=0.01)
+
+    release.set()
+    leader_threads[0].join()
+    assert leader == [("late", False)]
+
+
+def test_request_key_counts_images_by_content():
+    image = bytes(range(200))
+    url = "data:image/jpeg;base64," + base64.b64encode(image).decode("ascii")
+
+    def payload(part):
+        return {"messages": [{"content": [{"image_url": {"url": part}}]}]}
+
+    as_bytes = request_key("https://x/v1", payload(ImagePart(image)), "key")
+    assert as_bytes == request_key("https://x/v1", payload(ImagePart(bytearray(image))), "key")
+    assert as_bytes == request_key("https://x/v1", payload(ImagePart.from_data_url(url)), "key")
+    assert as_bytes != request_key("https://x/v1", payload(ImagePart(image[:-1])), "key")
+    assert as_bytes != request_key("https://x/v1", payload(ImagePart(image)), "other key")
@@ -0,0 +1,85 @@
+import sqlite3
+import threading
+
+import pytest
+
+from portrait_store import SessionStore, sha256_hex
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "sessions.db")
+
+
+def iteration(**fields):
+    return {"timestamp": "2026-01-01T00:00:00", "image_name": "p.jpg",
+            "evaluation": {"Composition and Design": {"score": 6, "feedback": "ok"}}, **fields}
+
+
+def test_append_allocates_consecutive_numbers_per_session(db_path):
+    store = SessionStore(db_path)
+    for session_id in ("a", "b"):
+        store.ensure_session(session_id)
+
+    assert [store.append_iteration("a", iteration()) for _ in range(3)] == [1, 2, 3]
+    assert store.append_iteration("b", iteration()) == 1
+    assert [row["iteration_number"] for row in store.list_iterations("a")] == [1, 2, 3]
+
+
+def test_the_callers_iteration_number_is_ignored(db_path):
+    store = SessionStore(db_path)
+    store.ensure_session("a")
+    store.append_iteration("a", iteration(iteration_number=1))
+
+    # A second tab that still thinks this is iteration 1 gets the next number, not an overwrite
+    assert store.append_iteration("a", iteration(iteration_number=1, image_name="other.jpg")) == 2
+    assert [row["image_name"] for row in store.list_iterations("a")] == ["p.jpg", "other.jpg"]
+
+
+def test_concurrent_writers_never_share_a_number(db_path):
+    stores = [SessionStore(db_path) for _ in range(2)]  # Two connections, like two processes
+    stores[0].ensure_session("a")
+    numbers = []
+
+    def append(store):
+        for _ in range(10):
+            numbers.append(store.append_iteration("a", iteration()))
+
+    threads = [threading.Thread(target=append, args=(store,)) for store in stores for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(numbers) == list(range(1, 41))
+
+
+def test_existing_rows_cannot_be_replaced(db_path):
+    store = SessionStore(db_path)
+    store.ensure_session("a")
+    store.append_iteration("a", iteration())
+    with pytest.raises(sqlite3.IntegrityError):
+        with store._conn:
+            store._conn.execute("INSERT INTO iterations (session_id, iteration_number) VALUES ('a', 1)")
+
+
+def test_images_and_prompts_are_stored_once_by_content(db_path):
+    store = SessionStore(db_path)
+    store.ensure_session("a")
+    for _ in range(2):
+        store.append_iteration("a", iteration(system_prompt="prompt"), b"image", "image/png")
+
+    assert store.load_image(sha256_hex(b"image")) == (b"image", "image/png")
+    assert store._conn.execute("SELECT COUNT(*) FROM images").fetchone()[0] == 1
+    assert store._conn.execute("SELECT COUNT(*) FROM prompts").fetchone()[0] == 1
+    assert store.load_iteration_details("a", 2)["system_prompt"] == "prompt"
+
+
+def test_translations_and_language_round_trip(db_path):
+    store = SessionStore(db_path)
+    store.ensure_session("a")
+    number = store.append_iteration("a", iteration(output_language="German"))
+    store.save_translations("a", number, {"English": {"evaluation": {}}})
+
+    assert store.list_iterations("a")[0]["output_language"] == "German"
+    assert store.load_iteration_details("a", number)["translations"] == {"English": {"evaluation": {}}}